@@ -0,0 +1,140 @@
+"""
+CPU time + peak traced memory of month-over-month comparison at N segments per month:
+  legacy  - tuple-keyed dicts + sorted key union + per-row pct loop (previous compare_two_months)
+  encoded - interned codes + packed-key join from JSON rows (SegmentColumns.from_rows)
+  store   - same join over memory-mapped segment-store tables (SegmentColumns.from_table)
+Each variant also materializes the output rows, like compare_two_months does.
+
+Run from the project root:
+  python -m benchmarks.bench_compare_join --segments 200000
+"""
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from src.ga_ad_agent.segment_join import SegmentColumns, compare_segments
+from src.ga_ad_agent.segment_store import SegmentStore
+
+DIMENSIONS = ["traffic_source", "medium", "device_type", "page_title"]
+KPIS = ["total_visitors", "total_pageviews", "avg_time_on_site_seconds", "total_conversions"]
+
+
+def _month(segments: int, seed: int, overlap_pool: List[Tuple[str, ...]]) -> List[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    keys = rnd.sample(overlap_pool, segments)
+    return [
+        {
+            **dict(zip(DIMENSIONS, k)),
+            "total_visitors": rnd.randint(0, 500),
+            "total_pageviews": rnd.randint(20, 5000),
+            "avg_time_on_site_seconds": None if rnd.random() < 0.05 else rnd.random() * 900,
+            "total_conversions": rnd.choice([0, 0, 0, 1, 2]),
+        }
+        for k in keys
+    ]
+
+
+def _key_pool(size: int, seed: int = 11) -> List[Tuple[str, ...]]:
+    rnd = random.Random(seed)
+    sources = [f"source-{i}.example.com" for i in range(300)]
+    mediums = ["organic", "referral", "cpc", "affiliate", "cpm", "email", "social"]
+    devices = ["desktop", "mobile", "tablet"]
+    pool = set()
+    while len(pool) < size:
+        title = f"Google Merchandise Store | Product page number {rnd.randint(0, size // 4)} - Apparel"
+        pool.add((rnd.choice(sources), rnd.choice(mediums), rnd.choice(devices), title))
+    return list(pool)
+
+
+def legacy_compare(a_rows, b_rows, dimensions) -> List[Dict[str, Any]]:
+    def key(row):
+        return tuple(row.get(d) for d in dimensions)
+
+    a_map = {key(r): r for r in a_rows}
+    b_map = {key(r): r for r in b_rows}
+    out_rows = []
+    for k in sorted(set(a_map.keys()) | set(b_map.keys())):
+        ra = a_map.get(k, {})
+        rb = b_map.get(k, {})
+        changes = {}
+        for metric in KPIS:
+            av = ra.get(metric, 0) if ra else 0
+            bv = rb.get(metric, 0) if rb else 0
+            if av is None or bv is None or av == 0:
+                changes[f"{metric}_pct_change"] = None
+            else:
+                changes[f"{metric}_pct_change"] = ((bv - av) / av) * 100.0
+        out_rows.append(
+            {
+                **{d: k[i] for i, d in enumerate(dimensions)},
+                "month_a": "A",
+                "month_b": "B",
+                "a": {m: ra.get(m) for m in KPIS},
+                "b": {m: rb.get(m) for m in KPIS},
+                "pct_change": changes,
+            }
+        )
+    return out_rows
+
+
+def _measure(fn: Callable[[], List[Dict[str, Any]]]) -> Dict[str, float]:
+    """Timed run first (tracemalloc distorts CPU time), then a traced run for peak memory."""
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    rows = fn()
+    out = {"cpu_s": time.process_time() - cpu, "wall_s": time.perf_counter() - wall, "rows": len(rows)}
+    del rows
+
+    tracemalloc.start()
+    fn()
+    out["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=200_000, help="segments per month")
+    args = parser.parse_args()
+
+    pool = _key_pool(int(args.segments * 1.3))
+    a_rows = _month(args.segments, 1, pool)
+    b_rows = _month(args.segments, 2, pool)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SegmentStore(tmp)
+        store.write("a", {"dimensions": DIMENSIONS, "kpis": KPIS, "rows": a_rows})
+        store.write("b", {"dimensions": DIMENSIONS, "kpis": KPIS, "rows": b_rows})
+
+        def encoded():
+            side_a = SegmentColumns.from_rows(a_rows, DIMENSIONS, KPIS)
+            side_b = SegmentColumns.from_rows(b_rows, DIMENSIONS, KPIS)
+            return compare_segments(side_a, side_b, DIMENSIONS, KPIS).to_rows("A", "B")
+
+        def from_store():
+            side_a = SegmentColumns.from_table(store.open("a"), DIMENSIONS, KPIS)
+            side_b = SegmentColumns.from_table(store.open("b"), DIMENSIONS, KPIS)
+            return compare_segments(side_a, side_b, DIMENSIONS, KPIS).to_rows("A", "B")
+
+        def join_only():
+            side_a = SegmentColumns.from_table(store.open("a"), DIMENSIONS, KPIS)
+            side_b = SegmentColumns.from_table(store.open("b"), DIMENSIONS, KPIS)
+            return [None] * len(compare_segments(side_a, side_b, DIMENSIONS, KPIS))
+
+        print(f"segments/month={args.segments}")
+        print(f"{'variant':<18} {'cpu_s':>8} {'wall_s':>8} {'peak_mb':>9} {'rows':>9}")
+        for name, fn in (
+                ("legacy", lambda: legacy_compare(a_rows, b_rows, DIMENSIONS)),
+                ("encoded", encoded),
+                ("store", from_store),
+                ("store (no rows)", join_only),
+        ):
+            r = _measure(fn)
+            print(f"{name:<18} {r['cpu_s']:>8.3f} {r['wall_s']:>8.3f} {r['peak_mb']:>9.1f} {r['rows']:>9}")
+
+
+if __name__ == "__main__":
+    main()
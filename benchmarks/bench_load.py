@@ -0,0 +1,280 @@
+"""
+Concurrent-user load test of the agent stack with a fake LLM and a fake BigQuery (no Gemini / GCP needed).
+
+Every simulated user (one thread, like a Streamlit session) loops over the recorded scenarios
+(--scenarios: prompt -> {action, arguments}):
+  plan    - `run_adk_agent(prompt)` through the real ADK runner; the model is a ReplayLlm that answers
+            with the recorded JSON after --llm-latency-ms
+  execute - the planned action through the agent functions, as the UI's background worker runs it;
+            tool calls reach benchmarks/fake_bq_server.py (each query takes --bq-latency-ms and
+            returns --bq-rows segments)
+Reported per transport (stdio = one server spawned per tool call, http = shared server with --workers
+processes) and user count: sessions/s, p50/p95/p99 of plan / execute / total, errors, peak and total
+child processes and peak RSS of this process + its children (sampled from /proc, Linux only).
+
+Run from the project root (spawned stdio servers log to stderr, the report goes to stdout):
+  python -m benchmarks.bench_load --users 1,10,50 --sessions 2 --transports stdio,http --workers 4 2>/dev/null
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncGenerator, Callable, ClassVar, Dict, List, Set, Tuple
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.models.registry import LLMRegistry
+from google.genai import types
+
+from benchmarks.bench_transport import _wait_until_ready
+from src import config as cfg
+from src.ga_ad_agent import agent, tracing
+
+BENCH_DIR = Path(__file__).resolve().parent
+FAKE_SERVER_PATH = BENCH_DIR / "fake_bq_server.py"
+DEFAULT_SCENARIOS = BENCH_DIR / "load_scenarios.json"
+
+# UI action name -> agent function taking the recorded arguments as keywords
+ACTIONS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "compare_two_months": agent.compare_two_months,
+    "identify_flagged_segments": agent.flagged_segments,
+    "conversion_rate_by_country_and_device": agent.conversion_rate_by_country_device,
+    "trend_analysis": agent.trend_analysis,
+    "detect_anomalies": agent.detect_anomalies,
+    "get_monthly_data": agent.get_month,
+    "get_all_data": agent.get_all,
+}
+STAGES = ("plan", "execute", "total")
+
+
+class ReplayLlm(BaseLlm):
+    """
+    Deterministic model: answers a prompt with its recorded {action, arguments} JSON after `latency_s`.
+    Registered with ADK's model registry, so the agent selects it by name (GEMINI_MODEL=replay-llm).
+    """
+
+    recordings: ClassVar[Dict[str, Dict[str, Any]]] = {}
+    latency_s: ClassVar[float] = 0.0
+
+    @classmethod
+    def supported_models(cls) -> List[str]:
+        return [r"replay-.*"]
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        prompt = ""
+        for content in llm_request.contents:
+            if content.role == "user":
+                prompt = "".join(p.text or "" for p in content.parts or []) or prompt
+        await asyncio.sleep(self.latency_s)
+        plan = self.recordings.get(prompt.strip())
+        text = json.dumps(plan) if plan is not None else f"no recording for prompt {prompt!r}"
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+class ProcessSampler(threading.Thread):
+    """Polls /proc for this process's descendants: peak count, distinct processes seen, peak total RSS."""
+
+    def __init__(self, interval: float = 0.1):
+        super().__init__(name="process-sampler", daemon=True)
+        self.interval = interval
+        self.peak_children = 0
+        self.peak_rss_bytes = 0
+        self.seen: Set[Tuple[int, str]] = set()  # (pid, start time): pids get reused
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(self.interval):
+            self.sample()
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+        self.sample()
+
+    def sample(self) -> None:
+        children = _descendants(os.getpid())
+        self.seen.update(children)
+        rss = sum(_rss_bytes(pid) for pid in [os.getpid(), *(pid for pid, _ in children)])
+        self.peak_children = max(self.peak_children, len(children))
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+
+
+def _descendants(root: int) -> List[Tuple[int, str]]:
+    kids: Dict[int, List[Tuple[int, str]]] = {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat") as fh:
+                fields = fh.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue  # exited meanwhile
+        kids.setdefault(int(fields[1]), []).append((int(entry.name), fields[19]))  # ppid, starttime
+
+    out, todo = [], [root]
+    while todo:
+        for child in kids.get(todo.pop(), []):
+            out.append(child)
+            todo.append(child[0])
+    return out
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _user(
+        user: int,
+        sessions: int,
+        scenarios: List[Dict[str, Any]],
+        samples: List[Dict[str, float]],
+        errors: List[str],
+) -> None:
+    for k in range(sessions):
+        scenario = scenarios[(user + k) % len(scenarios)]
+        start = time.perf_counter()
+        try:
+            plan = agent.run_adk_agent(scenario["prompt"], user_id=f"load-user-{user}")
+            if plan.get("error"):
+                raise RuntimeError(plan["error"])
+            planned = time.perf_counter()
+            ACTIONS[plan["action"]](**plan["arguments"])
+        except Exception as exc:  # noqa: BLE001
+            errors.append(f"{scenario['action']}: {type(exc).__name__}: {exc}")
+            continue
+        done = time.perf_counter()
+        samples.append({"plan": planned - start, "execute": done - planned, "total": done - start})
+
+
+def _run(users: int, sessions: int, scenarios: List[Dict[str, Any]]):
+    samples: List[Dict[str, float]] = []
+    errors: List[str] = []
+    threads = [
+        threading.Thread(target=_user, args=(u, sessions, scenarios, samples, errors), name=f"user-{u}")
+        for u in range(users)
+    ]
+    sampler = ProcessSampler()
+    sampler.start()
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+    return samples, errors, elapsed, sampler
+
+
+def _pct(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else float("nan")
+
+
+def _report(transport: str, users: int, samples, errors, elapsed: float, sampler: ProcessSampler) -> None:
+    cols = []
+    for stage in STAGES:
+        ordered = sorted(s[stage] for s in samples)
+        cols += [_pct(ordered, 0.50), _pct(ordered, 0.95), _pct(ordered, 0.99)]
+    print(
+        f"{transport:<6} {users:>6} {len(samples):>5} {len(errors):>4} {len(samples) / elapsed:>7.2f} "
+        + " ".join(f"{v:>7.2f}" for v in cols)
+        + f" {sampler.peak_children:>6} {len(sampler.seen):>6} {sampler.peak_rss_bytes / 2 ** 20:>8.0f}"
+    )
+    for err in sorted(set(errors))[:5]:
+        print(f"       error: {err}")
+
+
+def _start_http_server(port: int, workers: int, fake_env: Dict[str, str]) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        **fake_env,
+        "MCP_TRANSPORT": "http",
+        "MCP_HTTP_PORT": str(port),
+        "MCP_HTTP_WORKERS": str(workers),
+    }
+    server = subprocess.Popen(
+        [sys.executable, str(FAKE_SERVER_PATH)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        _wait_until_ready(server, port, "get_server_stats")
+    except Exception:
+        server.terminate()
+        raise
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", default="1,10,50", help="comma separated concurrent user counts")
+    parser.add_argument("--sessions", type=int, default=2, help="prompts per user (plan + execute)")
+    parser.add_argument("--scenarios", type=Path, default=DEFAULT_SCENARIOS)
+    parser.add_argument("--transports", default="stdio,http", help="comma separated: stdio, http")
+    parser.add_argument("--workers", type=int, default=4, help="HTTP server worker processes")
+    parser.add_argument("--port", type=int, default=8798)
+    parser.add_argument("--llm-latency-ms", type=int, default=800)
+    parser.add_argument("--bq-latency-ms", type=int, default=1500)
+    parser.add_argument("--bq-rows", type=int, default=200)
+    args = parser.parse_args()
+    user_counts = [int(x) for x in args.users.split(",")]
+
+    scenarios = json.loads(args.scenarios.read_text())
+    ReplayLlm.recordings = {s["prompt"]: {"action": s["action"], "arguments": s["arguments"]} for s in scenarios}
+    ReplayLlm.latency_s = args.llm_latency_ms / 1000
+    LLMRegistry.register(ReplayLlm)
+    cfg.GEMINI_MODEL = "replay-llm"
+    fake_env = {
+        "FAKE_BQ_LATENCY_MS": str(args.bq_latency_ms),
+        "FAKE_BQ_ROWS": str(args.bq_rows),
+        "LOG_LEVEL": "WARNING",
+        "PYTHONWARNINGS": "ignore",
+    }
+    for name in ("ga-kpi-client", "google_adk"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    # Spawned stdio servers (tool calls and the ADK toolset) run the fake server with the fake settings.
+    # Same base as the http server: the mcp client's default environment drops the required config variables.
+    agent.SERVER_SCRIPT_PATH = FAKE_SERVER_PATH
+    child_env = tracing.child_env
+    tracing.child_env = lambda base=None: child_env({**os.environ, **fake_env, **(base or {})})
+
+    print(
+        f"scenarios={len(scenarios)} sessions/user={args.sessions} llm={args.llm_latency_ms}ms "
+        f"bq={args.bq_latency_ms}ms x {args.bq_rows} rows http_workers={args.workers}"
+    )
+    print(
+        f"{'mode':<6} {'users':>6} {'ok':>5} {'err':>4} {'sess/s':>7} "
+        + " ".join(f"{s[:4] + '_' + q:>7}" for s in STAGES for q in ("p50", "p95", "p99"))
+        + f" {'procs':>6} {'spawns':>6} {'rss_mb':>8}"
+    )
+    for transport in args.transports.split(","):
+        # The HTTP server only runs for its own rows, so stdio process counts / RSS don't include it
+        server = _start_http_server(args.port, args.workers, fake_env) if transport == "http" else None
+        try:
+            # Read per tool call and when a user thread builds its agent (ADK toolset transport)
+            cfg.MCP_SERVER_URL = f"http://127.0.0.1:{args.port}/mcp" if server is not None else ""
+            _run(1, 1, scenarios)  # warm-up: ADK / mcp client imports, first request per worker
+            for users in user_counts:
+                _report(transport, users, *_run(users, args.sessions, scenarios))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
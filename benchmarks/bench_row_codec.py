@@ -0,0 +1,129 @@
+"""
+Fetch + encode + decode time and response size of a KPI result in the server's response path: the old
+path (a dict per BigQuery Row, json.dumps / json.loads) vs row_codec's column-major ResultRows in both row
+formats (objects / columns), each with the stdlib json and with orjson (when installed). No GCP needed.
+
+--rows synthetic segments with the KPI schema (two STRING dimensions, INT64 / FLOAT64 KPIs, a few NaN
+averages) are built once as BigQuery Rows and as the job's Arrow table. --typed adds a DATE and a NUMERIC
+column, which the old path can't encode at all (it is timed with default=str).
+Measured per mode:
+  fetch     Rows -> dicts (old) / Arrow table -> normalized ResultRows
+  encode    server: response dict -> JSON text (_encode_response)
+  decode    client: JSON text -> response with row dicts (_tool_result_to_json)
+Every mode's decoded rows are checked against the stdlib "objects" mode.
+
+Run from the project root:
+  python -m benchmarks.bench_row_codec --rows 100000
+"""
+import argparse
+import datetime
+import decimal
+import json
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pyarrow as pa
+from google.cloud.bigquery.table import Row
+
+from src.ga_ad_agent import row_codec
+from src.ga_ad_agent.row_codec import ResultRows, decode_response, encode_response
+
+
+def _table(args: argparse.Namespace) -> pa.Table:
+    rng = np.random.default_rng(args.seed)
+    n = args.rows
+    pageviews = rng.integers(20, 50_000, n)
+    avg_time = rng.uniform(5.0, 600.0, n)
+    avg_time[rng.random(n) < 0.01] = np.nan  # AVG over sessions without timeOnSite
+    columns: Dict[str, Any] = {
+        "traffic_source": pa.array([f"source-{i % 997}.example.com" for i in range(n)]),
+        "device_type": pa.array([("desktop", "mobile", "tablet")[i % 3] for i in range(n)]),
+        "total_visitors": pa.array(pageviews // 4),
+        "total_pageviews": pa.array(pageviews),
+        "avg_time_on_site_seconds": pa.array(avg_time),
+        "total_conversions": pa.array(rng.integers(0, 200, n)),
+    }
+    if args.typed:
+        first = datetime.date(2016, 8, 1)
+        columns["period"] = pa.array([first + datetime.timedelta(days=int(d)) for d in rng.integers(0, 396, n)])
+        revenue = [decimal.Decimal(int(c)).scaleb(-2) for c in rng.integers(0, 10 ** 8, n)]
+        columns["revenue"] = pa.array(revenue, pa.decimal128(38, 9))
+    return pa.table(columns)
+
+
+def _bq_rows(table: pa.Table) -> List[Row]:
+    """The table as the REST path's RowIterator yields it (NaN stays a float, like BigQuery's)."""
+    field_to_index = {name: i for i, name in enumerate(table.column_names)}
+    values = [table.column(i).to_pylist() for i in range(table.num_columns)]
+    return [Row(v, field_to_index) for v in zip(*values)]
+
+
+def _response(rows: Any) -> Dict[str, Any]:
+    return {"scope": "all", "row_count": len(rows), "rows": rows, "notes": {"source": "bench"}}
+
+
+def _timed(fn: Callable[[], Any], repeat: int) -> Tuple[Any, float]:
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def _old_path(rows: List[Row], typed: bool, repeat: int) -> Tuple[List[Dict[str, Any]], List[float], int]:
+    data, t_fetch = _timed(lambda: [dict(r) for r in rows], repeat)
+    text, t_encode = _timed(lambda: json.dumps(_response(data), default=str if typed else None), repeat)
+    out, t_decode = _timed(lambda: json.loads(text), repeat)
+    return out["rows"], [t_fetch, t_encode, t_decode], len(text.encode("utf-8"))
+
+
+def _codec_path(table: pa.Table, row_format: str, repeat: int) -> Tuple[List[Dict[str, Any]], List[float], int]:
+    data, t_fetch = _timed(lambda: ResultRows.from_arrow(table), repeat)
+    text, t_encode = _timed(lambda: encode_response(_response(data), row_format), repeat)
+    out, t_decode = _timed(lambda: decode_response(text), repeat)
+    return out["rows"], [t_fetch, t_encode, t_decode], len(text.encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--typed", action="store_true", help="add DATE and NUMERIC columns")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per measurement (best is reported)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    table = _table(args)
+    rows = _bq_rows(table)
+    orjson = row_codec.orjson
+    print(f"rows={args.rows} columns={table.num_columns} typed={args.typed} orjson={'yes' if orjson else 'no'}")
+    print(f"{'mode':<26} {'fetch_s':>8} {'encode_s':>9} {'decode_s':>9} {'total_s':>8} {'MB':>7} {'same':>5}")
+
+    results: List[Tuple[str, List[Dict[str, Any]], List[float], int]] = [
+        ("dict rows + json (old)", *_old_path(rows, args.typed, args.repeat))
+    ]
+    encoders = [("json", None)] + ([("orjson", orjson)] if orjson else [])
+    try:
+        for row_format in ("objects", "columns"):
+            for encoder, module in encoders:
+                row_codec.orjson = module
+                results.append((f"{row_format} + {encoder}", *_codec_path(table, row_format, args.repeat)))
+    finally:
+        row_codec.orjson = orjson
+
+    expected = results[1][1]
+    for label, decoded, times, size in results:
+        # the old path keeps NaN (invalid JSON) and, with --typed, stringifies DATE / NUMERIC
+        same = "-" if label.endswith("(old)") else str(decoded == expected)
+        print(
+            f"{label:<26} {times[0]:>8.3f} {times[1]:>9.3f} {times[2]:>9.3f} {sum(times):>8.3f} "
+            f"{size / 2 ** 20:>7.1f} {same:>5}"
+        )
+        if same == "False":
+            raise SystemExit(f"{label}: decoded rows differ from objects + json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Burst of tool calls against BigQuery concurrency limits: unscheduled (submit immediately, like before the job
+scheduler), the scheduler with a limit above the real one (rate-limit retries), and the scheduler on one and on
+several billing projects. No GCP needed.
+
+The tools run in-process against benchmarks/fake_bq_server.py's client, where every project accepts at most
+--project-limit concurrent jobs and rejects more with HTTP 429 jobRateLimitExceeded. A batch burst
+(--batch calls, e.g. a report) starts first; --interactive calls (users) arrive --interactive-delay-ms later.
+Reported per mode: ok / failed calls, rate-limit rejections, makespan, p50/p95 queue wait and latency
+per priority, and jobs per billing project.
+
+Run from the project root:
+  python -m benchmarks.bench_scheduler --batch 40 --interactive 10 --projects 3 --project-limit 4
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List
+
+from benchmarks import fake_bq_server as fake
+from src.ga_ad_agent import ga_mcp_server as server
+from src.ga_ad_agent.job_scheduler import JobScheduler
+
+DIMENSIONS = ["traffic_source", "device_type"]
+MONTHS = ["2016-08", "2016-09", "2016-10", "2016-11", "2016-12", "2017-01", "2017-02", "2017-03"]
+
+
+def _call(i: int, priority: str, project: str, results: List[Dict[str, Any]]) -> None:
+    start = time.perf_counter()
+    try:
+        resp = json.loads(
+            server.get_monthly_data(MONTHS[i % len(MONTHS)], DIMENSIONS, project_id=project, priority=priority)
+        )
+        job = resp["notes"]["jobs"][-1]
+        results.append(
+            {"priority": priority, "ok": True, "latency": time.perf_counter() - start, "wait": job["queue_wait_s"]}
+        )
+    except Exception:  # noqa: BLE001
+        results.append({"priority": priority, "ok": False, "latency": time.perf_counter() - start, "wait": 0.0})
+
+
+def _run(args: argparse.Namespace, label: str, scheduler: JobScheduler) -> None:
+    fake._CLIENTS.clear()
+    server._job_scheduler = lambda: scheduler
+    results: List[Dict[str, Any]] = []
+    project = "bench-project-0"
+    threads = [threading.Thread(target=_call, args=(i, "batch", project, results)) for i in range(args.batch)]
+    late = [
+        threading.Thread(target=_call, args=(i, "interactive", project, results)) for i in range(args.interactive)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.interactive_delay_ms / 1000)
+    for t in late:
+        t.start()
+    for t in threads + late:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    cols = []
+    for priority in ("interactive", "batch"):
+        ok = [r for r in results if r["priority"] == priority and r["ok"]]
+        for key in ("wait", "latency"):
+            ordered = sorted(r[key] for r in ok)
+            cols += [_pct(ordered, 0.5), _pct(ordered, 0.95)]
+    clients = dict(sorted(fake._CLIENTS.items()))
+    failed = sum(not r["ok"] for r in results)
+    print(
+        f"{label:<22} {len(results) - failed:>4} {failed:>6} "
+        f"{sum(c.rejected for c in clients.values()):>5} {elapsed:>7.2f} "
+        + " ".join(f"{v:>9.2f}" for v in cols)
+        + "  "
+        + " ".join(f"{p.rsplit('-', 1)[-1]}:{c.jobs}" for p, c in clients.items())
+    )
+
+
+def _pct(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=40, help="batch calls in the burst")
+    parser.add_argument("--interactive", type=int, default=10, help="interactive calls arriving during the burst")
+    parser.add_argument("--interactive-delay-ms", type=int, default=200)
+    parser.add_argument("--projects", type=int, default=3, help="billing projects of the spread-out run")
+    parser.add_argument("--project-limit", type=int, default=4, help="fake concurrent-job limit per project")
+    parser.add_argument("--bq-latency-ms", type=int, default=500)
+    parser.add_argument("--backoff-s", type=float, default=0.25, help="scheduler rate-limit backoff base")
+    args = parser.parse_args()
+
+    os.environ[fake.LATENCY_ENV] = str(args.bq_latency_ms)
+    os.environ[fake.ROWS_ENV] = "50"
+    os.environ[fake.MAX_CONCURRENT_ENV] = str(args.project_limit)
+    logging.getLogger("ga-kpi-server").setLevel(logging.CRITICAL)  # expected rate-limit errors
+
+    projects = [f"bench-project-{i}" for i in range(args.projects)]
+    modes = [
+        ("unscheduled", JobScheduler(max_concurrent=10 ** 6, retries=0)),
+        # scheduler limit above the real one: admitted jobs hit 429s and are retried with backoff
+        ("retries (limit x2)", JobScheduler(max_concurrent=2 * args.project_limit, backoff_s=args.backoff_s)),
+        ("scheduled x1 project", JobScheduler(max_concurrent=args.project_limit, backoff_s=args.backoff_s)),
+        (
+            f"scheduled x{args.projects} projects",
+            JobScheduler(projects=projects, max_concurrent=args.project_limit, backoff_s=args.backoff_s),
+        ),
+    ]
+    print(
+        f"batch={args.batch} interactive={args.interactive} (+{args.interactive_delay_ms}ms) "
+        f"limit/project={args.project_limit} bq={args.bq_latency_ms}ms"
+    )
+    print(
+        f"{'mode':<22} {'ok':>4} {'failed':>6} {'429s':>5} {'total_s':>7} "
+        + " ".join(f"{p[:5] + '_' + k + q:>9}" for p in ("inter", "batch") for k in ("w", "l") for q in ("50", "95"))
+        + "  jobs/project"
+    )
+    for label, scheduler in modes:
+        _run(args, label, scheduler)
+
+
+if __name__ == "__main__":
+    main()
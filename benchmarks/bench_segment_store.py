@@ -0,0 +1,134 @@
+"""
+Load time + peak RSS: JSON response path vs memory-mapped segment store, on a synthetic
+`page_title`-level all-data result (traffic_source, medium, device_type, page_title).
+
+Run from the project root:
+  python -m benchmarks.bench_segment_store --rows 200000
+
+Each measurement runs in a fresh subprocess so peak RSS (VmHWM) reflects only that path.
+"""
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.ga_ad_agent.segment_store import SegmentStore
+
+TABLE_NAME = "all__all__device_type+medium+page_title+traffic_source"
+DIMENSIONS = ["traffic_source", "medium", "device_type", "page_title"]
+KPIS = ["total_visitors", "total_pageviews", "avg_time_on_site_seconds", "total_conversions"]
+
+
+def _synthetic_response(rows: int, seed: int = 7) -> dict:
+    rnd = random.Random(seed)
+    sources = [f"source-{i}.example.com" for i in range(300)]
+    mediums = ["organic", "referral", "cpc", "affiliate", "cpm", "email", "social"]
+    devices = ["desktop", "mobile", "tablet"]
+    titles = [f"Google Merchandise Store | Product page number {i} - Apparel & Accessories" for i in range(rows // 8)]
+    data = []
+    for _ in range(rows):
+        data.append(
+            {
+                "traffic_source": rnd.choice(sources),
+                "medium": rnd.choice(mediums),
+                "device_type": rnd.choice(devices),
+                "page_title": rnd.choice(titles),
+                "total_visitors": rnd.randint(1, 500),
+                "total_pageviews": rnd.randint(20, 5000),
+                "avg_time_on_site_seconds": None if rnd.random() < 0.05 else rnd.random() * 900,
+                "total_conversions": rnd.choice([0, 0, 0, 1, 2]),
+            }
+        )
+    return {"scope": "all", "dimensions": DIMENSIONS, "kpis": KPIS, "row_count": rows, "rows": data}
+
+
+def _rss_mb(field: str) -> float:
+    """VmRSS/VmHWM from /proc (per address space, unlike ru_maxrss which survives exec on Linux)."""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as fh:
+            for line in fh:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def _child(mode: str, path: str) -> dict:
+    """Load + run the traffic rule scan; report timings and peak RSS of this process."""
+    baseline_rss = _rss_mb("VmRSS")
+    start = time.perf_counter()
+    if mode == "json":
+        with open(path, encoding="utf-8") as fh:
+            resp = json.load(fh)
+        loaded = time.perf_counter()
+        flagged = 0
+        for r in resp["rows"]:
+            if (r["avg_time_on_site_seconds"] or 0) < 120 and (r["total_pageviews"] or 0) < 30:
+                flagged += 1
+    else:
+        table = SegmentStore(path).open(TABLE_NAME)
+        loaded = time.perf_counter()
+        avg = np.nan_to_num(table.kpi("avg_time_on_site_seconds"), nan=0.0)
+        flagged = int(np.count_nonzero((avg < 120) & (table.kpi("total_pageviews") < 30)))
+    done = time.perf_counter()
+
+    return {
+        "mode": mode,
+        "load_seconds": loaded - start,
+        "scan_seconds": done - loaded,
+        "flagged": flagged,
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": _rss_mb("VmHWM"),
+    }
+
+
+def _run_child(mode: str, path: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_segment_store", "--child", mode, path],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(*args.child)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        resp = _synthetic_response(args.rows)
+        json_path = Path(tmp) / "response.json"
+        json_path.write_text(json.dumps(resp), encoding="utf-8")
+
+        store_root = Path(tmp) / "store"
+        start = time.perf_counter()
+        SegmentStore(store_root).write(TABLE_NAME, resp)
+        write_seconds = time.perf_counter() - start
+        store_bytes = sum(p.stat().st_size for p in (store_root / TABLE_NAME).iterdir())
+
+        print(f"rows={args.rows} json_bytes={json_path.stat().st_size:,} store_bytes={store_bytes:,} "
+              f"store_write={write_seconds:.2f}s")
+        print(f"{'mode':<6} {'load_s':>9} {'scan_s':>9} {'base_rss_mb':>12} {'peak_rss_mb':>12} {'flagged':>8}")
+        for mode, path in (("json", json_path), ("store", store_root)):
+            r = _run_child(mode, str(path))
+            print(f"{mode:<6} {r['load_seconds']:>9.4f} {r['scan_seconds']:>9.4f} {r['baseline_rss_mb']:>12.1f} "
+                  f"{r['peak_rss_mb']:>12.1f} {r['flagged']:>8}")
+
+
+if __name__ == "__main__":
+    main()
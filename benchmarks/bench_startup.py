@@ -0,0 +1,97 @@
+"""
+Cold-start cost of the MCP server and the agent module (the server is spawned once per tool call).
+
+  import  - `import <module>` in a fresh interpreter (median of --runs)
+  ready   - spawn the server over stdio + MCP initialize + list_tools, as the client does per call
+  stats   - ready + one `get_server_stats` call (no BigQuery job)
+With --importtime N the slowest top-level imports (`python -X importtime`, cumulative) are listed per module.
+
+Run from the project root (the usual .env / environment variables must be set):
+  python -m benchmarks.bench_startup --runs 5 --importtime 10
+"""
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, List, Tuple
+
+from src import config as cfg
+
+MODULES = ["src.ga_ad_agent.ga_mcp_server", "src.ga_ad_agent.agent"]
+SERVER_SCRIPT_PATH = cfg.PROJECT_ROOT / "src/ga_ad_agent/ga_mcp_server.py"
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def _import_seconds(module: str) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=cfg.PROJECT_ROOT, capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _top_imports(module: str, top: int) -> List[Tuple[str, float]]:
+    """Top-level (direct) imports of `module`'s import tree by cumulative time, in seconds."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cfg.PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m and len(m.group(3)) <= 3:  # depth 0/1: the module itself and what it imports directly
+            rows.append((m.group(4), int(m.group(2)) / 1e6))
+    return sorted(rows, key=lambda r: -r[1])[:top]
+
+
+async def _server_session(call_stats: bool) -> float:
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+
+    params = StdioServerParameters(command=sys.executable, args=[str(SERVER_SCRIPT_PATH)])
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:  # server logs would drown the table
+        async with stdio_client(params, errlog=devnull) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                await session.list_tools()
+                if call_stats:
+                    await session.call_tool("get_server_stats", {})
+                return time.perf_counter() - start
+
+
+def _median(fn: Callable[[], float], runs: int) -> Tuple[float, float]:
+    samples = [fn() for _ in range(runs)]
+    return statistics.median(samples), min(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", type=int, default=0, help="list the N slowest top-level imports")
+    args = parser.parse_args()
+
+    print(f"runs={args.runs} python={sys.version.split()[0]}")
+    print(f"{'measurement':<42} {'median_s':>9} {'min_s':>7}")
+    for module in MODULES:
+        med, best = _median(lambda: _import_seconds(module), args.runs)
+        print(f"{'import ' + module:<42} {med:>9.3f} {best:>7.3f}")
+    for name, call_stats in (("server ready (spawn+init+list_tools)", False), ("server + get_server_stats", True)):
+        med, best = _median(lambda: asyncio.run(_server_session(call_stats)), args.runs)
+        print(f"{name:<42} {med:>9.3f} {best:>7.3f}")
+
+    for module in MODULES if args.importtime else []:
+        print(f"\nslowest imports under {module} (cumulative):")
+        for name, seconds in _top_imports(module, args.importtime):
+            print(f"  {seconds:>7.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Throughput of MCP tool calls under N concurrent clients: stdio (one server spawned per call, the default)
+vs the shared streamable HTTP server (MCP_TRANSPORT=http) with W worker processes.
+
+Every client issues --calls sequential calls through the agent's `_call_tool`; all clients run concurrently.
+The default tool (`get_server_stats`) needs no BigQuery, so this measures transport + server overhead.
+
+Run from the project root (the usual .env / environment variables must be set):
+  python -m benchmarks.bench_transport --clients 1,4,16 --calls 5 --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+from src import config as cfg
+from src.ga_ad_agent import agent
+
+SERVER_SCRIPT_PATH = cfg.PROJECT_ROOT / "src/ga_ad_agent/ga_mcp_server.py"
+
+
+def _wait_until_ready(server: subprocess.Popen, port: int, tool: str, timeout: float = 60.0) -> None:
+    """Until every worker is up the socket accepts connections that fail, so poll with real calls."""
+    cfg.MCP_SERVER_URL = f"http://127.0.0.1:{port}/mcp"
+    client_logger = logging.getLogger("ga-kpi-client")
+    level = client_logger.level
+    client_logger.setLevel(logging.CRITICAL)  # expected failures while the workers start
+    deadline = time.time() + timeout
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"HTTP server exited with code {server.returncode} (port {port} in use?)")
+            try:
+                asyncio.run(_run(1, 1, tool))
+                return
+            except Exception:  # noqa: BLE001
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.5)
+    finally:
+        client_logger.setLevel(level)
+
+
+async def _client(tool: str, calls: int, latencies: List[float]) -> None:
+    for _ in range(calls):
+        start = time.perf_counter()
+        await agent._call_tool(tool, {})
+        latencies.append(time.perf_counter() - start)
+
+
+async def _run(clients: int, calls: int, tool: str) -> List[float]:
+    latencies: List[float] = []
+    await asyncio.gather(*(_client(tool, calls, latencies) for _ in range(clients)))
+    return latencies
+
+
+def _report(mode: str, clients: int, latencies: List[float], elapsed: float) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{mode:<10} {clients:>8} {len(latencies):>6} {len(latencies) / elapsed:>9.2f} "
+        f"{statistics.median(ordered):>8.3f} {p95:>8.3f} {ordered[-1]:>8.3f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", default="1,4,16", help="comma separated concurrent client counts")
+    parser.add_argument("--calls", type=int, default=5, help="sequential calls per client")
+    parser.add_argument("--workers", type=int, default=4, help="HTTP server worker processes")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--tool", default="get_server_stats")
+    args = parser.parse_args()
+    client_counts = [int(x) for x in args.clients.split(",")]
+
+    env = {
+        **os.environ,
+        "MCP_TRANSPORT": "http",
+        "MCP_HTTP_PORT": str(args.port),
+        "MCP_HTTP_WORKERS": str(args.workers),
+        "LOG_LEVEL": "WARNING",
+    }
+    server = subprocess.Popen(
+        [sys.executable, str(SERVER_SCRIPT_PATH)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        _wait_until_ready(server, args.port, args.tool)
+        print(f"tool={args.tool} calls/client={args.calls} http_workers={args.workers}")
+        print(f"{'mode':<10} {'clients':>8} {'calls':>6} {'calls/s':>9} {'p50_s':>8} {'p95_s':>8} {'max_s':>8}")
+        for mode, url in (("stdio", ""), ("http", f"http://127.0.0.1:{args.port}/mcp")):
+            cfg.MCP_SERVER_URL = url  # read by _call_tool on every call
+            asyncio.run(_run(1, args.workers, args.tool))  # warm-up (client imports, first request per worker)
+            for n in client_counts:
+                start = time.perf_counter()
+                latencies = asyncio.run(_run(n, args.calls, args.tool))
+                _report(mode, n, latencies, time.perf_counter() - start)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
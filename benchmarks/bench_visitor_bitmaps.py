@@ -0,0 +1,129 @@
+"""
+Memory per segment and union speed of the roaring visitor bitmaps (visitor_bitmaps) vs a sorted uint32
+id array and a Python set, on synthetic monthly visitor sets.
+
+Every month, --active visitors out of --visitors are active; each lands in a Zipf-distributed segment
+(--segments per month, a few visitors in two). Measured:
+  memory    bytes per segment (in memory and serialized) and per visitor
+  month     exact visitors per segment over all months: OR of --months sets per segment
+  rollup    exact visitors per coarse segment (segment id mod --coarse) over all months
+  total     distinct visitors of the whole range: OR of every set
+Every result is checked against np.unique over the raw ids.
+
+Run from the project root:
+  python -m benchmarks.bench_visitor_bitmaps --visitors 714000 --months 13 --segments 500
+"""
+import argparse
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from src.ga_ad_agent.visitor_bitmaps import RoaringBitmap
+
+
+def _monthly_sets(args: argparse.Namespace) -> List[Dict[int, np.ndarray]]:
+    """month -> segment -> sorted unique visitor ids."""
+    rng = np.random.default_rng(args.seed)
+    # Returning visitors: activity is skewed towards a core of the id space
+    weights = 1.0 / np.arange(1, args.visitors + 1) ** 0.3
+    weights /= weights.sum()
+    months = []
+    for _ in range(args.months):
+        active = rng.choice(args.visitors, size=args.active, replace=False, p=weights)
+        segment = np.minimum(rng.zipf(1.3, size=active.size), args.segments) - 1
+        repeat = rng.random(active.size) < 0.05  # a few visitors show up in a second segment
+        ids = np.concatenate([active, active[repeat]])
+        seg = np.concatenate([segment, rng.integers(0, args.segments, int(repeat.sum()))])
+        order = np.lexsort((ids, seg))
+        ids, seg = ids[order], seg[order]
+        bounds = np.flatnonzero(np.diff(seg)) + 1
+        months.append({int(s[0]): np.unique(i) for s, i in zip(np.split(seg, bounds), np.split(ids, bounds))})
+    return months
+
+
+def _timed(fn: Callable[[], object], repeat: int) -> Tuple[object, float]:
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def _set_bytes(s: set) -> int:
+    # the set's table + one int object per id (ids > 256 are never cached)
+    return sys.getsizeof(s) + sum(sys.getsizeof(v) for v in s)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--visitors", type=int, default=714_000, help="dense visitor id space")
+    parser.add_argument("--active", type=int, default=60_000, help="active visitors per month")
+    parser.add_argument("--months", type=int, default=13)
+    parser.add_argument("--segments", type=int, default=500, help="segments per month")
+    parser.add_argument("--coarse", type=int, default=10, help="coarse segments of the rollup")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per measurement (best is reported)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    months = _monthly_sets(args)
+    flat = [(m, s, ids) for m, sets in enumerate(months) for s, ids in sets.items()]
+    print(
+        f"visitors={args.visitors} active/month={args.active} months={args.months} "
+        f"segment_sets={len(flat)} ids={sum(ids.size for _, _, ids in flat)}"
+    )
+
+    bitmaps, t_build = _timed(lambda: {(m, s): RoaringBitmap.from_ids(ids) for m, s, ids in flat}, 1)
+    sets, t_set_build = _timed(lambda: {(m, s): set(ids.tolist()) for m, s, ids in flat}, 1)
+    arrays = {(m, s): ids.astype(np.uint32) for m, s, ids in flat}
+    encoded, t_encode = _timed(lambda: {k: b.to_bytes() for k, b in bitmaps.items()}, args.repeat)
+    _, t_decode = _timed(lambda: [RoaringBitmap.from_bytes(e) for e in encoded.values()], args.repeat)
+
+    n_ids = sum(a.size for a in arrays.values())
+    memory = {
+        "roaring": sum(b.nbytes for b in bitmaps.values()),
+        "roaring_serialized": sum(len(e) for e in encoded.values()),
+        "uint32_array": sum(a.nbytes for a in arrays.values()),
+        "python_set": sum(_set_bytes(s) for s in sets.values()),
+    }
+    sizes = np.array([len(encoded[k]) for k in sorted(encoded)])
+    print(f"\n{'memory':<20} {'total_mb':>10} {'B/segment':>10} {'B/visitor':>10}")
+    for name, total in memory.items():
+        print(f"{name:<20} {total / 2 ** 20:>10.2f} {total / len(flat):>10.0f} {total / n_ids:>10.2f}")
+    print(
+        f"serialized B/segment p50={np.median(sizes):.0f} p99={np.percentile(sizes, 99):.0f} max={sizes.max()}; "
+        f"build {t_build:.3f}s (set {t_set_build:.3f}s), encode {t_encode:.3f}s, decode {t_decode:.3f}s"
+    )
+
+    groups: Dict[str, Dict[int, List[Tuple[int, int]]]] = {"month": {}, "rollup": {}, "total": {}}
+    for m, s, _ in flat:
+        groups["month"].setdefault(s, []).append((m, s))
+        groups["rollup"].setdefault(s % args.coarse, []).append((m, s))
+        groups["total"].setdefault(0, []).append((m, s))
+
+    print(f"\n{'union':<8} {'groups':>7} {'sets':>6} {'roaring_s':>10} {'array_s':>10} {'set_s':>10} {'exact':>6}")
+    for name, members in groups.items():
+        expected, t_array = _timed(
+            lambda: {g: np.unique(np.concatenate([arrays[k] for k in keys])).size for g, keys in members.items()},
+            args.repeat,
+        )
+        got, t_roaring = _timed(
+            lambda: {g: len(RoaringBitmap.union_all([bitmaps[k] for k in keys])) for g, keys in members.items()},
+            args.repeat,
+        )
+        _, t_set = _timed(
+            lambda: {g: len(set().union(*(sets[k] for k in keys))) for g, keys in members.items()}, args.repeat
+        )
+        print(
+            f"{name:<8} {len(members):>7} {len(flat):>6} {t_roaring:>10.4f} {t_array:>10.4f} {t_set:>10.4f} "
+            f"{str(got == expected):>6}"
+        )
+        if got != expected:
+            raise SystemExit(f"{name}: roaring counts differ from np.unique")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+The MCP server with an in-process fake BigQuery client, for load tests without GCP.
+
+Every query "runs" for FAKE_BQ_LATENCY_MS and returns FAKE_BQ_ROWS synthetic segments (x periods for
+trend queries), shaped after the query: the grouping columns of its last GROUP BY plus the KPI columns
+(or sorted dense `visitor_ids` arrays for visitor-set queries).
+With FAKE_BQ_MAX_CONCURRENT set, a project running that many jobs rejects new ones like BigQuery's
+concurrent-query limit (HTTP 429 jobRateLimitExceeded), which exercises the server's job scheduler.
+Values are deterministic per (query, params). Everything else - SQL building, the size guard, the
+sharded path, row fetching / serialization, transports (MCP_TRANSPORT / MCP_HTTP_WORKERS) - is the real server.
+
+  FAKE_BQ_LATENCY_MS=300 FAKE_BQ_ROWS=500 python benchmarks/fake_bq_server.py
+"""
+import datetime
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from src.ga_ad_agent import ga_mcp_server as server
+from src.ga_ad_agent.catalog import months_between
+
+LATENCY_ENV = "FAKE_BQ_LATENCY_MS"
+ROWS_ENV = "FAKE_BQ_ROWS"
+MAX_CONCURRENT_ENV = "FAKE_BQ_MAX_CONCURRENT"
+DEFAULT_LATENCY_MS = 500
+DEFAULT_ROWS = 200
+# Dense visitor id space of the export (~ distinct fullVisitorIds of the sample dataset)
+FAKE_VISITORS = 714_167
+
+_GROUP_BY_RE = re.compile(r"GROUP BY ([^\n]+)")
+
+
+class FakeRows(list):
+    """Stands in for the RowIterator: iterable rows + total_rows + to_arrow."""
+
+    @property
+    def total_rows(self) -> int:
+        return len(self)
+
+    def to_arrow(self, create_bqstorage_client: bool = True) -> Any:
+        import pyarrow as pa
+
+        return pa.Table.from_pylist(list(self))
+
+
+class FakeRateLimitError(Exception):
+    """Shaped like google.api_core's TooManyRequests: HTTP code + BigQuery error reasons."""
+
+    code = 429
+
+    def __init__(self, project: str):
+        super().__init__(f"Exceeded rate limits: too many concurrent queries for project {project}")
+        self.errors = [{"reason": "jobRateLimitExceeded", "message": str(self)}]
+
+
+class FakeQueryJob:
+    def __init__(
+            self,
+            query: str,
+            params: List[Any],
+            project: str,
+            latency: float,
+            rows: int,
+            on_done: Callable[[], None],
+    ):
+        self.job_id = f"fake_{hashlib.sha1(os.urandom(8)).hexdigest()[:12]}"
+        self.location = "US"
+        self.cache_hit = False
+        self.destination = SimpleNamespace(project=project, dataset_id="_fake", table_id=f"anon{self.job_id}")
+        self._query = query
+        self._params = {p.name: p.value for p in params}
+        self._latency = latency
+        self._rows = rows
+        self._on_done = on_done
+        self.total_bytes_processed = 0
+
+    def result(self) -> FakeRows:
+        try:
+            time.sleep(self._latency)
+            data = _synthetic_rows(self._query, self._params, self._rows)
+            self.total_bytes_processed = 1_000 * max(len(data), 1)
+            return data
+        finally:
+            self._on_done()
+
+
+class FakeBigQueryClient:
+    def __init__(self, project: str, latency: float, rows: int, max_concurrent: int = 0):
+        self.project = project
+        self._latency = latency
+        self._rows = rows
+        self._max_concurrent = max_concurrent
+        self._running = 0
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.rejected = 0
+
+    def query(self, query: str, job_config: Any = None) -> FakeQueryJob:
+        with self._lock:
+            if self._max_concurrent and self._running >= self._max_concurrent:
+                self.rejected += 1
+                raise FakeRateLimitError(self.project)
+            self._running += 1
+            self.jobs += 1
+        params = list(getattr(job_config, "query_parameters", None) or [])
+        return FakeQueryJob(query, params, self.project, self._latency, self._rows, self._job_done)
+
+    def _job_done(self) -> None:
+        with self._lock:
+            self._running -= 1
+
+
+def _periods(query: str, params: Dict[str, Any]) -> List[str]:
+    start = str(params.get("suffix_start") or "20160801")
+    end = str(params.get("suffix_end") or "20170831")
+    if "%Y-%m-%d" in query:
+        day = datetime.date(int(start[:4]), int(start[4:6]), int(start[6:8]))
+        last = datetime.date(int(end[:4]), int(end[4:6]), int(end[6:8]))
+        out = []
+        while day <= last:
+            out.append(day.isoformat())
+            day += datetime.timedelta(days=1)
+        return out
+    return months_between(f"{start[:4]}-{start[4:6]}", f"{end[:4]}-{end[4:6]}")
+
+
+def _synthetic_rows(query: str, params: Dict[str, Any], segments: int) -> FakeRows:
+    """`segments` rows (x periods when grouped by period) ordered by pageviews, with LIMIT/OFFSET applied."""
+    groups = _GROUP_BY_RE.findall(query)
+    columns = [c.strip().split(".")[-1] for c in groups[-1].split(",")] if groups else []
+    dims = [c for c in columns if c != "period"]
+    seed = hashlib.sha1(f"{query}{sorted(params.items())}".encode()).hexdigest()
+    rng = random.Random(seed)
+
+    if "AS visitor_ids" in query:
+        return FakeRows(
+            {**_segment(dims, i), "visitor_ids": sorted(rng.sample(range(FAKE_VISITORS), max(25_000 // (i + 1), 1)))}
+            for i in range(segments)
+        )
+
+    if "period" in columns:
+        if params.get("top_segments"):
+            segments = min(segments, int(params["top_segments"]))
+        rows = FakeRows()
+        for i in range(segments):
+            level = 5_000 / (i + 1)
+            for period in _periods(query, params):
+                pageviews = max(int(rng.gauss(level, level ** 0.5)), 0)
+                rows.append({**_segment(dims, i), "period": period, **_kpis(rng, pageviews)})
+        return rows
+
+    rows = FakeRows(
+        {**_segment(dims, i), **_kpis(rng, int(50_000 / (i + 1)) + rng.randint(0, 20)), "total_row_count": segments}
+        for i in range(segments)
+    )
+    offset = int(params.get("offset") or 0)
+    limit: Optional[int] = params.get("limit")
+    return FakeRows(rows[offset:offset + limit] if limit is not None else rows[offset:])
+
+
+def _segment(dims: List[str], i: int) -> Dict[str, str]:
+    return {d: f"{d}-{i}" for d in dims}
+
+
+def _kpis(rng: random.Random, pageviews: int) -> Dict[str, Any]:
+    visitors = max(pageviews // 4, 1)
+    return {
+        "total_visitors": visitors,
+        "total_pageviews": pageviews,
+        "avg_time_on_site_seconds": rng.uniform(20.0, 400.0),
+        "total_conversions": rng.randint(0, max(visitors // 50, 0)),
+    }
+
+
+_CLIENTS: Dict[str, FakeBigQueryClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _fake_bq_client(project_id: str) -> FakeBigQueryClient:
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(project_id)
+        if client is None:
+            client = _CLIENTS[project_id] = FakeBigQueryClient(
+                project_id,
+                latency=int(os.getenv(LATENCY_ENV, str(DEFAULT_LATENCY_MS))) / 1000,
+                rows=int(os.getenv(ROWS_ENV, str(DEFAULT_ROWS))),
+                max_concurrent=int(os.getenv(MAX_CONCURRENT_ENV, "0")),
+            )
+        return client
+
+
+# Module level on purpose: HTTP worker processes re-import this script (as __mp_main__) and need the patch too
+server._bq_client = _fake_bq_client
+
+if __name__ == "__main__":
+    server.main()
@@ -31,6 +31,12 @@ GOOGLE_CLOUD_PROJECT: str = fetch_required_env_var("GOOGLE_CLOUD_PROJECT")
 GEMINI_API_KEY: str = fetch_required_env_var("GEMINI_API_KEY")
 GOOGLE_API_KEY: str = fetch_required_env_var("GOOGLE_API_KEY")
 REGION: str = fetch_required_env_var("REGION", "US")
+# Optional get_all_data execution mode: "month" / "day" shards run concurrently; empty = one job
+ALL_DATA_SHARD_BY: str = os.getenv("ALL_DATA_SHARD_BY", "")
+# Optional shared MCP server (e.g. http://127.0.0.1:8765/mcp, see MCP_TRANSPORT=http); empty = spawn over stdio
+MCP_SERVER_URL: str = os.getenv("MCP_SERVER_URL", "")
+# Optional model override for the ADK agent (any name ADK's model registry resolves); empty = gemini-2.0-flash
+GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "")
 
 
 def main():
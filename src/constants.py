@@ -11,6 +11,13 @@ DEFAULT_PROJECT: str = cfg.GOOGLE_CLOUD_PROJECT
 # https://console.cloud.google.com/marketplace/product/obfuscated-ga360-data/obfuscated-ga360-data)
 DATASET: str = "bigquery-public-data.google_analytics_sample"
 TABLE_WILDCARD: str = f"{DATASET}.ga_sessions_*"
+# Months covered by the public sample export (inclusive)
+DATASET_FIRST_MONTH: str = "2016-08"
+DATASET_LAST_MONTH: str = "2017-08"
+# Last session date of the export (its last month is partial)
+DATASET_LAST_DAY: str = "2017-08-01"
+# Segments below this many pageviews are noise; callers can raise it to shrink results
+DEFAULT_MIN_PAGEVIEWS: int = 20
 
 # Allowlist of dimensions (segments) exposed to clients
 DIMENSIONS: Dict[str, str] = {
@@ -1,28 +1,47 @@
 import asyncio
+import contextlib
+import functools
 import json
 import logging
 import re
 import sys
+import threading
 import time
 import uuid
-from typing import Any, Dict, List, Literal, Tuple
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple, cast
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-
-from google.adk.agents import LlmAgent
-from google.adk.runners import InMemoryRunner
-from google.adk.tools.function_tool import FunctionTool
-from google.adk.tools.mcp_tool import McpToolset
-from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
+import numpy as np
 
 from src import config as cfg
-from src.constants import DEFAULT_PROJECT, DIMENSION_KEYS, KPI_FIELDS
+from src.constants import (
+    DATASET_FIRST_MONTH,
+    DATASET_LAST_DAY,
+    DATASET_LAST_MONTH,
+    DEFAULT_MIN_PAGEVIEWS,
+    DEFAULT_PROJECT,
+    DIMENSION_KEYS,
+    KPI_FIELDS,
+)
+from src.ga_ad_agent import tracing
+from src.ga_ad_agent.anomaly import DEFAULT_Z_THRESHOLD, rank_anomalies, scan_anomalies
+from src.ga_ad_agent.row_codec import decode_response
+from src.ga_ad_agent.segment_join import SegmentColumns, compare_segments
+from src.ga_ad_agent.segment_store import SegmentStore, SegmentTable
+from src.ga_ad_agent.trend import SegmentTrends, period_range, rank_trends
+from src.ga_ad_agent.visitor_bitmaps import VisitorSets, VisitorSetStore
 
 RuleName = Literal["traffic", "conversion"]
+GrainName = Literal["month", "day"]
+PriorityName = Literal["interactive", "batch"]
+
+# progress(stage, fraction, partial_result) - lets callers (e.g. the Streamlit UI) poll long analyses
+ProgressCallback = Callable[[str, float, Optional[Dict[str, Any]]], None]
 
 SERVER_SCRIPT_PATH = cfg.PROJECT_ROOT / "src/ga_ad_agent/ga_mcp_server.py"
 
+# Tools whose rows this client requests column-major (row_codec); decode_response expands them to row dicts
+COLUMNAR_TOOLS = frozenset({"get_monthly_data", "get_all_data", "get_trend_data", "get_visitor_sets"})
+
 # -------------------------
 # Logging setup
 # -------------------------
@@ -49,11 +68,10 @@ def _setup_logging() -> None:
 
 
 _setup_logging()
+tracing.setup_tracing("ga-kpi-client")
 
 
 def _tool_result_to_json(result: Any) -> Dict[str, Any]:
-    import json
-
     content = getattr(result, "content", None) or []
     texts = []
     for part in content:
@@ -68,41 +86,63 @@ def _tool_result_to_json(result: Any) -> Dict[str, Any]:
         return {"error": "Empty ToolResult.content text", "result_repr": repr(result)}
 
     try:
-        return json.loads(joined)
+        return decode_response(joined)
     except Exception as e:
         return {"error": f"Failed to parse JSON text: {e}", "raw": joined[:2000]}
 
 
 async def _call_tool(tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Spawn the MCP server over stdio, call one tool, return JSON.
+    Call one tool on the shared HTTP server (MCP_SERVER_URL) or, by default, on a server spawned
+    over stdio for this call; return JSON.
     Adds logging around lifecycle + errors.
     """
-    logger.info("Calling MCP tool: %s args_keys=%s", tool_name, sorted(args.keys()))
+    server_url = cfg.MCP_SERVER_URL
+    if tool_name in COLUMNAR_TOOLS:
+        args = {**args, "row_format": "columns"}
+    logger.info("Calling MCP tool: %s args_keys=%s server=%s", tool_name, sorted(args.keys()), server_url or "stdio")
     start = time.time()
 
-    if not SERVER_SCRIPT_PATH.exists():
+    if not server_url and not SERVER_SCRIPT_PATH.exists():
         raise FileNotFoundError(f"MCP server script not found at {SERVER_SCRIPT_PATH}")
 
-    call_tool_server_params = StdioServerParameters(
-        command=sys.executable,
-        args=[str(SERVER_SCRIPT_PATH)],
-        env=None,
-    )
+    from mcp import ClientSession, StdioServerParameters  # deferred: not needed until the first tool call
+    from mcp.client.stdio import stdio_client
+    from mcp.client.streamable_http import streamablehttp_client
 
     try:
-        async with stdio_client(call_tool_server_params) as (read, write):
-            logger.debug("stdio_client started for server script=%s", SERVER_SCRIPT_PATH)
-            async with ClientSession(read, write) as session:
-                logger.debug("Initializing MCP session...")
-                await session.initialize()
-                logger.debug("Session initialized. Calling tool=%s", tool_name)
-
-                res = await session.call_tool(tool_name, args)
-                out = _tool_result_to_json(res)
+        with tracing.span("mcp.call_tool", tool=tool_name) as call_span:
+            async with contextlib.AsyncExitStack() as stack:
+                if server_url:
+                    with tracing.span("mcp.connect", url=server_url):
+                        read, write, _ = await stack.enter_async_context(streamablehttp_client(server_url))
+                        session = await stack.enter_async_context(ClientSession(read, write))
+                else:
+                    with tracing.span("mcp.spawn"):
+                        call_tool_server_params = StdioServerParameters(
+                            command=sys.executable,
+                            args=[str(SERVER_SCRIPT_PATH)],
+                            env=tracing.child_env(),
+                        )
+                        read, write = await stack.enter_async_context(stdio_client(call_tool_server_params))
+                        logger.debug("stdio_client started for server script=%s", SERVER_SCRIPT_PATH)
+                        session = await stack.enter_async_context(ClientSession(read, write))
+
+                with tracing.span("mcp.initialize"):
+                    logger.debug("Initializing MCP session...")
+                    await session.initialize()
+
+                with tracing.span("mcp.call"):
+                    logger.debug("Session initialized. Calling tool=%s", tool_name)
+                    # trace context crosses the stdio boundary in the request `_meta`
+                    res = await session.call_tool(tool_name, args, meta=tracing.request_meta())
+
+                with tracing.span("json.decode"):
+                    out = _tool_result_to_json(res)
 
                 elapsed = time.time() - start
                 row_count = out.get("row_count") if isinstance(out, dict) else None
+                call_span.set_attributes(row_count=row_count, is_error=getattr(res, "isError", False))
 
                 logger.info(
                     "MCP tool call done: %s elapsed=%.2fs row_count=%s isError=%s",
@@ -118,24 +158,263 @@ async def _call_tool(tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
         raise
 
 
-def get_month(month: str, dimensions: List[str], project_id: str = DEFAULT_PROJECT) -> Dict[str, Any]:
-    logger.info("get_month called: month=%s dimensions=%s project_id=%s", month, dimensions, project_id)
+def _stored_kpi_table(
+        scope: Literal["all", "month"],
+        dimensions: List[str],
+        project_id: str,
+        month: str | None = None,
+        min_pageviews: int | None = None,
+) -> SegmentTable | None:
+    """
+    KPI result from the local segment store (SEGMENT_STORE_DIR), fetching + storing it on first use.
+    Returns None when the store is disabled.
+    """
+    store = SegmentStore.from_env()
+    if store is None:
+        return None
+
+    name = SegmentStore.table_name(scope, dimensions, month=month, min_pageviews=min_pageviews)
+    if store.exists(name):
+        return store.open(name)
+
+    if scope == "month":
+        data = get_month(month or "", dimensions, project_id, min_pageviews=min_pageviews, allow_large=True)
+    else:
+        data = get_all(dimensions, project_id, min_pageviews=min_pageviews, allow_large=True)
+
+    if data.get("error") or "rows" not in data:
+        raise RuntimeError(f"Cannot store {name}: {data.get('error') or 'response has no rows'}")
+    return store.write(name, data)
+
+
+def _report(progress: ProgressCallback | None, stage: str, fraction: float, partial: Dict[str, Any] | None = None) -> None:
+    """
+    Forward a progress update to the caller, never letting a broken callback fail the analysis.
+    """
+    if progress is None:
+        return
+    try:
+        progress(stage, fraction, partial)
+    except Exception:  # noqa: BLE001
+        logger.exception("Progress callback failed: stage=%s", stage)
+
+
+def _query_option_args(
+        limit: int | None,
+        offset: int,
+        order_by: str | None,
+        min_pageviews: int | None,
+        allow_large: bool = False,
+        priority: PriorityName | None = None,
+) -> Dict[str, Any]:
+    """Optional server-side top-K/threshold args; omitted when unused so the server defaults apply."""
+    args: Dict[str, Any] = {}
+    if allow_large:
+        args["allow_large"] = True  # complete result needed - skip the server's auto-limit
+    if priority is not None:
+        args["priority"] = priority  # batch jobs queue behind interactive ones in the server's scheduler
+    if limit is not None:
+        args["limit"] = limit
+        args["offset"] = offset
+    if order_by is not None:
+        args["order_by"] = order_by
+    if min_pageviews is not None:
+        args["min_pageviews"] = min_pageviews
+    return args
+
+
+@tracing.traced("agent.get_month")
+def get_month(
+        month: str,
+        dimensions: List[str],
+        project_id: str = DEFAULT_PROJECT,
+        *,
+        limit: int | None = None,
+        offset: int = 0,
+        order_by: str | None = None,
+        min_pageviews: int | None = None,
+        allow_large: bool = False,
+        priority: PriorityName | None = None,
+) -> Dict[str, Any]:
+    logger.info(
+        "get_month called: month=%s dimensions=%s project_id=%s limit=%s offset=%s min_pageviews=%s",
+        month,
+        dimensions,
+        project_id,
+        limit,
+        offset,
+        min_pageviews,
+    )
     return asyncio.run(
-        _call_tool("get_monthly_data", {"month": month, "dimensions": dimensions, "project_id": project_id})
+        _call_tool(
+            "get_monthly_data",
+            {
+                "month": month,
+                "dimensions": dimensions,
+                "project_id": project_id,
+                **_query_option_args(limit, offset, order_by, min_pageviews, allow_large, priority),
+            },
+        )
     )
 
 
-def get_all(dimensions: List[str], project_id: str = DEFAULT_PROJECT) -> Dict[str, Any]:
-    logger.info("get_all called: dimensions=%s project_id=%s", dimensions, project_id)
-    return asyncio.run(_call_tool("get_all_data", {"dimensions": dimensions, "project_id": project_id}))
+@tracing.traced("agent.get_all")
+def get_all(
+        dimensions: List[str],
+        project_id: str = DEFAULT_PROJECT,
+        *,
+        limit: int | None = None,
+        offset: int = 0,
+        order_by: str | None = None,
+        min_pageviews: int | None = None,
+        allow_large: bool = False,
+        shard_by: GrainName | None = None,
+        priority: PriorityName | None = None,
+) -> Dict[str, Any]:
+    shard_by = shard_by or cast(Optional[GrainName], cfg.ALL_DATA_SHARD_BY or None)
+    logger.info(
+        "get_all called: dimensions=%s project_id=%s limit=%s offset=%s min_pageviews=%s shard_by=%s",
+        dimensions,
+        project_id,
+        limit,
+        offset,
+        min_pageviews,
+        shard_by,
+    )
+    args = {
+        "dimensions": dimensions,
+        "project_id": project_id,
+        **_query_option_args(limit, offset, order_by, min_pageviews, allow_large, priority),
+    }
+    if shard_by:
+        args["shard_by"] = shard_by  # month/day shards run concurrently and are merged server-side
+    return asyncio.run(_call_tool("get_all_data", args))
+
+
+@tracing.traced("agent.get_trend")
+def get_trend(
+        dimensions: List[str],
+        grain: GrainName = "month",
+        start_month: str | None = None,
+        end_month: str | None = None,
+        project_id: str = DEFAULT_PROJECT,
+        *,
+        min_pageviews: int | None = None,
+        top_segments: int | None = None,
+        allow_large: bool = False,
+) -> Dict[str, Any]:
+    logger.info(
+        "get_trend called: dimensions=%s grain=%s range=%s..%s project_id=%s min_pageviews=%s top_segments=%s",
+        dimensions,
+        grain,
+        start_month,
+        end_month,
+        project_id,
+        min_pageviews,
+        top_segments,
+    )
+    args: Dict[str, Any] = {"dimensions": dimensions, "grain": grain, "project_id": project_id}
+    if start_month:
+        args["start_month"] = start_month
+    if end_month:
+        args["end_month"] = end_month
+    if min_pageviews is not None:
+        args["min_pageviews"] = min_pageviews
+    if top_segments is not None:
+        args["top_segments"] = top_segments
+    if allow_large:
+        args["allow_large"] = True  # complete result needed - skip the server's auto-limit
+    return asyncio.run(_call_tool("get_trend_data", args))
+
+
+def _visitor_set_args(dimensions: List[str], month: str | None, project_id: str) -> Dict[str, Any]:
+    args: Dict[str, Any] = {"dimensions": dimensions, "project_id": project_id, "allow_large": True}
+    if month:
+        args["month"] = month
+    return args
+
+
+@tracing.traced("agent.get_visitor_sets")
+def get_visitor_sets(
+        dimensions: List[str],
+        month: str | None = None,
+        project_id: str = DEFAULT_PROJECT,
+) -> VisitorSets:
+    """
+    Exact visitor set per segment for one month (None = whole dataset), from the visitor set store
+    (SEGMENT_STORE_DIR) when a set with these or finer dimensions is stored, else fetched (and stored).
+    """
+    return _visitor_sets(list(dimensions), [month], project_id)[0]
+
+
+def _visitor_sets(dimensions: List[str], months: List[str | None], project_id: str) -> List[VisitorSets]:
+    """
+    Visitor sets of `dimensions` per month: stored sets are rolled up locally, the missing ones are fetched
+    concurrently in one event loop.
+    """
+    store = VisitorSetStore.from_env()
+    out: Dict[int, VisitorSets] = {}
+    missing: List[int] = []
+    for i, month in enumerate(months):
+        name = store.find(dimensions, month) if store is not None else None
+        if name is None:
+            missing.append(i)
+        else:
+            out[i] = store.open(name).rollup(dimensions)
+    logger.info("Visitor sets: months=%d stored=%d fetching=%d", len(months), len(out), len(missing))
+
+    async def fetch_all() -> List[Dict[str, Any]]:
+        return await asyncio.gather(
+            *(_call_tool("get_visitor_sets", _visitor_set_args(dimensions, months[i], project_id)) for i in missing)
+        )
+
+    for i, data in zip(missing, asyncio.run(fetch_all()) if missing else []):
+        if data.get("error") or "rows" not in data:
+            raise RuntimeError(f"Cannot fetch visitor sets for {months[i] or 'all'}: {data.get('error') or data}")
+        sets = VisitorSets.from_response(data)
+        if store is not None:
+            source = {k: data.get(k) for k in ("scope", "month", "notes")}
+            store.write(VisitorSetStore.name(dimensions, months[i]), sets, source)
+        out[i] = sets
+    return [out[i] for i in range(len(months))]
+
+
+@tracing.traced("agent.exact_visitor_counts")
+def exact_visitor_counts(
+        dimensions: List[str],
+        months: List[str] | None = None,
+        project_id: str = DEFAULT_PROJECT,
+) -> Dict[str, Any]:
+    """
+    Exact distinct visitors per segment over the union of `months` (None = whole dataset), by OR-ing
+    the per-month visitor bitmaps locally. With the store enabled, any month range or coarser dimension
+    set of already fetched sets is answered without BigQuery.
+    """
+    logger.info("exact_visitor_counts called: dimensions=%s months=%s project_id=%s", dimensions, months, project_id)
+    dims = list(dimensions)
+    parts = _visitor_sets(dims, list(months) if months else [None], project_id)
+    merged = VisitorSets.union(parts)
+    rows = merged.to_rows()
+
+    logger.info("exact_visitor_counts output rows=%d", len(rows))
+    return {
+        "task": "exact_visitor_counts",
+        "dimensions": dims,
+        "months": list(months) if months else None,
+        "row_count": len(rows),
+        "total_visitors": len(merged.total()),
+        "rows": rows,
+    }
 
 
 # @tool("compare_two_months_tool")
+@tracing.traced("agent.compare_two_months")
 def compare_two_months(
         month_a: str,
         month_b: str,
         dimensions: List[str],
         project_id: str = DEFAULT_PROJECT,
+        progress: ProgressCallback | None = None,
 ) -> Dict[str, Any]:
     """
     1) Pull KPIs for month A and B for same dimensions
@@ -150,58 +429,35 @@ def compare_two_months(
         project_id,
     )
 
-    a = get_month(month_a, dimensions, project_id)
-    b = get_month(month_b, dimensions, project_id)
-
-    def key(row: Dict[str, Any]) -> Tuple:
-        return tuple(row.get(d) for d in dimensions)
-
-    a_rows = a.get("rows", [])
-    b_rows = b.get("rows", [])
-    logger.info("compare_two_months fetched: month_a_rows=%d month_b_rows=%d", len(a_rows), len(b_rows))
-
-    a_map = {key(r): r for r in a_rows}
-    b_map = {key(r): r for r in b_rows}
-
-    all_keys = sorted(set(a_map.keys()) | set(b_map.keys()))
-    logger.debug("compare_two_months unique segments=%d", len(all_keys))
-
     kpis = ["total_visitors", "total_pageviews", "avg_time_on_site_seconds", "total_conversions"]
+    dims = list(dimensions)
+
+    _report(progress, "fetch_month_a", 0.05)
+    table_a = _stored_kpi_table("month", dims, project_id, month=month_a)
+    if table_a is not None:
+        # Memory-mapped columns straight from the segment store - no JSON rows at all
+        _report(progress, "fetch_month_b", 0.45)
+        table_b = _stored_kpi_table("month", dims, project_id, month=month_b)
+        _report(progress, "compare", 0.9)
+        side_a = SegmentColumns.from_table(table_a, dims, kpis)
+        side_b = SegmentColumns.from_table(table_b, dims, kpis)
+    else:
+        a = get_month(month_a, dims, project_id, allow_large=True)
+        _report(progress, "fetch_month_b", 0.45, a)
+        b = get_month(month_b, dims, project_id, allow_large=True)
+        _report(progress, "compare", 0.9, b)
+        side_a = SegmentColumns.from_rows(a.get("rows", []), dims, kpis)
+        side_b = SegmentColumns.from_rows(b.get("rows", []), dims, kpis)
 
-    out_rows = []
-    for k in all_keys:
-        ra = a_map.get(k, {})
-        rb = b_map.get(k, {})
-
-        segment = {d: k[i] for i, d in enumerate(dimensions)}
-
-        changes: dict[str, float | None] = {}
-        for metric in kpis:
-            av = ra.get(metric, 0) if ra else 0
-            bv = rb.get(metric, 0) if rb else 0
-
-            # Handle avg metric being None
-            if av is None or bv is None:
-                changes[f"{metric}_pct_change"] = None
-                continue
-
-            if av == 0:
-                changes[f"{metric}_pct_change"] = None
-            else:
-                changes[f"{metric}_pct_change"] = ((bv - av) / av) * 100.0
+    logger.info("compare_two_months fetched: month_a_rows=%d month_b_rows=%d", len(side_a), len(side_b))
 
-        out_rows.append(
-            {
-                **segment,
-                "month_a": month_a,
-                "month_b": month_b,
-                "a": {m: ra.get(m) for m in kpis},
-                "b": {m: rb.get(m) for m in kpis},
-                "pct_change": changes,
-            }
-        )
+    # Interned codes + packed-key outer join; dicts are only built for the output rows
+    comparison = compare_segments(side_a, side_b, dims, kpis)
+    logger.debug("compare_two_months unique segments=%d", len(comparison))
+    out_rows = comparison.to_rows(month_a, month_b)
 
     logger.info("compare_two_months output rows=%d", len(out_rows))
+    _report(progress, "done", 1.0)
     return {
         "task": "compare_two_months",
         "dimensions": dimensions,
@@ -212,10 +468,39 @@ def compare_two_months(
     }
 
 
+def flag_rule(rule: RuleName) -> Tuple[List[str], int | None, Callable[[Dict[str, Any]], Any]]:
+    """
+    (output KPI keys, min_pageviews pushed into SQL, predicate) of a flagged_segments rule.
+    min_pageviews keeps segments that can't match the rule out of the transfer (None -> server default).
+    """
+    if rule == "traffic":
+        rule_kpis = ["total_visitors", "total_conversions"]
+        enforcement_metrics = ["avg_time_on_site_seconds", "total_pageviews"]
+
+        # `&` (not `and`) so the same rule works on scalars and on numpy / pandas columns
+        def _rule_ok(m: Dict[str, Any]) -> Any:
+            return (m["avg_time_on_site_seconds"] < 120) & (m["total_pageviews"] < 30)
+
+        return list(dict.fromkeys(rule_kpis + enforcement_metrics)), None, _rule_ok
+
+    if rule == "conversion":
+        rule_kpis = ["total_visitors", "avg_time_on_site_seconds"]
+        enforcement_metrics = ["total_conversions", "total_pageviews"]
+
+        def _rule_ok(m: Dict[str, Any]) -> Any:
+            return (m["total_conversions"] == 0) & (m["total_pageviews"] > 250)
+
+        return list(dict.fromkeys(rule_kpis + enforcement_metrics)), 251, _rule_ok
+
+    raise ValueError(f"Unknown rule: {rule}")
+
+
+@tracing.traced("agent.flagged_segments")
 def flagged_segments(
         rule: RuleName,
         dimensions: list[str] | None = None,
         project_id: str = DEFAULT_PROJECT,
+        progress: ProgressCallback | None = None,
 ) -> Dict[str, Any]:
     """
     Requirement:
@@ -239,26 +524,33 @@ def flagged_segments(
     if not dims:
         raise ValueError("flagged_segments requires at least one dimension")
 
-    if rule == "traffic":
-        rule_kpis = ["total_visitors", "total_conversions"]
-        enforcement_metrics = ["avg_time_on_site_seconds", "total_pageviews"]
-
-        def _rule_ok(m: Dict[str, Any]) -> bool:
-            return m["avg_time_on_site_seconds"] < 120 and m["total_pageviews"] < 30
-    elif rule == "conversion":
-        rule_kpis = ["total_visitors", "avg_time_on_site_seconds"]
-        enforcement_metrics = ["total_conversions", "total_pageviews"]
-
-        def _rule_ok(m: Dict[str, Any]) -> bool:
-            return m["total_conversions"] == 0 and m["total_pageviews"] > 250
-    else:
-        raise ValueError(f"Unknown rule: {rule}")
+    kpi_keys, min_pageviews, _rule_ok = flag_rule(rule)
 
-    kpi_keys = list(dict.fromkeys(rule_kpis + enforcement_metrics))
+    _report(progress, "fetch_all_data", 0.05)
+    table = _stored_kpi_table("all", dims, project_id, min_pageviews=min_pageviews)
+    if table is not None:
+        # Columnar scan over the memory-mapped store - no JSON parsing, rows materialized only for matches
+        _report(progress, "apply_rule", 0.9)
+        columns = {k: np.nan_to_num(table.kpi(k), nan=0.0) for k in table.kpis}
+        flagged = table.to_rows(np.flatnonzero(_rule_ok(columns)), kpis=kpi_keys)
+        for out_row in flagged:
+            for k in kpi_keys:
+                out_row[k] = out_row[k] or 0
+        logger.info("flagged_segments scanned stored rows=%d flagged=%d (rule=%s)", len(table), len(flagged), rule)
+        _report(progress, "done", 1.0)
+        return {
+            "task": "flagged_segments",
+            "rule": rule,
+            "dimensions": dims,
+            "kpis": kpi_keys,
+            "row_count": len(flagged),
+            "rows": flagged,
+        }
 
-    data = get_all(dims, project_id)
+    data = get_all(dims, project_id, min_pageviews=min_pageviews, allow_large=True)
     rows = data.get("rows", [])
     logger.info("flagged_segments fetched rows=%d", len(rows))
+    _report(progress, "apply_rule", 0.9, data)
 
     flagged = []
     for r in rows:
@@ -278,6 +570,7 @@ def flagged_segments(
             # New block - end
 
     logger.info("flagged_segments flagged=%d (rule=%s)", len(flagged), rule)
+    _report(progress, "done", 1.0)
 
     return {
         "task": "flagged_segments",
@@ -289,9 +582,11 @@ def flagged_segments(
     }
 
 
+@tracing.traced("agent.conversion_rate_by_country_device")
 def conversion_rate_by_country_device(
         month: str,
         project_id: str = DEFAULT_PROJECT,
+        progress: ProgressCallback | None = None,
 ) -> Dict[str, Any]:
     """
     Requirement:
@@ -302,9 +597,11 @@ def conversion_rate_by_country_device(
     logger.info("conversion_rate_by_country_device called: month=%s project_id=%s", month, project_id)
 
     dims = ["user_country", "device_type"]
-    data = get_month(month, dims, project_id)
+    _report(progress, "fetch_month", 0.05)
+    data = get_month(month, dims, project_id, allow_large=True)
     rows = data.get("rows", [])
     logger.info("conversion_rate_by_country_device fetched rows=%d", len(rows))
+    _report(progress, "compute_rates", 0.9, data)
 
     out = []
     for r in rows:
@@ -324,6 +621,7 @@ def conversion_rate_by_country_device(
 
     out.sort(key=lambda x: x["conversion_rate"], reverse=True)
     logger.info("conversion_rate_by_country_device output rows=%d", len(out))
+    _report(progress, "done", 1.0)
 
     return {
         "task": "conversion_rate_by_country_device",
@@ -334,6 +632,168 @@ def conversion_rate_by_country_device(
     }
 
 
+@tracing.traced("agent.trend_analysis")
+def trend_analysis(
+        dimensions: List[str],
+        kpi: str = "total_pageviews",
+        grain: GrainName = "month",
+        start_month: str = DATASET_FIRST_MONTH,
+        end_month: str = DATASET_LAST_MONTH,
+        window: int = 3,
+        top_n: int | None = 20,
+        project_id: str = DEFAULT_PROJECT,
+        progress: ProgressCallback | None = None,
+        *,
+        top_segments: int | None = None,
+        min_pageviews: int | None = None,
+        ascending: bool = False,
+) -> Dict[str, Any]:
+    """
+    Per-segment KPI time series over a period range from ONE get_trend_data fetch (not one call per month):
+    - series per KPI on a complete calendar axis (missing period -> 0 for counts, None for averages)
+    - period-over-period % change, trailing rolling average over `window` periods
+    - segments ranked by growth of `kpi`: least-squares slope of its rolling average, as % of the segment mean
+    Returns the top_n segments (fastest growing first, or declining first with ascending=True).
+    """
+    logger.info(
+        "trend_analysis called: dimensions=%s kpi=%s grain=%s range=%s..%s window=%s top_n=%s",
+        dimensions,
+        kpi,
+        grain,
+        start_month,
+        end_month,
+        window,
+        top_n,
+    )
+    if kpi not in KPI_FIELDS:
+        raise ValueError(f"Unknown kpi: {kpi}. Allowed: {KPI_FIELDS}")
+    if window < 1:
+        raise ValueError("window must be >= 1")
+    dims = list(dict.fromkeys(dimensions))
+    periods = period_range(grain, start_month, end_month, last_day=DATASET_LAST_DAY)
+
+    _report(progress, "fetch_trend", 0.05)
+    data = get_trend(
+        dims,
+        grain,
+        start_month,
+        end_month,
+        project_id,
+        min_pageviews=min_pageviews,
+        top_segments=top_segments,
+        allow_large=True,
+    )
+    if data.get("error"):
+        raise RuntimeError(f"get_trend_data failed: {data['error']}")
+    rows = data.get("rows", [])
+    logger.info("trend_analysis fetched rows=%d periods=%d", len(rows), len(periods))
+    _report(progress, "compute_trends", 0.8)
+
+    trends = SegmentTrends.from_rows(rows, dims, KPI_FIELDS, periods)
+    ranked = rank_trends(trends, KPI_FIELDS, kpi, window, top_n, ascending=ascending)
+
+    logger.info("trend_analysis segments=%d output rows=%d", len(trends), len(ranked))
+    _report(progress, "done", 1.0)
+    return {
+        "task": "trend_analysis",
+        "dimensions": dims,
+        "kpi": kpi,
+        "grain": grain,
+        "periods": periods,
+        "window": window,
+        "segment_count": len(trends),
+        "row_count": len(ranked),
+        "rows": ranked,
+    }
+
+
+@tracing.traced("agent.detect_anomalies")
+def detect_anomalies(
+        dimensions: List[str],
+        kpis: List[str] | None = None,
+        start_month: str = DATASET_FIRST_MONTH,
+        end_month: str = DATASET_LAST_MONTH,
+        z_threshold: float = DEFAULT_Z_THRESHOLD,
+        top_n: int | None = 50,
+        project_id: str = DEFAULT_PROJECT,
+        progress: ProgressCallback | None = None,
+        *,
+        min_active_days: int = 14,
+        time_budget_seconds: float | None = 60.0,
+        top_segments: int | None = None,
+        min_pageviews: int | None = None,
+) -> Dict[str, Any]:
+    """
+    Daily anomalies per segment from ONE day-grain get_trend_data fetch:
+    - baseline = median of the segment's KPI on the same weekday (weekly seasonality)
+    - robust z-score of the residual (median/MAD), |z| >= z_threshold is an anomaly
+    Scored in vectorized batches, largest segments first; time_budget_seconds bounds the scan.
+    """
+    kpis = list(kpis or ["total_pageviews", "total_conversions"])
+    logger.info(
+        "detect_anomalies called: dimensions=%s kpis=%s range=%s..%s z_threshold=%s top_n=%s budget=%s",
+        dimensions,
+        kpis,
+        start_month,
+        end_month,
+        z_threshold,
+        top_n,
+        time_budget_seconds,
+    )
+    unknown = [k for k in kpis if k not in KPI_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown kpis: {unknown}. Allowed: {KPI_FIELDS}")
+    if z_threshold <= 0:
+        raise ValueError("z_threshold must be > 0")
+    dims = list(dict.fromkeys(dimensions))
+    periods = period_range("day", start_month, end_month, last_day=DATASET_LAST_DAY)
+
+    _report(progress, "fetch_daily", 0.05)
+    data = get_trend(
+        dims,
+        "day",
+        start_month,
+        end_month,
+        project_id,
+        min_pageviews=min_pageviews,
+        top_segments=top_segments,
+        allow_large=True,
+    )
+    if data.get("error"):
+        raise RuntimeError(f"get_trend_data failed: {data['error']}")
+    rows = data.get("rows", [])
+    logger.info("detect_anomalies fetched rows=%d days=%d", len(rows), len(periods))
+    _report(progress, "score", 0.6)
+
+    trends = SegmentTrends.from_rows(rows, dims, kpis, periods)
+    scan = scan_anomalies(
+        trends,
+        kpis,
+        z_threshold=z_threshold,
+        min_active_days=min_active_days,
+        time_budget_seconds=time_budget_seconds,
+    )
+    ranked = rank_anomalies(trends, scan, kpis, top_n)
+
+    logger.info("detect_anomalies anomalies=%d output rows=%d", len(scan.z), len(ranked))
+    _report(progress, "done", 1.0)
+    return {
+        "task": "detect_anomalies",
+        "dimensions": dims,
+        "kpis": kpis,
+        "start_month": start_month,
+        "end_month": end_month,
+        "z_threshold": z_threshold,
+        "anomaly_count": int(len(scan.z)),
+        "segments_scanned": scan.segments_scanned,
+        "segment_count": scan.segments_total,
+        "truncated": scan.truncated,
+        "scan_seconds": scan.elapsed,
+        "row_count": len(ranked),
+        "rows": ranked,
+    }
+
+
 def compare_two_months_tool(
         month_a: str,
         month_b: str,
@@ -364,22 +824,51 @@ def calculate_conversion_rate_by_country_and_device(
     return res.get("rows", [])
 
 
-# Wrap functions as ADK FunctionTool instances
-compare_months_tool = FunctionTool(compare_two_months_tool)
-flagged_segments_tool = FunctionTool(identify_flagged_segments)
-conversion_rate_by_country_device_tool = FunctionTool(calculate_conversion_rate_by_country_and_device)
+def analyze_kpi_trends(
+        dimensions: list[str],
+        kpi: str = "total_pageviews",
+        grain: str = "month",
+        start_month: str = DATASET_FIRST_MONTH,
+        end_month: str = DATASET_LAST_MONTH,
+        window: int = 3,
+        top_n: int = 20,
+        project_id: str = DEFAULT_PROJECT,
+):
+    """Rank segments by KPI growth over a month/day range, with series, % changes and rolling averages."""
+    res = trend_analysis(
+        dimensions,
+        kpi=kpi,
+        grain=cast(GrainName, grain),
+        start_month=start_month,
+        end_month=end_month,
+        window=window,
+        top_n=top_n,
+        project_id=project_id,
+    )
+    return res
 
 
-server_params = StdioServerParameters(
-        command=sys.executable,
-        args=[str(SERVER_SCRIPT_PATH)],
-        env=None,
+def find_kpi_anomalies(
+        dimensions: list[str],
+        kpis: list[str] | None = None,
+        start_month: str = DATASET_FIRST_MONTH,
+        end_month: str = DATASET_LAST_MONTH,
+        z_threshold: float = DEFAULT_Z_THRESHOLD,
+        top_n: int = 50,
+        project_id: str = DEFAULT_PROJECT,
+):
+    """Rank daily KPI anomalies (spikes/drops vs. the segment's weekday baseline) per segment."""
+    res = detect_anomalies(
+        dimensions,
+        kpis=kpis,
+        start_month=start_month,
+        end_month=end_month,
+        z_threshold=z_threshold,
+        top_n=top_n,
+        project_id=project_id,
     )
+    return res
 
-toolset = McpToolset(
-        connection_params=StdioConnectionParams(server_params=server_params),
-        tool_filter=["get_monthly_data", "get_all_data"],
-    )
 
 # Model selection: allow override via GEMINI_MODEL.
 # Use a v1beta-available model by default to avoid 404s on older endpoints.
@@ -389,7 +878,7 @@ LLM_AGENT_DESCRIPTION = f"""
 Agent to answer questions about Google Analytics data stored in BigQuery public dataset `bigquery-public-data.google_analytics_sample.ga_sessions_*`.
 Uses: 
     - MCP tools (get_monthly_data/get_all_data) via MCP Server
-    - deterministic function tools (compare_two_months/flagged_segments/conversion_rate_by_country_device) 
+    - deterministic function tools (compare_two_months/flagged_segments/conversion_rate_by_country_device/trend_analysis/detect_anomalies) 
         that implement your assignment abilities. 
 Prefer deterministic results."""
 
@@ -399,8 +888,10 @@ You are a Google Analytics agent that must respond with a JSON action + argument
 **Use only these action names:**
 1) get_monthly_data: fetch KPIs for a month.
     - Inputs: month (YYYY-MM), dimensions (subset of {DIMENSION_KEYS}).
+    - Optional: limit (top-K page size), offset, order_by (one of {KPI_FIELDS}), min_pageviews (default {DEFAULT_MIN_PAGEVIEWS}).
 2) get_all_data: fetch KPIs across all months.
     - Inputs: dimensions (subset of {DIMENSION_KEYS}).
+    - Optional: limit (top-K page size), offset, order_by (one of {KPI_FIELDS}), min_pageviews (default {DEFAULT_MIN_PAGEVIEWS}).
 3) compare_two_months: compare KPIs between two months for given dimensions (optional).
     - Dimensions default to all: traffic_source, user_country, medium, device_type, page_title.
     - Compute % change per KPI per segment.
@@ -410,40 +901,133 @@ You are a Google Analytics agent that must respond with a JSON action + argument
     - conversion rule: total_conversions = 0 AND total_pageviews > 250
 5) conversion_rate_by_country_and_device: compute conversion rate per (user_country, device_type) for a month.
     - Inputs: month (YYYY-MM). Drop rows with zeros for total_visitors and total_conversions. conversion_rate = total_conversions / total_visitors.
+6) trend_analysis: KPI trend per segment across many months (or days) from a single fetch; ranks segments by growth.
+    - Inputs: dimensions (subset of {DIMENSION_KEYS}), kpi (one of {KPI_FIELDS}, default total_pageviews).
+    - Optional: grain (month | day, default month), start_month / end_month (YYYY-MM, default 2016-08..2017-08),
+      window (rolling average periods, default 3), top_n (segments returned, default 20).
+    - Use this instead of repeated get_monthly_data / compare_two_months calls for "trend", "over time", "growth" questions.
+7) detect_anomalies: unusual daily spikes/drops per segment (robust z-score against the weekday baseline).
+    - Inputs: dimensions (subset of {DIMENSION_KEYS}).
+    - Optional: kpis (subset of {KPI_FIELDS}, default total_pageviews + total_conversions),
+      start_month / end_month (YYYY-MM), z_threshold (default {DEFAULT_Z_THRESHOLD}), top_n (default 50).
+    - Use for "anomalies", "outliers", "unusual days", "spikes", "drops" questions; static rule checks stay identify_flagged_segments.
 
 **Important context:**
 - Dataset: `bigquery-public-data.google_analytics_sample.ga_sessions_*` (Aug 2016–Aug 2017). Keep month within this range.
 - Only use dimensions from: {DIMENSION_KEYS}
 - Only use KPIs: {KPI_FIELDS}
+- High-cardinality combinations (e.g. page_title x traffic_source) are auto-limited by the server; prefer coarser dimensions or a limit.
 - Preserve user month format (YYYY-MM or YYYY-MM-01); the literal "all_data" means full history.
 
 **Always return JSON with keys:** action, arguments.
 """
 
-agent = LlmAgent(
-    name="ad_performance_agent",
-    description=LLM_AGENT_DESCRIPTION.strip(),
-    instruction=LLM_AGENT_INSTRUCTIONS.strip(),
-    # """
-    # Use tools when needed.
-    # You can do exactly these actions (choose one):
-    # 1) compare_two_months: Compare KPIs between two months for requested dimensions and report % changes.
-    # 2) identify_flagged_segments: Given dimensions (excluding user_country) and a rule name (traffic|conversion), 
-    #    return flagged segments.
-    # 3) conversion_rate_by_country_and_device: For a timeframe, return conversion rate per (user_country, device_type), 
-    #    ordered high->low. 
-    #    Use a month when specified, or use "all_data" when the user asks for all history—do not force a month.
-    #    conversion rate = (total_conversions / total_visitors) for the given timeframe
-
-    # When selecting dimensions, only use these known fields:
-    # traffic_source, medium, device_type, user_country, page_title.
-    # Months are provided as YYYY-MM or YYYY-MM-01 depending on the user's format; preserve what the user uses. 
-    # If the user wants all history, keep the literal value "all_data".
-    # Return JSON only with keys: action, arguments.
-    # """
-    model=DEFAULT_GEMINI_MODEL,
-    tools=[compare_months_tool, flagged_segments_tool, conversion_rate_by_country_device_tool, toolset]
-)
+# ADK objects (FunctionTools, McpToolset, LlmAgent) are built on first use: importing google.adk
+# is most of this module's import time, and the tool functions above don't need it
+_LAZY_AGENT_ATTRS = {
+    "compare_months_tool",
+    "flagged_segments_tool",
+    "conversion_rate_by_country_device_tool",
+    "trend_analysis_tool",
+    "anomaly_detection_tool",
+    "server_params",
+    "toolset",
+    "agent",
+}
+
+
+def _build_agent_parts() -> Dict[str, Any]:
+    from google.adk.agents import LlmAgent
+    from google.adk.tools.function_tool import FunctionTool
+    from google.adk.tools.mcp_tool import McpToolset
+    from google.adk.tools.mcp_tool.mcp_session_manager import (
+        StdioConnectionParams,
+        StreamableHTTPConnectionParams,
+    )
+    from mcp import StdioServerParameters
+
+    # Wrap functions as ADK FunctionTool instances
+    compare_months_tool = FunctionTool(compare_two_months_tool)
+    flagged_segments_tool = FunctionTool(identify_flagged_segments)
+    conversion_rate_by_country_device_tool = FunctionTool(calculate_conversion_rate_by_country_and_device)
+    trend_analysis_tool = FunctionTool(analyze_kpi_trends)
+    anomaly_detection_tool = FunctionTool(find_kpi_anomalies)
+
+    server_params = StdioServerParameters(
+            command=sys.executable,
+            args=[str(SERVER_SCRIPT_PATH)],
+            env=tracing.child_env(),
+        )
+
+    connection_params: StdioConnectionParams | StreamableHTTPConnectionParams = (
+        StreamableHTTPConnectionParams(url=cfg.MCP_SERVER_URL)
+        if cfg.MCP_SERVER_URL
+        else StdioConnectionParams(server_params=server_params)
+    )
+    toolset = McpToolset(
+            connection_params=connection_params,
+            tool_filter=["get_monthly_data", "get_all_data"],
+        )
+
+    agent = LlmAgent(
+        name="ad_performance_agent",
+        description=LLM_AGENT_DESCRIPTION.strip(),
+        instruction=LLM_AGENT_INSTRUCTIONS.strip(),
+        # """
+        # Use tools when needed.
+        # You can do exactly these actions (choose one):
+        # 1) compare_two_months: Compare KPIs between two months for requested dimensions and report % changes.
+        # 2) identify_flagged_segments: Given dimensions (excluding user_country) and a rule name (traffic|conversion), 
+        #    return flagged segments.
+        # 3) conversion_rate_by_country_and_device: For a timeframe, return conversion rate per (user_country, device_type), 
+        #    ordered high->low. 
+        #    Use a month when specified, or use "all_data" when the user asks for all history—do not force a month.
+        #    conversion rate = (total_conversions / total_visitors) for the given timeframe
+
+        # When selecting dimensions, only use these known fields:
+        # traffic_source, medium, device_type, user_country, page_title.
+        # Months are provided as YYYY-MM or YYYY-MM-01 depending on the user's format; preserve what the user uses. 
+        # If the user wants all history, keep the literal value "all_data".
+        # Return JSON only with keys: action, arguments.
+        # """
+        model=_model_name(),
+        tools=[
+            compare_months_tool,
+            flagged_segments_tool,
+            conversion_rate_by_country_device_tool,
+            trend_analysis_tool,
+            anomaly_detection_tool,
+            toolset,
+        ]
+    )
+
+    return {name: value for name, value in locals().items() if name in _LAZY_AGENT_ATTRS}
+
+
+_agent_parts = functools.lru_cache(maxsize=None)(_build_agent_parts)
+
+# ADK's MCP session manager guards its sessions with an asyncio.Lock, which hangs when event loops running
+# concurrently in different threads share it (one asyncio.run per Streamlit session) - one agent per thread
+_THREAD_AGENT = threading.local()
+
+
+def _model_name() -> str:
+    return cfg.GEMINI_MODEL or DEFAULT_GEMINI_MODEL
+
+
+def get_agent() -> Any:
+    """The calling thread's ADK LlmAgent (built on first use in each thread)."""
+    agent = getattr(_THREAD_AGENT, "agent", None)
+    if agent is None:
+        agent = _THREAD_AGENT.agent = _build_agent_parts()["agent"]
+    return agent
+
+
+def __getattr__(name: str) -> Any:
+    # Keeps `agent.agent`, `agent.toolset`, ... working without building them at import time
+    if name in _LAZY_AGENT_ATTRS:
+        return _agent_parts()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def _extract_text_from_event(event: Any) -> str | None:
@@ -506,6 +1090,7 @@ def _parse_agent_json(text: str) -> Dict[str, Any]:
     return {}
 
 
+@tracing.traced("agent.run_adk_agent")
 def run_adk_agent(
         user_message: str,
         *,
@@ -527,7 +1112,9 @@ def run_adk_agent(
     #         "event_count": 0,
     #     }
 
-    runner = InMemoryRunner(agent=agent, app_name="ad_performance_agent")
+    from google.adk.runners import InMemoryRunner
+
+    runner = InMemoryRunner(agent=get_agent(), app_name="ad_performance_agent")
 
     async def _run():
         async_events = await runner.run_debug(
@@ -545,7 +1132,7 @@ def run_adk_agent(
     except Exception as exc:  # noqa: BLE001
         return {
             "error": f"ADK agent failed: {exc}",
-            "model": DEFAULT_GEMINI_MODEL,
+            "model": _model_name(),
             "raw_text": None,
             "event_count": 0,
         }
@@ -561,7 +1148,7 @@ def run_adk_agent(
         
         return {
             "error": f"Empty Response passed to JSON parser: {e}",
-            "model": DEFAULT_GEMINI_MODEL,
+            "model": _model_name(),
             "raw_text": response_text,
             "event_count": len(events),
         }
@@ -570,7 +1157,7 @@ def run_adk_agent(
         logger.exception("Unexpected JSON parse error: %s", e)
         return {
             "error": f"Failed to parse agent JSON: {e}",
-            "model": DEFAULT_GEMINI_MODEL,
+            "model": _model_name(),
             "raw_text": response_text,
             "event_count": len(events),
         }
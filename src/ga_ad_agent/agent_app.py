@@ -1,18 +1,36 @@
-from typing import cast
+import math
+import os
+import time
+from typing import Any, Callable, Dict, List, Tuple, cast
 
 import pandas as pd
 import streamlit as st
 
-from src.constants import DEFAULT_PROJECT, DIMENSION_KEYS, DIMENSIONS
+from src.constants import (
+    DATASET_FIRST_MONTH,
+    DATASET_LAST_MONTH,
+    DEFAULT_MIN_PAGEVIEWS,
+    DEFAULT_PROJECT,
+    DIMENSION_KEYS,
+    DIMENSIONS,
+    KPI_FIELDS,
+)
 from src.ga_ad_agent.agent import (
+    GrainName,
+    ProgressCallback,
     RuleName,
     compare_two_months,
     conversion_rate_by_country_device,
+    detect_anomalies,
     get_all,
     get_month,
     flagged_segments,
     run_adk_agent,
+    trend_analysis,
 )
+from src.ga_ad_agent import tracing
+from src.ga_ad_agent.catalog import AUTO_LIMIT_ROWS, DimensionCatalog, months_between
+from src.ga_ad_agent.result_cache import JobRunner, ResultCache
 
 
 st.set_page_config(page_title="GA Agent", layout="wide")
@@ -22,43 +40,373 @@ st.caption("Requests go through the ADK agent first, then execute via MCP tools.
 # project_id = st.text_input("Billing Project ID", value=DEFAULT_PROJECT)
 project_id = DEFAULT_PROJECT
 
+# Results are shared across reruns and sessions; override TTL via RESULT_CACHE_TTL_SECONDS
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600"))
+POLL_INTERVAL_SECONDS = 0.5
+# Rows per rendered page (and per server-side page for raw KPI fetches)
+PAGE_SIZE = int(os.getenv("UI_PAGE_SIZE", "100"))
+RAW_JSON_MAX_ROWS = 20
+
+
+@st.cache_resource
+def _get_job_runner() -> JobRunner:
+    """One runner (thread pool + result cache) per Streamlit server process."""
+    return JobRunner(ResultCache(ttl_seconds=RESULT_CACHE_TTL_SECONDS))
+
+
+runner = _get_job_runner()
+
 
 def _log_mcp_tool(tool_name: str):
     """Flow-visualizer style log for MCP tool execution."""
     st.info(f"Agent used MCP tool: {tool_name}")
 
 
-def _render_compare(r, dimensions):
+def _render_dimension_helper(dims: List[str], months: List[str], key: str, periods: int = 1):
+    """
+    Result-size estimate + value autocompletion from the local dimension catalog (no BigQuery call).
+    """
+    catalog = DimensionCatalog.from_env()
+    if not catalog.months:
+        st.caption("Dimension catalog not built yet - run the `refresh_dimension_catalog` MCP tool for estimates.")
+        return
+
+    estimate = catalog.estimate_rows(dims, months, min_pageviews=DEFAULT_MIN_PAGEVIEWS, periods=periods)
+    if estimate is not None and dims:
+        distinct = ", ".join(f"{d} ~{catalog.distinct(d, months):,}" for d in dims)
+        message = f"Estimated result: up to ~{estimate:,} rows (distinct values: {distinct})"
+        if estimate > AUTO_LIMIT_ROWS:
+            st.warning(message + " - consider fewer dimensions.")
+        else:
+            st.caption(message)
+
+    with st.expander("Browse dimension values"):
+        dim = st.selectbox("Dimension", dims or DIMENSION_KEYS, key=f"catalog_dim::{key}")
+        prefix = st.text_input("Value starts with / contains", key=f"catalog_prefix::{key}")
+        suggestions = catalog.suggest(dim, prefix, months=[m for m in months if m in catalog.months], limit=50)
+        st.dataframe(pd.DataFrame(suggestions, columns=[dim, "pageviews"]), use_container_width=True)
+
+
+def _page_rows(rows: List[Dict[str, Any]], key: str) -> List[Dict[str, Any]]:
+    """Client-side page over an already computed result - only the visible page reaches the browser."""
+    total = len(rows)
+    pages = max(1, math.ceil(total / PAGE_SIZE))
+    page = 1
+    if pages > 1:
+        page = int(st.number_input(f"Page (1-{pages})", min_value=1, max_value=pages, value=1, key=f"page::{key}"))
+
+    start = (page - 1) * PAGE_SIZE
+    end = min(start + PAGE_SIZE, total)
+    st.caption(f"Rows {start + 1 if total else 0}-{end} of {total}")
+    return rows[start:end]
+
+
+def _render_raw_json(r: Dict[str, Any], key: str):
+    """Raw response on demand only, with rows truncated to keep the browser responsive."""
+    if not st.checkbox("Show raw JSON", key=f"raw::{key}"):
+        return
+
     rows = r.get("rows", [])
+    if len(rows) > RAW_JSON_MAX_ROWS:
+        r = {**r, "rows": rows[:RAW_JSON_MAX_ROWS], "rows_truncated": len(rows) - RAW_JSON_MAX_ROWS}
+    st.json(r, expanded=False)
+
+
+def _render_compare(r, dimensions, key: str):
     flat = []
-    for row in rows:
+    for row in _page_rows(r.get("rows", []), key):
         base = {d: row.get(d) for d in dimensions}
         pct = row.get("pct_change", {})
         flat.append({**base, **pct})
     df = pd.DataFrame(flat)
     st.dataframe(df, use_container_width=True)
-    st.json(r)
+    _render_raw_json(r, key)
 
 
-def _render_flagged(r):
-    df = pd.DataFrame(r.get("rows", []))
+def _render_flagged(r, key: str):
+    df = pd.DataFrame(_page_rows(r.get("rows", []), key))
     st.dataframe(df, use_container_width=True)
-    st.json(r)
+    _render_raw_json(r, key)
 
 
-def _render_conversion(r):
-    df = pd.DataFrame(r.get("rows", []))
+def _render_conversion(r, key: str):
+    df = pd.DataFrame(_page_rows(r.get("rows", []), key))
     st.dataframe(df, use_container_width=True)
-    st.json(r)
+    _render_raw_json(r, key)
 
 
-def _render_kpis(r):
-    """Generic renderer for raw KPI outputs."""
-    df = pd.DataFrame(r.get("rows", []))
-    st.dataframe(df, use_container_width=True)
-    st.json(r)
+def _render_trends(r, dimensions, key: str):
+    """Growth ranking table + rolling-average lines of the ranked KPI for the visible page of segments."""
+    kpi = r.get("kpi")
+    st.caption(
+        f"{r.get('segment_count', 0)} segments over {len(r.get('periods', []))} {r.get('grain')} periods, "
+        f"ranked by growth of {kpi} (rolling window {r.get('window')})"
+    )
+    rows = _page_rows(r.get("rows", []), key)
+    flat = []
+    lines = {}
+    for row in rows:
+        label = " / ".join(str(row.get(d)) for d in dimensions)
+        flat.append({"rank": row.get("rank"), **{d: row.get(d) for d in dimensions}, **(row.get("growth") or {})})
+        lines[label] = (row.get("rolling_avg") or {}).get(kpi)
+    st.dataframe(pd.DataFrame(flat), use_container_width=True)
+    if lines:
+        st.line_chart(pd.DataFrame(lines, index=r.get("periods")))
+    _render_raw_json(r, key)
+
+
+def _render_anomalies(r, key: str):
+    scanned, total = r.get("segments_scanned", 0), r.get("segment_count", 0)
+    st.caption(
+        f"{r.get('anomaly_count', 0)} anomalies (|z| >= {r.get('z_threshold')}) in {scanned}/{total} segments, "
+        f"scored in {r.get('scan_seconds', 0.0):.1f}s"
+    )
+    if r.get("truncated"):
+        st.warning("Time budget reached - the smallest segments were not scanned.")
+    st.dataframe(pd.DataFrame(_page_rows(r.get("rows", []), key)), use_container_width=True)
+    _render_raw_json(r, key)
+
+
+def _render_kpis(r, key: str, on_page: Callable[[int], None] | None = None):
+    """
+    Generic renderer for raw KPI outputs.
+    Server-paged responses (see `page` in the MCP tool output) get Previous/Next controls via on_page(offset).
+    """
+    page = r.get("page") or {}
+    rows = r.get("rows", [])
+    if on_page is None or not page.get("limit"):
+        st.dataframe(pd.DataFrame(_page_rows(rows, key)), use_container_width=True)
+        _render_raw_json(r, key)
+        return
+
+    offset = page.get("offset", 0)
+    total = page.get("total_row_count")
+    st.caption(
+        f"Rows {offset + 1 if rows else offset}-{offset + len(rows)} of {total if total is not None else '?'} "
+        f"(ordered by {page.get('order_by')})"
+    )
+    st.dataframe(pd.DataFrame(rows), use_container_width=True)
+
+    col_prev, col_next = st.columns(2)
+    with col_prev:
+        if st.button("Previous page", key=f"prev::{key}", disabled=offset == 0):
+            on_page(max(offset - page["limit"], 0))
+    with col_next:
+        if st.button("Next page", key=f"next::{key}", disabled=not page.get("has_more")):
+            on_page(offset + page["limit"])
+    _render_raw_json(r, key)
+
+
+def _render_partial(stage: str, r: Dict[str, Any]):
+    """Lightweight preview of an intermediate result (first page only, no JSON dump)."""
+    rows = r.get("rows", [])
+    with st.expander(f"Partial result - {stage} ({r.get('row_count', len(rows))} rows)", expanded=True):
+        st.dataframe(pd.DataFrame(rows[:PAGE_SIZE]), use_container_width=True)
+
+
+def _render_result(
+        action: str,
+        r: Dict[str, Any],
+        args: Dict[str, Any],
+        key: str,
+        on_page: Callable[[int], None] | None = None,
+):
+    if action == "compare_two_months":
+        _render_compare(r, args["dimensions"], key)
+    elif action == "identify_flagged_segments":
+        _render_flagged(r, key)
+    elif action == "conversion_rate_by_country_and_device":
+        _render_conversion(r, key)
+    elif action == "trend_analysis":
+        _render_trends(r, args["dimensions"], key)
+    elif action == "detect_anomalies":
+        _render_anomalies(r, key)
+    else:
+        _render_kpis(r, key, on_page=on_page)
+
+
+def _prepare_action(action: str, args: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    """
+    Validate + normalize agent/manual arguments into the canonical form used as cache key.
+    Returns (arguments, mcp_tool_name).
+    """
+    if action == "compare_two_months":
+        month_a = args.get("month_a")
+        month_b = args.get("month_b")
+        if not (month_a and month_b):
+            raise ValueError("compare_two_months requires month_a and month_b")
+        dims = list(args.get("dimensions") or DIMENSIONS)
+        return {"month_a": month_a, "month_b": month_b, "dimensions": dims}, "get_monthly_data"
+    if action == "identify_flagged_segments":
+        return {"rule": args.get("rule", "traffic")}, "get_all_data"
+    if action == "conversion_rate_by_country_and_device":
+        month = args.get("month") or args.get("month_a") or args.get("month_b")
+        if not month:
+            raise ValueError("conversion_rate_by_country_and_device requires month")
+        return {"month": month}, "get_monthly_data"
+    if action == "trend_analysis":
+        dims = list(args.get("dimensions") or ["device_type", "medium"])
+        kpi = args.get("kpi") or "total_pageviews"
+        if kpi not in KPI_FIELDS:
+            raise ValueError(f"trend_analysis kpi must be one of {KPI_FIELDS}")
+        return {
+            "dimensions": dims,
+            "kpi": kpi,
+            "grain": args.get("grain") or "month",
+            "start_month": args.get("start_month") or DATASET_FIRST_MONTH,
+            "end_month": args.get("end_month") or DATASET_LAST_MONTH,
+            "window": int(args.get("window") or 3),
+            "top_n": int(args.get("top_n") or 20),
+        }, "get_trend_data"
+    if action == "detect_anomalies":
+        kpis = list(args.get("kpis") or ["total_pageviews", "total_conversions"])
+        unknown = [k for k in kpis if k not in KPI_FIELDS]
+        if unknown:
+            raise ValueError(f"detect_anomalies kpis must be a subset of {KPI_FIELDS}")
+        return {
+            "dimensions": list(args.get("dimensions") or ["traffic_source", "medium", "device_type"]),
+            "kpis": kpis,
+            "start_month": args.get("start_month") or DATASET_FIRST_MONTH,
+            "end_month": args.get("end_month") or DATASET_LAST_MONTH,
+            "z_threshold": float(args.get("z_threshold") or 3.5),
+            "top_n": int(args.get("top_n") or 50),
+        }, "get_trend_data"
+    # Raw KPI fetches are paged server-side so only one page is transferred and rendered
+    min_pageviews = args.get("min_pageviews")  # null from the agent means "not given", as in _query_option_args
+    page = {
+        "limit": int(args.get("limit") or PAGE_SIZE),
+        "offset": int(args.get("offset") or 0),
+        "order_by": args.get("order_by") or "total_pageviews",
+        "min_pageviews": DEFAULT_MIN_PAGEVIEWS if min_pageviews is None else int(min_pageviews),
+    }
+    if action == "get_monthly_data":
+        month = args.get("month")
+        if not month:
+            raise ValueError("get_monthly_data requires month (YYYY-MM)")
+        dims = list(args.get("dimensions") or DIMENSION_KEYS)
+        return {"month": month, "dimensions": dims, **page}, "get_monthly_data"
+    if action == "get_all_data":
+        return {"dimensions": list(args.get("dimensions") or DIMENSION_KEYS), **page}, "get_all_data"
+    raise ValueError(f"Unsupported action returned by agent: {action}")
 
 
+def _execute_action(action: str, args: Dict[str, Any], progress: ProgressCallback) -> Dict[str, Any]:
+    """Runs on the background worker - must not call Streamlit APIs."""
+    if action == "compare_two_months":
+        return compare_two_months(
+            args["month_a"], args["month_b"], args["dimensions"], project_id=project_id, progress=progress
+        )
+    if action == "identify_flagged_segments":
+        return flagged_segments(cast(RuleName, args["rule"]), project_id=project_id, progress=progress)
+    if action == "conversion_rate_by_country_and_device":
+        return conversion_rate_by_country_device(args["month"], project_id=project_id, progress=progress)
+    if action == "trend_analysis":
+        return trend_analysis(
+            args["dimensions"],
+            kpi=args["kpi"],
+            grain=cast(GrainName, args["grain"]),
+            start_month=args["start_month"],
+            end_month=args["end_month"],
+            window=args["window"],
+            top_n=args["top_n"],
+            project_id=project_id,
+            progress=progress,
+        )
+    if action == "detect_anomalies":
+        return detect_anomalies(
+            args["dimensions"],
+            kpis=args["kpis"],
+            start_month=args["start_month"],
+            end_month=args["end_month"],
+            z_threshold=args["z_threshold"],
+            top_n=args["top_n"],
+            project_id=project_id,
+            progress=progress,
+        )
+    if action == "get_monthly_data":
+        progress("fetch_month", 0.05, None)
+        return get_month(
+            args["month"],
+            args["dimensions"],
+            project_id=project_id,
+            limit=args["limit"],
+            offset=args["offset"],
+            order_by=args["order_by"],
+            min_pageviews=args["min_pageviews"],
+        )
+    if action == "get_all_data":
+        progress("fetch_all_data", 0.05, None)
+        return get_all(
+            args["dimensions"],
+            project_id=project_id,
+            limit=args["limit"],
+            offset=args["offset"],
+            order_by=args["order_by"],
+            min_pageviews=args["min_pageviews"],
+        )
+    raise ValueError(f"Unsupported action: {action}")
+
+
+def _submit_action(slot: str, action: str, args: Dict[str, Any]) -> None:
+    """Validate, then hand the action to the background runner; the job id is kept in session_state[slot]."""
+    arguments, tool_name = _prepare_action(action, args)
+    _log_mcp_tool(tool_name)
+    job = runner.submit(
+        action,
+        arguments,
+        lambda progress: _execute_action(action, arguments, progress),
+        refresh=st.session_state.get("bypass_cache", False),
+    )
+    st.session_state[slot] = job.job_id
+
+
+def _render_job(slot: str) -> bool:
+    """
+    Render the job referenced by session_state[slot].
+    Returns True while the job is still running (caller schedules another poll).
+    """
+    job = runner.get(st.session_state.get(slot))
+    if job is None:
+        return False
+
+    if job.status == "error":
+        st.error(f"Failed to execute action: {job.error}")
+        return False
+
+    if job.status == "done":
+        if job.from_cache:
+            st.caption(f"{job.action}: served from cache")
+        else:
+            st.caption(f"{job.action}: computed in {job.elapsed:.1f}s")
+
+        def _goto(offset: int):
+            _submit_action(slot, job.action, {**job.arguments, "offset": offset})
+            st.rerun()
+
+        with tracing.attach(job.traceparent), tracing.span("ui.render", action=job.action, from_cache=job.from_cache):
+            _render_result(job.action, job.result or {}, job.arguments, key=f"{slot}::{job.job_id}", on_page=_goto)
+        return False
+
+    st.progress(job.progress, text=f"{job.action}: {job.stage} ({job.elapsed:.0f}s)")
+    for stage, partial in list(job.partials.items()):
+        _render_partial(stage, partial)
+    return True
+
+
+with st.sidebar:
+    st.subheader("Result cache")
+    st.checkbox("Bypass cache (force refresh)", key="bypass_cache")
+    if st.button("Clear cached results"):
+        runner.cache.invalidate()
+    st.json(runner.cache.stats())
+
+    st.subheader("Dimension catalog")
+    catalog_months = sorted(DimensionCatalog.from_env().months)
+    catalog_range = f": {catalog_months[0]}..{catalog_months[-1]}" if catalog_months else ""
+    st.caption(f"{len(catalog_months)} month(s) cataloged{catalog_range}")
+
+polling = False
+
 st.subheader("Ask the LLM Agent Controller")
 default_prompt = f"""
 Compare August 2016 to July 2017 by device_type and traffic_source. \n
@@ -68,65 +416,39 @@ Calculate the conversion rate by country & device type for the month of 01-2017.
 user_prompt = st.text_area("Describe what you want to analyze", value=default_prompt)
 
 if st.button("Run agent", type="primary"):
-    with st.spinner("Running ADK agent..."):
-        agent_out = run_adk_agent(user_prompt)
+    # Root span of the whole prompt -> agent -> action -> MCP -> BigQuery trace
+    with tracing.span("ui.prompt", prompt_chars=len(user_prompt)):
+        with st.spinner("Running ADK agent..."):
+            agent_out = run_adk_agent(user_prompt)
+
+        st.session_state["agent_out"] = agent_out
+        st.session_state.pop("agent_job", None)
+        action = agent_out.get("action")
+        if action and not agent_out.get("error"):
+            try:
+                _submit_action("agent_job", action, agent_out.get("arguments") or {})
+            except Exception as exc:
+                st.session_state["agent_submit_error"] = str(exc)
+            else:
+                st.session_state.pop("agent_submit_error", None)
 
+agent_out = st.session_state.get("agent_out")
+if agent_out is not None:
     st.write("Agent output (parsed + raw):")
     st.json(agent_out)
 
+    action = agent_out.get("action")
     if agent_out.get("error"):
         st.error(agent_out["error"])
         if agent_out.get("model"):
             st.info(f"Model used: {agent_out['model']} (set GEMINI_MODEL to override)")
-        st.stop()
-
-    action = agent_out.get("action")
-    args = agent_out.get("arguments") or {}
-
-    if not action:
+    elif not action:
         st.error("Agent did not return an action. Please refine your request.")
+    elif st.session_state.get("agent_submit_error"):
+        st.error(f"Failed to execute action: {st.session_state['agent_submit_error']}")
     else:
         st.success(f"Agent chose action: {action}")
-        with st.spinner("Executing selected action..."):
-            try:
-                if action == "compare_two_months":
-                    _log_mcp_tool("get_monthly_data")
-                    month_a = args.get("month_a")
-                    month_b = args.get("month_b")
-                    dims = args.get("dimensions") or DIMENSIONS
-                    if not (month_a and month_b):
-                        raise ValueError("compare_two_months requires month_a and month_b")
-                    res = compare_two_months(month_a, month_b, dims, project_id=project_id)
-                    _render_compare(res, dims)
-                elif action == "identify_flagged_segments":
-                    _log_mcp_tool("get_all_data")
-                    rule = cast(RuleName, args.get("rule", "traffic"))
-                    res = flagged_segments(rule, project_id=project_id)
-                    _render_flagged(res)
-                elif action == "conversion_rate_by_country_and_device":
-                    _log_mcp_tool("get_monthly_data")
-                    month = args.get("month") or args.get("month_a") or args.get("month_b")
-                    if not month:
-                        raise ValueError("conversion_rate_by_country_and_device requires month")
-                    res = conversion_rate_by_country_device(month, project_id=project_id)
-                    _render_conversion(res)
-                elif action == "get_monthly_data":
-                    _log_mcp_tool("get_monthly_data")
-                    month = args.get("month")
-                    dims = args.get("dimensions") or DIMENSION_KEYS
-                    if not month:
-                        raise ValueError("get_monthly_data requires month (YYYY-MM)")
-                    res = get_month(month, dims, project_id=project_id)
-                    _render_kpis(res)
-                elif action == "get_all_data":
-                    _log_mcp_tool("get_all_data")
-                    dims = args.get("dimensions") or DIMENSION_KEYS
-                    res = get_all(dims, project_id=project_id)
-                    _render_kpis(res)
-                else:
-                    st.error(f"Unsupported action returned by agent: {action}")
-            except Exception as exc:
-                st.error(f"Failed to execute action: {exc}")
+        polling = _render_job("agent_job") or polling
 
 st.divider()
 st.subheader("Use Logical Controls (Agent Tools)")
@@ -137,33 +459,105 @@ task = st.selectbox(
         "Compare two months (% change per KPI)",
         "Flag segments by rule (traffic/conversion)",
         "Conversion rate by country × device (month)",
+        "KPI trends across months/days (growth ranking)",
+        "Daily anomalies per segment (robust z-score)",
     ],
 )
+manual_slot = f"manual_job::{task}"
+
+try:
+    if task == "Compare two months (% change per KPI)":
+        colA, colB = st.columns(2)
+        with colA:
+            month_a = st.text_input("Month A (YYYY-MM)", value="2017-07")
+        with colB:
+            month_b = st.text_input("Month B (YYYY-MM)", value="2016-08")
+
+        dims = st.multiselect("Dimensions", DIMENSION_KEYS, default=DIMENSIONS)
+        _render_dimension_helper(dims, [month_a], key="compare")
+
+        if st.button("Run comparison (manual)"):
+            _submit_action(
+                manual_slot, "compare_two_months", {"month_a": month_a, "month_b": month_b, "dimensions": dims}
+            )
+
+    elif task == "Flag segments by rule (traffic/conversion)":
+        rule = cast(RuleName, st.selectbox("Rule", ["traffic", "conversion"]))
+        if st.button("Run flagging (manual)"):
+            _submit_action(manual_slot, "identify_flagged_segments", {"rule": rule})
+
+    elif task == "KPI trends across months/days (growth ranking)":
+        dims = st.multiselect("Dimensions", DIMENSION_KEYS, default=["device_type", "medium"])
+        col_kpi, col_grain, col_window, col_top = st.columns(4)
+        with col_kpi:
+            kpi = st.selectbox("Rank by KPI", KPI_FIELDS, index=KPI_FIELDS.index("total_pageviews"))
+        with col_grain:
+            grain = st.selectbox("Grain", ["month", "day"])
+        with col_window:
+            window = st.number_input("Rolling window (periods)", min_value=1, value=3 if grain == "month" else 7)
+        with col_top:
+            top_n = st.number_input("Top segments", min_value=1, max_value=1000, value=20)
+        col_start, col_end = st.columns(2)
+        with col_start:
+            start_month = st.text_input("From month (YYYY-MM)", value=DATASET_FIRST_MONTH)
+        with col_end:
+            end_month = st.text_input("To month (YYYY-MM)", value=DATASET_LAST_MONTH)
+        trend_months = months_between(start_month, end_month)
+        _render_dimension_helper(
+            dims, trend_months, key="trend", periods=len(trend_months) if grain == "month" else 30 * len(trend_months)
+        )
+
+        if st.button("Run trend analysis (manual)"):
+            _submit_action(
+                manual_slot,
+                "trend_analysis",
+                {
+                    "dimensions": dims,
+                    "kpi": kpi,
+                    "grain": grain,
+                    "start_month": start_month,
+                    "end_month": end_month,
+                    "window": int(window),
+                    "top_n": int(top_n),
+                },
+            )
+
+    elif task == "Daily anomalies per segment (robust z-score)":
+        dims = st.multiselect("Dimensions", DIMENSION_KEYS, default=["traffic_source", "medium", "device_type"])
+        kpis = st.multiselect("KPIs", KPI_FIELDS, default=["total_pageviews", "total_conversions"])
+        col_start, col_end, col_z = st.columns(3)
+        with col_start:
+            start_month = st.text_input("From month (YYYY-MM)", value=DATASET_FIRST_MONTH)
+        with col_end:
+            end_month = st.text_input("To month (YYYY-MM)", value=DATASET_LAST_MONTH)
+        with col_z:
+            z_threshold = st.number_input("|z| threshold", min_value=1.0, value=3.5, step=0.5)
+        anomaly_months = months_between(start_month, end_month)
+        _render_dimension_helper(dims, anomaly_months, key="anomaly", periods=30 * len(anomaly_months))
+
+        if st.button("Detect anomalies (manual)"):
+            _submit_action(
+                manual_slot,
+                "detect_anomalies",
+                {
+                    "dimensions": dims,
+                    "kpis": kpis,
+                    "start_month": start_month,
+                    "end_month": end_month,
+                    "z_threshold": float(z_threshold),
+                },
+            )
+
+    else:
+        month = st.text_input("Month (YYYY-MM)", value="2017-08")
+        if st.button("Compute conversion rates (manual)"):
+            _submit_action(manual_slot, "conversion_rate_by_country_and_device", {"month": month})
+except Exception as exc:
+    st.error(f"Failed to execute action: {exc}")
+
+polling = _render_job(manual_slot) or polling
 
-if task == "Compare two months (% change per KPI)":
-    colA, colB = st.columns(2)
-    with colA:
-        month_a = st.text_input("Month A (YYYY-MM)", value="2017-07")
-    with colB:
-        month_b = st.text_input("Month B (YYYY-MM)", value="2016-08")
-
-    dims = st.multiselect("Dimensions", DIMENSION_KEYS, default=DIMENSIONS)
-
-    if st.button("Run comparison (manual)"):
-        _log_mcp_tool("get_monthly_data")
-        res = compare_two_months(month_a, month_b, dims, project_id=project_id)
-        _render_compare(res, dims)
-
-elif task == "Flag segments by rule (traffic/conversion)":
-    rule = cast(RuleName, st.selectbox("Rule", ["traffic", "conversion"]))
-    if st.button("Run flagging (manual)"):
-        _log_mcp_tool("get_all_data")
-        res = flagged_segments(rule, project_id=project_id)
-        _render_flagged(res)
-
-else:
-    month = st.text_input("Month (YYYY-MM)", value="2017-08")
-    if st.button("Compute conversion rates (manual)"):
-        _log_mcp_tool("get_monthly_data")
-        res = conversion_rate_by_country_device(month, project_id=project_id)
-        _render_conversion(res)
+# Background jobs still running -> poll again shortly (partial results re-render on each pass)
+if polling:
+    time.sleep(POLL_INTERVAL_SECONDS)
+    st.rerun()
@@ -0,0 +1,195 @@
+"""
+Batch anomaly detection over daily (segment x day) KPI matrices.
+
+Per segment, a weekly seasonal baseline (median of the same weekday) is removed and the residuals are
+scored with a robust z-score: z = 0.6745 * (r - median(r)) / MAD(r), falling back to the mean absolute
+deviation (scaled by 1.2533) when MAD is 0. For count KPIs the scale never drops below the Poisson noise
+level sqrt(median count), so low-traffic segments don't flag every +-1 wobble.
+Segments are processed in batches in volume order (the order `get_trend_data` returns them), so a time
+budget cuts off the smallest segments first.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.ga_ad_agent.segment_store import KPI_DTYPES
+from src.ga_ad_agent.trend import SegmentTrends
+
+logger = logging.getLogger("ga-kpi-client")
+
+MAD_SCALE = 0.6745  # MAD -> standard deviation for normal data
+MEAN_AD_SCALE = 1.2533  # mean absolute deviation -> standard deviation for normal data
+DEFAULT_Z_THRESHOLD = 3.5
+DEFAULT_BATCH_SEGMENTS = 2_000
+
+
+@dataclass
+class AnomalyScan:
+    """Flat arrays of every anomaly found (one entry per segment x day x KPI) plus scan bookkeeping."""
+
+    segment_ids: np.ndarray
+    period_idx: np.ndarray
+    kpi_idx: np.ndarray
+    z: np.ndarray
+    values: np.ndarray
+    baselines: np.ndarray
+    segments_scanned: int
+    segments_total: int
+    elapsed: float
+
+    @property
+    def truncated(self) -> bool:
+        return self.segments_scanned < self.segments_total
+
+
+def weekday_baseline(values: np.ndarray, weekdays: np.ndarray) -> np.ndarray:
+    """Seasonal baseline per cell: NaN-aware median of the segment's values on the same weekday."""
+    baseline = np.full(values.shape, np.nan)
+    for wd in np.unique(weekdays):
+        cols = weekdays == wd
+        block = values[:, cols]
+        has_data = (~np.isnan(block)).any(axis=1)
+        med = np.full(len(values), np.nan)
+        if has_data.any():
+            med[has_data] = np.nanmedian(block[has_data], axis=1)
+        baseline[:, cols] = med[:, None]
+    return baseline
+
+
+def robust_z(residuals: np.ndarray, scale_floor: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Row-wise robust z-score, optionally with a per-row minimum scale.
+    NaN where the segment has no spread at all (flat series) or no data.
+    """
+    z = np.full(residuals.shape, np.nan)
+    has_data = (~np.isnan(residuals)).any(axis=1)
+    if not has_data.any():
+        return z
+
+    r = residuals[has_data]
+    center = np.nanmedian(r, axis=1)[:, None]
+    dev = np.abs(r - center)
+    mad = np.nanmedian(dev, axis=1)
+    mean_ad = np.nanmean(dev, axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scale = np.where(mad > 0, mad / MAD_SCALE, mean_ad * MEAN_AD_SCALE)
+        if scale_floor is not None:
+            scale = np.maximum(scale, scale_floor[has_data])
+        scored = (r - center) / scale[:, None]
+    scored[scale == 0] = np.nan
+    z[has_data] = scored
+    return z
+
+
+def scan_anomalies(
+        trends: SegmentTrends,
+        kpis: Sequence[str],
+        z_threshold: float = DEFAULT_Z_THRESHOLD,
+        min_active_days: int = 14,
+        time_budget_seconds: Optional[float] = None,
+        batch_segments: int = DEFAULT_BATCH_SEGMENTS,
+) -> AnomalyScan:
+    """
+    Score every (segment, day) cell of every KPI in batches of `batch_segments` segments.
+    Segments with fewer than `min_active_days` days of data (count > 0 / non-NULL average) are skipped.
+    Stops starting new batches once `time_budget_seconds` is used up.
+    """
+    start = time.perf_counter()
+    weekdays = pd.to_datetime(pd.Index(trends.periods)).dayofweek.to_numpy()
+    found: Dict[str, List[np.ndarray]] = {k: [] for k in ("seg", "col", "kpi", "z", "value", "baseline")}
+
+    scanned = 0
+    for lo in range(0, len(trends), batch_segments):
+        if time_budget_seconds is not None and time.perf_counter() - start >= time_budget_seconds:
+            logger.warning(
+                "scan_anomalies: time budget %.1fs used after %d/%d segments", time_budget_seconds, lo, len(trends)
+            )
+            break
+
+        hi = min(lo + batch_segments, len(trends))
+        for ki, k in enumerate(kpis):
+            values = trends.matrix_slice(k, lo, hi)
+            is_avg = KPI_DTYPES.get(k) is np.float64
+            active = (~np.isnan(values) if is_avg else values > 0).sum(axis=1) >= min_active_days
+
+            baseline = weekday_baseline(values, weekdays)
+            floor = None
+            if not is_avg:
+                with np.errstate(invalid="ignore"):
+                    floor = np.sqrt(np.maximum(np.nan_to_num(np.nanmedian(values, axis=1)), 1.0))
+            z = robust_z(values - baseline, floor)
+            z[~active] = np.nan
+
+            with np.errstate(invalid="ignore"):
+                seg, col = np.nonzero(np.abs(z) >= z_threshold)
+            found["seg"].append(seg + lo)
+            found["col"].append(col)
+            found["kpi"].append(np.full(len(seg), ki))
+            found["z"].append(z[seg, col])
+            found["value"].append(values[seg, col])
+            found["baseline"].append(baseline[seg, col])
+        scanned = hi
+
+    def _cat(name: str, dtype: Any) -> np.ndarray:
+        return np.concatenate(found[name]) if found[name] else np.empty(0, dtype=dtype)
+
+    scan = AnomalyScan(
+        segment_ids=_cat("seg", np.int64),
+        period_idx=_cat("col", np.int64),
+        kpi_idx=_cat("kpi", np.int64),
+        z=_cat("z", np.float64),
+        values=_cat("value", np.float64),
+        baselines=_cat("baseline", np.float64),
+        segments_scanned=scanned,
+        segments_total=len(trends),
+        elapsed=time.perf_counter() - start,
+    )
+    logger.info(
+        "scan_anomalies: segments=%d/%d anomalies=%d elapsed=%.2fs",
+        scan.segments_scanned,
+        scan.segments_total,
+        len(scan.z),
+        scan.elapsed,
+    )
+    return scan
+
+
+def rank_anomalies(
+        trends: SegmentTrends,
+        scan: AnomalyScan,
+        kpis: Sequence[str],
+        top_n: Optional[int],
+) -> List[Dict[str, Any]]:
+    """Output rows for the top_n anomalies by |z| (ties: earlier segment / day first)."""
+    order = np.lexsort((scan.period_idx, scan.segment_ids, -np.abs(scan.z)))
+    if top_n is not None:
+        order = order[:top_n]
+
+    segments = trends.segments.iloc[scan.segment_ids[order]]
+    seg_records = segments.astype(object).where(segments.notna(), None).to_dict("records")
+    out = []
+    for rank, (i, seg) in enumerate(zip(order.tolist(), seg_records), start=1):
+        kpi = kpis[int(scan.kpi_idx[i])]
+        z = float(scan.z[i])
+        baseline = float(scan.baselines[i])
+        value = float(scan.values[i])
+        if KPI_DTYPES.get(kpi) is np.int64:
+            value = int(value)
+        out.append(
+            {
+                **seg,
+                "rank": rank,
+                "date": trends.periods[int(scan.period_idx[i])],
+                "kpi": kpi,
+                "value": value,
+                "baseline": None if np.isnan(baseline) else baseline,
+                "robust_z": z,
+                "direction": "spike" if z > 0 else "drop",
+            }
+        )
+    return out
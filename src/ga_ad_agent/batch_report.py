@@ -0,0 +1,381 @@
+"""
+Offline batch report: every month-over-month comparison, flagged-segment rule and conversion-rate table of a
+report spec in one run, written as Parquet or CSV files.
+
+Spec (JSON):
+{
+  "months": ["2016-08", "2016-09", ...],                    # default: the whole dataset
+  "dimension_sets": [["traffic_source"], ["medium", "device_type"]],
+  "rules": ["traffic", "conversion"],                       # flagged_segments per set without user_country
+  "conversion_rate": true,                                  # per month, by (user_country, device_type)
+  "project_id": "..."                                       # default: DEFAULT_PROJECT
+}
+
+Analyses (one output file each, under <out>/<kind>/):
+  compare/<dims>__<month_a>_vs_<month_b>   consecutive months, per dimension set
+  flagged/<rule>__<dims>                   all data, per rule and dimension set
+  conversion/<month>
+The fetch plan is the distinct set of KPI results behind them: every month is fetched once per dimension set
+(not once per pair), a (user_country, device_type) set is shared with the conversion tables, and both rules
+share one all-data fetch per set (the conversion rule's pageview floor also holds locally).
+Fetches run on a thread pool, slowest (all-data) first, and are checkpointed as Parquet under <out>/fetches/
+as they finish; each analysis is computed as soon as its inputs are there. Re-running the same command skips
+finished outputs and checkpointed fetches, so an interrupted report resumes where it stopped.
+
+  python -m src.ga_ad_agent.batch_report report_spec.json --out reports/full --workers 8
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.constants import DEFAULT_PROJECT, DIMENSION_KEYS, KPI_FIELDS
+from src.ga_ad_agent.agent import RuleName, flag_rule, get_all, get_month
+from src.ga_ad_agent.catalog import months_between
+from src.ga_ad_agent.segment_join import SegmentColumns, compare_segments
+from src.ga_ad_agent.segment_store import KPI_DTYPES, SegmentStore
+
+logger = logging.getLogger("ga-kpi-client")
+
+CONVERSION_DIMENSIONS: Tuple[str, ...] = ("user_country", "device_type")
+RULES: Tuple[str, ...] = ("traffic", "conversion")
+OUTPUT_FORMATS: Tuple[str, ...] = ("parquet", "csv")
+DEFAULT_WORKERS = 8
+MANIFEST_NAME = "manifest.json"
+
+
+def _canonical_dimensions(dimensions: Sequence[str]) -> Tuple[str, ...]:
+    unknown = [d for d in dimensions if d not in DIMENSION_KEYS]
+    if unknown:
+        raise ValueError(f"Unknown dimensions: {unknown}. Allowed: {DIMENSION_KEYS}")
+    if not dimensions:
+        raise ValueError("A dimension set needs at least one dimension")
+    return tuple(d for d in DIMENSION_KEYS if d in dimensions)
+
+
+@dataclass
+class ReportSpec:
+    months: List[str]
+    dimension_sets: List[Tuple[str, ...]]
+    rules: List[str] = field(default_factory=list)
+    conversion_rate: bool = True
+    project_id: str = DEFAULT_PROJECT
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ReportSpec":
+        available = months_between()
+        months = sorted(set(data.get("months") or available))
+        outside = [m for m in months if m not in available]
+        if outside:
+            raise ValueError(f"Months outside the dataset ({available[0]}..{available[-1]}): {outside}")
+
+        rules = list(dict.fromkeys(data.get("rules") or []))
+        unknown = [r for r in rules if r not in RULES]
+        if unknown:
+            raise ValueError(f"Unknown rules: {unknown}. Allowed: {list(RULES)}")
+
+        return cls(
+            months=months,
+            dimension_sets=list(dict.fromkeys(_canonical_dimensions(s) for s in data.get("dimension_sets") or [])),
+            rules=rules,
+            conversion_rate=bool(data.get("conversion_rate", True)),
+            project_id=data.get("project_id") or DEFAULT_PROJECT,
+        )
+
+    @classmethod
+    def load(cls, path: str | os.PathLike) -> "ReportSpec":
+        with open(path, encoding="utf-8") as fh:
+            return cls.from_dict(json.load(fh))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "months": self.months,
+            "dimension_sets": [list(s) for s in self.dimension_sets],
+            "rules": self.rules,
+            "conversion_rate": self.conversion_rate,
+            "project_id": self.project_id,
+        }
+
+
+@dataclass(frozen=True)
+class Fetch:
+    """One KPI result (a get_monthly_data / get_all_data call with allow_large)."""
+
+    scope: str  # "month" | "all"
+    dimensions: Tuple[str, ...]
+    month: Optional[str] = None
+    min_pageviews: Optional[int] = None  # None -> server default
+
+    @property
+    def name(self) -> str:
+        return SegmentStore.table_name(self.scope, self.dimensions, month=self.month, min_pageviews=self.min_pageviews)
+
+
+@dataclass
+class Analysis:
+    kind: str  # "compare" | "flagged" | "conversion"
+    name: str
+    fetches: Tuple[Fetch, ...]
+    params: Dict[str, Any]
+
+
+def plan_report(spec: ReportSpec) -> Tuple[List[Fetch], List[Analysis]]:
+    """Analyses of the spec + the distinct fetches they need (all-data fetches first)."""
+    floors: Dict[Tuple[str, Optional[str], Tuple[str, ...]], List[Optional[int]]] = {}
+
+    def need(scope: str, dims: Tuple[str, ...], month: Optional[str] = None, min_pageviews: Optional[int] = None):
+        key = (scope, month, dims)
+        floors.setdefault(key, []).append(min_pageviews)
+        return key
+
+    planned = []
+    for dims in spec.dimension_sets:
+        label = "+".join(dims)
+        for month_a, month_b in zip(spec.months, spec.months[1:]):
+            keys = (need("month", dims, month_a), need("month", dims, month_b))
+            params = {"dimensions": dims, "month_a": month_a, "month_b": month_b}
+            planned.append(("compare", f"{label}__{month_a}_vs_{month_b}", keys, params))
+
+    for rule in spec.rules:
+        _, floor, _ = flag_rule(rule)
+        for dims in spec.dimension_sets:
+            if "user_country" in dims:
+                logger.warning("batch report: skipping rule=%s for %s (user_country is excluded)", rule, dims)
+                continue
+            keys = (need("all", dims, min_pageviews=floor),)
+            planned.append(("flagged", f"{rule}__{'+'.join(dims)}", keys, {"rule": rule, "dimensions": dims}))
+
+    if spec.conversion_rate:
+        for month in spec.months:
+            planned.append(("conversion", month, (need("month", CONVERSION_DIMENSIONS, month),), {"month": month}))
+
+    # One fetch per (scope, month, dims): the lowest pageview floor serves every analysis (None = server default)
+    fetches = {
+        key: Fetch(key[0], key[2], key[1], None if None in fl else min(x for x in fl if x is not None))
+        for key, fl in floors.items()
+    }
+    analyses = [Analysis(kind, name, tuple(fetches[k] for k in keys), params) for kind, name, keys, params in planned]
+    ordered = sorted(fetches.values(), key=lambda f: f.scope != "all")
+    return ordered, analyses
+
+
+def fetch_frame(fetch: Fetch, project_id: str) -> pd.DataFrame:
+    """
+    Complete KPI result of one fetch as a DataFrame (dimension columns in canonical order + KPIs).
+    Runs at batch priority, so a report never delays interactive users of the same server.
+    """
+    dims = list(fetch.dimensions)
+    options: Dict[str, Any] = {"min_pageviews": fetch.min_pageviews, "allow_large": True, "priority": "batch"}
+    if fetch.scope == "month":
+        data = get_month(fetch.month or "", dims, project_id, **options)
+    else:
+        data = get_all(dims, project_id, **options)
+    if data.get("error") or "rows" not in data:
+        raise RuntimeError(f"Fetch {fetch.name} failed: {data.get('error') or 'response has no rows'}")
+    return pd.DataFrame(data["rows"], columns=[*dims, *KPI_FIELDS])
+
+
+def compare_frame(a: pd.DataFrame, b: pd.DataFrame, dims: Sequence[str], month_a: str, month_b: str) -> pd.DataFrame:
+    comparison = compare_segments(
+        SegmentColumns.from_frame(a, dims, KPI_FIELDS),
+        SegmentColumns.from_frame(b, dims, KPI_FIELDS),
+        dims,
+        KPI_FIELDS,
+    )
+    return comparison.to_frame(month_a, month_b)
+
+
+def flagged_frame(frame: pd.DataFrame, rule: RuleName, dims: Sequence[str]) -> pd.DataFrame:
+    """Rows matching a flagged_segments rule; NULL KPIs count as 0 (as in the interactive tool)."""
+    kpi_keys, _, rule_ok = flag_rule(rule)
+    metrics = frame[KPI_FIELDS].fillna(0).astype({k: KPI_DTYPES[k] for k in KPI_FIELDS})
+    mask = np.asarray(rule_ok({k: metrics[k] for k in KPI_FIELDS}), dtype=bool)
+    out = frame.loc[mask, list(dims)].reset_index(drop=True)
+    for k in kpi_keys:
+        out[k] = metrics.loc[mask, k].to_numpy()
+    return out
+
+
+def conversion_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """conversion_rate = total_conversions / total_visitors (0 without visitors), highest first."""
+    visitors = frame["total_visitors"].fillna(0).astype(np.int64)
+    conversions = frame["total_conversions"].fillna(0).astype(np.int64)
+    out = frame[list(CONVERSION_DIMENSIONS)].copy()
+    out["total_visitors"] = visitors
+    out["total_conversions"] = conversions
+    out["conversion_rate"] = (conversions / visitors.where(visitors != 0)).fillna(0.0)
+    out["total_pageviews"] = frame["total_pageviews"]
+    return out.sort_values("conversion_rate", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def _compute(analysis: Analysis, inputs: List[pd.DataFrame]) -> pd.DataFrame:
+    p = analysis.params
+    if analysis.kind == "compare":
+        return compare_frame(inputs[0], inputs[1], p["dimensions"], p["month_a"], p["month_b"])
+    if analysis.kind == "flagged":
+        return flagged_frame(inputs[0], p["rule"], p["dimensions"])
+    if analysis.kind == "conversion":
+        return conversion_frame(inputs[0])
+    raise ValueError(f"Unknown analysis kind: {analysis.kind}")
+
+
+def _write_atomic(frame: pd.DataFrame, path: Path, fmt: str) -> None:
+    """Temp file + rename, so an interrupted run never leaves a partial file that looks finished."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    os.close(fd)
+    try:
+        if fmt == "parquet":
+            frame.to_parquet(tmp, index=False)
+        else:
+            frame.to_csv(tmp, index=False)
+        os.replace(tmp, path)
+    except Exception:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def run_report(
+        spec: ReportSpec,
+        out_dir: str | os.PathLike,
+        workers: int = DEFAULT_WORKERS,
+        fmt: str = "parquet",
+) -> Dict[str, Any]:
+    """
+    Plan, fetch (concurrently, checkpointed) and compute every analysis of `spec` into `out_dir`.
+    Returns the manifest (also written to <out_dir>/manifest.json); failed fetches are listed under
+    "errors" and the analyses depending on them under "skipped".
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown format: {fmt}. Allowed: {list(OUTPUT_FORMATS)}")
+    out = Path(out_dir)
+    start = time.time()
+    fetches, analyses = plan_report(spec)
+
+    def output_path(a: Analysis) -> Path:
+        return out / a.kind / f"{a.name}.{fmt}"
+
+    def checkpoint_path(f: Fetch) -> Path:
+        return out / "fetches" / f"{f.name}.parquet"
+
+    pending = [a for a in analyses if not output_path(a).exists()]
+    needed = {f for a in pending for f in a.fetches}
+    frames: Dict[Fetch, pd.DataFrame] = {}
+    fetch_stats: List[Dict[str, Any]] = []
+    analysis_stats: List[Dict[str, Any]] = [
+        {"kind": a.kind, "name": a.name, "path": str(output_path(a)), "resumed": True}
+        for a in analyses
+        if a not in pending
+    ]
+    errors: Dict[str, str] = {}
+
+    to_fetch = []
+    for f in fetches:
+        if f not in needed:
+            continue
+        if checkpoint_path(f).exists():
+            frames[f] = pd.read_parquet(checkpoint_path(f))
+            fetch_stats.append({"name": f.name, "rows": len(frames[f]), "seconds": 0.0, "resumed": True})
+        else:
+            to_fetch.append(f)
+    logger.info(
+        "batch report: analyses=%d (done=%d) fetches=%d (checkpointed=%d, to fetch=%d) workers=%d",
+        len(analyses),
+        len(analyses) - len(pending),
+        len(fetches),
+        len(needed) - len(to_fetch),
+        len(to_fetch),
+        workers,
+    )
+
+    def compute_ready() -> None:
+        for a in [a for a in pending if all(f in frames for f in a.fetches)]:
+            t0 = time.time()
+            result = _compute(a, [frames[f] for f in a.fetches])
+            _write_atomic(result, output_path(a), fmt)
+            pending.remove(a)
+            analysis_stats.append(
+                {
+                    "kind": a.kind,
+                    "name": a.name,
+                    "path": str(output_path(a)),
+                    "rows": len(result),
+                    "seconds": round(time.time() - t0, 3),
+                }
+            )
+        # Inputs no pending analysis needs any more are released (page_title sets get large)
+        still_needed = {f for a in pending for f in a.fetches}
+        for f in [f for f in frames if f not in still_needed]:
+            del frames[f]
+
+    def timed_fetch(f: Fetch) -> Tuple[pd.DataFrame, float]:
+        t0 = time.time()
+        return fetch_frame(f, spec.project_id), time.time() - t0
+
+    compute_ready()
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="report-fetch") as pool:
+        futures = {pool.submit(timed_fetch, f): f for f in to_fetch}
+        for fut in as_completed(futures):
+            f = futures[fut]
+            try:
+                frame, seconds = fut.result()
+            except Exception as exc:  # noqa: BLE001
+                logger.exception("batch report: fetch %s failed", f.name)
+                errors[f.name] = str(exc)
+                continue
+            _write_atomic(frame, checkpoint_path(f), "parquet")
+            frames[f] = frame
+            fetch_stats.append({"name": f.name, "rows": len(frame), "seconds": round(seconds, 3), "resumed": False})
+            logger.info("batch report: fetched %s rows=%d in %.2fs", f.name, len(frame), seconds)
+            compute_ready()
+
+    elapsed = time.time() - start
+    fetched = [s["seconds"] for s in fetch_stats if not s["resumed"]]
+    manifest = {
+        "spec": spec.to_dict(),
+        "format": fmt,
+        "elapsed_s": round(elapsed, 3),
+        "slowest_fetch_s": max(fetched, default=0.0),
+        "fetches": fetch_stats,
+        "analyses": analysis_stats,
+        "errors": errors,
+        "skipped": [a.name for a in pending],
+    }
+    out.mkdir(parents=True, exist_ok=True)
+    (out / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("spec", type=Path, help="report spec (JSON)")
+    parser.add_argument("--out", type=Path, required=True, help="output directory (re-use it to resume)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent fetches")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="parquet")
+    args = parser.parse_args()
+
+    manifest = run_report(ReportSpec.load(args.spec), args.out, workers=args.workers, fmt=args.format)
+    slowest = manifest["slowest_fetch_s"]
+    ratio = f" ({manifest['elapsed_s'] / slowest:.1f}x the slowest fetch)" if slowest else ""
+    print(
+        f"{len(manifest['analyses'])} analyses from {len(manifest['fetches'])} fetches in "
+        f"{manifest['elapsed_s']:.1f}s{ratio}; slowest fetch {slowest:.1f}s -> {args.out / MANIFEST_NAME}"
+    )
+    if manifest["errors"]:
+        for name, error in manifest["errors"].items():
+            print(f"  failed: {name}: {error}")
+        print(f"  skipped analyses: {len(manifest['skipped'])} (re-run to resume)")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
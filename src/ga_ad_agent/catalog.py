@@ -0,0 +1,207 @@
+"""
+Local catalog of dimension cardinalities and top values, one entry per month.
+
+{
+  "format_version": 1,
+  "months": {
+    "2017-01": {
+      "built_at": 1700000000.0,
+      "total_pageviews": 123456,
+      "sessions": 45678,
+      "dimensions": {"page_title": {"distinct": 3456, "top_values": [["Home", 9876], ...]}, ...}
+    }
+  }
+}
+
+Built by the MCP server (`refresh_dimension_catalog`, one APPROX_* query per missing month) and read
+without BigQuery by the server (result-size guard) and the Streamlit UI (value autocompletion).
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src import config as cfg
+from src.constants import DATASET_FIRST_MONTH, DATASET_LAST_MONTH, DIMENSIONS
+
+logger = logging.getLogger("ga-catalog")
+
+CATALOG_PATH_ENV = "DIMENSION_CATALOG_PATH"
+DEFAULT_CATALOG_PATH = cfg.PROJECT_ROOT / ".dimension_catalog.json"
+FORMAT_VERSION = 1
+
+# Result-size guard (no catalog entry -> no guard): above AUTO_LIMIT_ROWS unbounded requests are capped,
+# above MAX_ESTIMATED_ROWS they are rejected; allow_large skips both
+AUTO_LIMIT_ROWS = int(os.getenv("CATALOG_AUTO_LIMIT_ROWS", "50000"))
+MAX_ESTIMATED_ROWS = int(os.getenv("CATALOG_MAX_ROWS", "2000000"))
+
+# path -> (mtime, catalog): repeated loads (every tool call / UI rerun) reuse the parsed file
+_LOADED: Dict[Path, Tuple[float, "DimensionCatalog"]] = {}
+
+
+def months_between(first: str = DATASET_FIRST_MONTH, last: str = DATASET_LAST_MONTH) -> List[str]:
+    """YYYY-MM labels from first to last (inclusive)."""
+    y, m = (int(x) for x in first.split("-"))
+    last_y, last_m = (int(x) for x in last.split("-"))
+    out = []
+    while (y, m) <= (last_y, last_m):
+        out.append(f"{y:04d}-{m:02d}")
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return out
+
+
+def entry_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Catalog entry from the single result row of the server's catalog query
+    (`<dim>__distinct` INT64 and `<dim>__top` ARRAY<STRUCT<value, count>> per dimension).
+    """
+    dims = {}
+    for d in DIMENSIONS:
+        top = row.get(f"{d}__top") or []
+        dims[d] = {
+            "distinct": int(row.get(f"{d}__distinct") or 0),
+            "top_values": [[t["value"], int(t["count"])] for t in top if t.get("value") is not None],
+        }
+    return {
+        "built_at": time.time(),
+        "total_pageviews": int(row.get("total_pageviews") or 0),
+        "sessions": int(row.get("sessions") or 0),
+        "dimensions": dims,
+    }
+
+
+class DimensionCatalog:
+    """
+    Per-month distinct counts + top values of every entry in DIMENSIONS.
+    """
+
+    def __init__(self, path: str | os.PathLike, months: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.path = Path(path)
+        self.months: Dict[str, Dict[str, Any]] = months or {}
+
+    @classmethod
+    def from_env(cls) -> "DimensionCatalog":
+        """Catalog at DIMENSION_CATALOG_PATH (default: .dimension_catalog.json in the project root)."""
+        return cls.load(os.getenv(CATALOG_PATH_ENV) or DEFAULT_CATALOG_PATH)
+
+    @classmethod
+    def load(cls, path: str | os.PathLike) -> "DimensionCatalog":
+        """Parsed catalog (cached until the file changes); empty when the file does not exist yet."""
+        path = Path(path)
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return cls(path)
+
+        cached = _LOADED.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        if data.get("format_version") != FORMAT_VERSION:
+            logger.warning("Ignoring dimension catalog %s with format %s", path, data.get("format_version"))
+            return cls(path)
+
+        catalog = cls(path, data.get("months") or {})
+        _LOADED[path] = (mtime, catalog)
+        return catalog
+
+    def save(self) -> None:
+        """Atomic write (temp file + rename) so concurrent readers never see a partial catalog."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=f".{self.path.name}.", dir=self.path.parent)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump({"format_version": FORMAT_VERSION, "months": self.months}, fh)
+            os.replace(tmp, self.path)
+        except Exception:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        _LOADED.pop(self.path, None)
+
+    def set_month(self, month: str, entry: Dict[str, Any]) -> None:
+        self.months[month] = entry
+
+    def missing_months(self, months: Sequence[str], max_age_seconds: Optional[float] = None) -> List[str]:
+        """Months without an entry, or with one older than max_age_seconds."""
+        now = time.time()
+        return [
+            m
+            for m in months
+            if m not in self.months
+            or (max_age_seconds is not None and now - self.months[m].get("built_at", 0) > max_age_seconds)
+        ]
+
+    def covers(self, months: Sequence[str]) -> bool:
+        return all(m in self.months for m in months)
+
+    def distinct(self, dimension: str, months: Sequence[str]) -> Optional[int]:
+        """
+        Upper bound of distinct values over `months` (sum of the per-month counts); None when not cataloged.
+        """
+        if not months or not self.covers(months):
+            return None
+        return sum(self.months[m]["dimensions"].get(dimension, {}).get("distinct", 0) for m in months)
+
+    def estimate_rows(
+            self,
+            dimensions: Sequence[str],
+            months: Sequence[str],
+            min_pageviews: int = 0,
+            periods: int = 1,
+    ) -> Optional[int]:
+        """
+        Upper-bound estimate of the rows a KPI query returns, or None when a month is not cataloged:
+          segments = min(product of distinct counts, total_pageviews // min_pageviews)
+          rows     = min(segments * periods, total_pageviews)
+        A segment needs >= min_pageviews page hits, so the pageview total caps the segment count.
+        """
+        if not months or not self.covers(months):
+            return None
+
+        total_pageviews = sum(self.months[m].get("total_pageviews", 0) for m in months)
+        segments = 1
+        for d in dict.fromkeys(dimensions):
+            segments *= max(self.distinct(d, months) or 0, 1)
+        if min_pageviews > 0:
+            segments = min(segments, total_pageviews // min_pageviews)
+        return int(min(segments * max(periods, 1), total_pageviews))
+
+    def suggest(
+            self,
+            dimension: str,
+            prefix: str = "",
+            months: Optional[Sequence[str]] = None,
+            limit: int = 20,
+    ) -> List[Tuple[str, int]]:
+        """
+        Known values of a dimension starting with / containing `prefix` (case-insensitive), by pageviews.
+        Prefix matches rank before substring matches.
+        """
+        counts: Dict[str, int] = {}
+        for m in months or self.months.keys():
+            entry = self.months.get(m)
+            if entry is None:
+                continue
+            for value, count in entry["dimensions"].get(dimension, {}).get("top_values", []):
+                counts[value] = counts.get(value, 0) + count
+
+        needle = prefix.strip().lower()
+        matches = [(v, c) for v, c in counts.items() if needle in v.lower()]
+        matches.sort(key=lambda vc: (not vc[0].lower().startswith(needle), -vc[1], vc[0]))
+        return matches[:limit]
+
+    def summary(self) -> Dict[str, Any]:
+        """Months cataloged + distinct counts per dimension (for tool output / UI)."""
+        return {
+            "path": str(self.path),
+            "months": sorted(self.months),
+            "distinct": {
+                m: {d: e["dimensions"].get(d, {}).get("distinct") for d in DIMENSIONS}
+                for m, e in sorted(self.months.items())
+            },
+        }
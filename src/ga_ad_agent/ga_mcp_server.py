@@ -1,14 +1,47 @@
-from typing import Any, Dict, List, Literal, Optional, Tuple
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Literal, Optional, Tuple
 import re
 import calendar
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
+import hashlib
 import logging
+import threading
 import time
 import json
 
-from google.cloud import bigquery
-from mcp.server.fastmcp import FastMCP
+import anyio
+from mcp.server.fastmcp import Context, FastMCP
+
+from src.constants import (
+    DATASET,
+    DATASET_FIRST_MONTH,
+    DATASET_LAST_DAY,
+    DATASET_LAST_MONTH,
+    DEFAULT_MIN_PAGEVIEWS,
+    DEFAULT_PROJECT,
+    DIMENSIONS,
+    KPI_FIELDS,
+    TABLE_WILDCARD,
+)
+from src.ga_ad_agent import metrics, tracing
+from src.ga_ad_agent.catalog import (
+    AUTO_LIMIT_ROWS,
+    MAX_ESTIMATED_ROWS,
+    DimensionCatalog,
+    entry_from_row,
+    months_between,
+)
+from src.ga_ad_agent.job_scheduler import JobScheduler, JobTicket, is_rate_limited
+from src.ga_ad_agent.row_codec import ResultRows, encode_response
 
-from src.constants import DEFAULT_PROJECT, DATASET, TABLE_WILDCARD, DIMENSIONS, KPI_FIELDS
+if TYPE_CHECKING:
+    # google.cloud.bigquery is imported where it is used (and pre-warmed in main): it is the largest
+    # part of the server's import time, and the server is spawned once per tool call
+    from google.cloud import bigquery
 
 
 # -------------------------
@@ -38,10 +71,81 @@ def _setup_logging() -> None:
 
 
 _setup_logging()
+tracing.setup_tracing("ga-kpi-server")
 
-mcp = FastMCP("ga-kpi-server")
+# Stateless HTTP: no per-session server state, so any HTTP worker can serve any request (stdio unaffected)
+mcp = FastMCP("ga-kpi-server", stateless_http=True, json_response=True)
+
+# Networked transport (MCP_TRANSPORT=http): streamable HTTP on MCP_HTTP_HOST:MCP_HTTP_PORT/mcp
+HTTP_APP_IMPORT = "src.ga_ad_agent.ga_mcp_server:http_app"
+DEFAULT_HTTP_PORT = 8765
 
 DimensionLiteral = Literal["traffic_source", "user_country", "medium", "device_type", "page_title"]
+KpiLiteral = Literal["total_visitors", "total_pageviews", "avg_time_on_site_seconds", "total_conversions"]
+
+DEFAULT_ORDER_BY = "total_pageviews"
+# Upper bound for a single page; callers that need everything omit `limit`
+MAX_PAGE_SIZE = 10_000
+
+CATALOG_TOP_K = 500
+
+GrainLiteral = Literal["month", "day"]
+# Job scheduler priority: batch jobs (reports, catalog / extract builds) queue behind interactive ones
+PriorityLiteral = Literal["interactive", "batch"]
+DEFAULT_PRIORITY = "interactive"
+# Row layout of data tool responses (row_codec): one object per row, or one array per column
+RowFormatLiteral = Literal["objects", "columns"]
+DEFAULT_ROW_FORMAT = "objects"
+# BQ_STORAGE_API=1 reads results through the BigQuery Storage Read API (needs bigquery.readsessions.create)
+STORAGE_API_ENV = "BQ_STORAGE_API"
+# Period label per session date (`date` is the YYYYMMDD session start date of the export)
+PERIOD_FORMATS: Dict[str, str] = {"month": "%Y-%m", "day": "%Y-%m-%d"}
+
+# Session KPI aggregates of CTE 5 (over one row per (session, segment)); the shard variant keeps
+# mergeable partials: an HLL++ visitor sketch and the sum/count behind the time-on-site average
+SESSION_KPI_AGGS = """COUNT(DISTINCT fullVisitorId) AS total_visitors,
+        AVG(timeOnSite) AS avg_time_on_site_seconds,
+        COUNT(DISTINCT IF(transactions >= 1,
+          CONCAT(CAST(fullVisitorId AS STRING), "-", CAST(visitId AS STRING)),
+          NULL
+        )) AS total_conversions"""
+SHARD_SESSION_AGGS = """HLL_COUNT.INIT(fullVisitorId) AS visitors_sketch,
+        SUM(timeOnSite) AS time_on_site_sum,
+        COUNT(timeOnSite) AS time_on_site_sessions,
+        COUNT(DISTINCT IF(transactions >= 1,
+          CONCAT(CAST(fullVisitorId AS STRING), "-", CAST(visitId AS STRING)),
+          NULL
+        )) AS total_conversions"""
+
+# Distinct query shapes (dimension set x scope x ordering x paging x source) whose SQL text is kept
+SQL_TEMPLATE_CACHE_SIZE = 512
+# Hashes of SQL texts already logged in full by this process (later runs log the hash only)
+_LOGGED_SQL: set = set()
+
+# Sharded get_all_data: shard jobs run concurrently on a bounded pool
+DEFAULT_SHARD_CONCURRENCY = 4
+MAX_SHARD_CONCURRENCY = 16
+
+# Optional flat session extract ("project.dataset.table", built by materialize_session_extract);
+# KPI queries read it instead of the nested export once the table exists
+SESSION_EXTRACT_ENV = "SESSION_EXTRACT_TABLE"
+_TABLE_ID_RE = re.compile(r"[A-Za-z0-9_-]+\.[A-Za-z0-9_]+\.[A-Za-z0-9_-]+")
+# Re-check the extract at most this often (it may be built or dropped by another server process)
+EXTRACT_RECHECK_SECONDS = 300
+# table -> (exists, checked_at)
+_EXTRACT_STATE: Dict[str, Tuple[bool, float]] = {}
+
+# Dense visitor id map (fullVisitorId -> rank among all visitors of the export) joined by visitor-set
+# queries: VISITOR_ID_TABLE, by default "<SESSION_EXTRACT_TABLE>_visitor_ids" (both built by
+# materialize_session_extract); without one, the map query runs as its own job and its result table is reused
+VISITOR_ID_TABLE_ENV = "VISITOR_ID_TABLE"
+# How long a process reuses a resolved id map (anonymous result tables live ~24h)
+VISITOR_ID_MAP_TTL_SECONDS = 3600
+# configured table ("" = none) -> (table queries join, resolved_at)
+_VISITOR_ID_MAP: Dict[str, Tuple[str, float]] = {}
+
+# Scheduler stats of the BigQuery jobs run for the current tool call (set by _tool_span)
+_TOOL_JOBS: contextvars.ContextVar[Optional[List[Dict[str, Any]]]] = contextvars.ContextVar("tool_jobs", default=None)
 
 
 def _validate_dimensions(dimensions: List[str]) -> List[str]:
@@ -55,14 +159,11 @@ def _validate_dimensions(dimensions: List[str]) -> List[str]:
         logger.error("Validation failed: unknown dimensions=%s allowed=%s", unknown, sorted(DIMENSIONS.keys()))
         raise ValueError(f"Unknown dimensions: {unknown}. Allowed: {sorted(DIMENSIONS.keys())}")
 
-    seen = set()
-    out = []
-    for d in dimensions:
-        if d not in seen:
-            out.append(d)
-            seen.add(d)
+    # Deduped, in DIMENSIONS order: the same dimension set always yields the same SQL text
+    requested = set(dimensions)
+    out = [d for d in DIMENSIONS if d in requested]
 
-    logger.debug("Validated dimensions (deduped): %s", out)
+    logger.debug("Validated dimensions (deduped, canonical order): %s", out)
     return out
 
 
@@ -86,30 +187,33 @@ def _month_to_suffix_range(month: str) -> Tuple[str, str]:
     return start, end
 
 
-def _build_query(
-    dimensions: List[str],
-    suffix_start: Optional[str],
-    suffix_end: Optional[str],
-) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
-    logger.info(
-        "Building query: dimensions=%s suffix_start=%s suffix_end=%s",
-        dimensions,
-        suffix_start,
-        suffix_end,
-    )
-    dims = _validate_dimensions(dimensions)
+def _validate_result_options(order_by: str, limit: Optional[int], offset: int, min_pageviews: int) -> None:
+    if min_pageviews < 0:
+        logger.error("Validation failed: min_pageviews=%s is negative", min_pageviews)
+        raise ValueError("min_pageviews must be >= 0")
 
-    select_dims = ",\n        ".join([f"{DIMENSIONS[d]} AS {d}" for d in dims])
-    dim_names = ", ".join(dims)
+    if order_by not in KPI_FIELDS:
+        logger.error("Validation failed: unknown order_by=%s allowed=%s", order_by, KPI_FIELDS)
+        raise ValueError(f"Unknown order_by: {order_by}. Allowed: {KPI_FIELDS}")
 
-    where_suffix = ""
-    params: List[bigquery.ScalarQueryParameter] = []
-    if suffix_start and suffix_end:
-        where_suffix = "AND _TABLE_SUFFIX BETWEEN @suffix_start AND @suffix_end"
-        params.append(bigquery.ScalarQueryParameter("suffix_start", "STRING", suffix_start))
-        params.append(bigquery.ScalarQueryParameter("suffix_end", "STRING", suffix_end))
+    if limit is not None and not (1 <= limit <= MAX_PAGE_SIZE):
+        logger.error("Validation failed: limit=%s out of range", limit)
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
 
-    query = f"""
+    if offset < 0:
+        logger.error("Validation failed: offset=%s is negative", offset)
+        raise ValueError("offset must be >= 0")
+
+    if offset and limit is None:
+        logger.error("Validation failed: offset=%s without limit", offset)
+        raise ValueError("offset requires limit")
+
+
+def _kpi_ctes(select_dims: str, dim_names: str, where_suffix: str, session_aggs: str = SESSION_KPI_AGGS) -> str:
+    """
+    Shared CTEs 1-5 of the KPI queries; `dim_names` are the grouping columns selected by `select_dims`.
+    """
+    return f"""
     -- 1) sessions: one row per session (safe for timeOnSite / transactions)
     WITH sessions AS (
       SELECT
@@ -165,117 +269,1477 @@ def _build_query(
     sessions_agg AS (
       SELECT
         d.{dim_names},
-        COUNT(DISTINCT d.fullVisitorId) AS total_visitors,
-        AVG(s.timeOnSite) AS avg_time_on_site_seconds,
-        COUNT(DISTINCT IF(s.transactions >= 1,
-          CONCAT(CAST(d.fullVisitorId AS STRING), "-", CAST(d.visitId AS STRING)),
-          NULL
-        )) AS total_conversions
+        {session_aggs}
       FROM session_dims d
       JOIN sessions s
       USING (fullVisitorId, visitId)
       GROUP BY d.{dim_names}
     )
+    """
+
 
+def _extract_ctes(
+    source_table: str,
+    dims: List[str],
+    grain: Optional[str],
+    has_range: bool,
+    session_aggs: str = SESSION_KPI_AGGS,
+) -> str:
+    """
+    CTEs 1-5 over the flat session extract (see `_build_extract_query`): one row per session, or per
+    (session, page title) when page_title is requested, so no hit-level UNNEST of the raw export and
+    BigQuery only reads the extract columns the dimension subset needs.
+    """
+    columns = ["pt.page_title AS page_title" if d == "page_title" else d for d in dims]
+    if grain:
+        columns.append(f"FORMAT_DATE('{PERIOD_FORMATS[grain]}', session_date) AS period")
+    group_names = ", ".join(dims + (["period"] if grain else []))
+    unnest_titles = ",\n      UNNEST(page_titles) AS pt" if "page_title" in dims else ""
+    pageviews_col = "pt.pageviews AS pageviews" if "page_title" in dims else "pageviews"
+    where_range = (
+        "WHERE session_date BETWEEN PARSE_DATE('%Y%m%d', @suffix_start) AND PARSE_DATE('%Y%m%d', @suffix_end)"
+        if has_range
+        else ""
+    )
+    select_cols = ",\n        ".join(columns)
+
+    return f"""
+    -- 1-3) session_dims: one row per (session, segment) straight from the extract
+    WITH session_dims AS (
+      SELECT
+        fullVisitorId,
+        visitId,
+        timeOnSite,
+        transactions,
+        {select_cols},
+        {pageviews_col}
+      FROM `{source_table}`{unnest_titles}
+      {where_range}
+    ),
+
+    -- 4) aggregate pageviews (pre-counted per session / title)
+    pageviews_agg AS (
+      SELECT
+        {group_names},
+        SUM(pageviews) AS total_pageviews
+      FROM session_dims
+      GROUP BY {group_names}
+    ),
+
+    -- 5) aggregate session KPIs at (session, segment) grain
+    sessions_agg AS (
+      SELECT
+        {group_names},
+        {session_aggs}
+      FROM session_dims
+      GROUP BY {group_names}
+    )
+    """
+
+
+def _segment_ctes(
+    dims: List[str],
+    grain: Optional[str],
+    has_range: bool,
+    source_table: Optional[str],
+    session_aggs: str = SESSION_KPI_AGGS,
+) -> str:
+    """
+    CTEs producing `pageviews_agg` + `sessions_agg` grouped by dims (+ period for a grain), from the raw
+    nested export or, when given, the materialized session extract.
+    """
+    if source_table:
+        return _extract_ctes(source_table, dims, grain, has_range, session_aggs)
+
+    select = [f"{DIMENSIONS[d]} AS {d}" for d in dims]
+    if grain:
+        select.append(f"FORMAT_DATE('{PERIOD_FORMATS[grain]}', PARSE_DATE('%Y%m%d', date)) AS period")
+    group_names = ", ".join(dims + (["period"] if grain else []))
+    where_suffix = "AND _TABLE_SUFFIX BETWEEN @suffix_start AND @suffix_end" if has_range else ""
+    return _kpi_ctes(",\n        ".join(select), group_names, where_suffix, session_aggs)
+
+
+@functools.lru_cache(maxsize=SQL_TEMPLATE_CACHE_SIZE)
+def _kpi_sql(
+    dims: Tuple[str, ...],
+    has_range: bool,
+    order_by: str,
+    descending: bool,
+    paged: bool,
+    source_table: Optional[str],
+) -> str:
+    """
+    SQL text of one KPI query shape. Every varying value (suffix range, threshold, page) is a query
+    parameter, so repeated calls reuse the text instead of rebuilding it.
+    """
+    dim_names = ", ".join(dims)
+    # Dimensions break ties so pages are stable across calls
+    order_clause = f"{order_by} {'DESC' if descending else 'ASC'}, {dim_names}"
+    page_clause = "LIMIT @limit OFFSET @offset" if paged else ""
+
+    return f"""
+    {_segment_ctes(list(dims), None, has_range, source_table)}
     -- 6) combine
     SELECT
       s.{dim_names},
       s.total_visitors,
       p.total_pageviews,
       s.avg_time_on_site_seconds,
-      s.total_conversions
+      s.total_conversions,
+      COUNT(1) OVER () AS total_row_count
     FROM sessions_agg s
     JOIN pageviews_agg p
     USING ({dim_names})
-    WHERE p.total_pageviews >= 20
-    ORDER BY p.total_pageviews DESC
+    WHERE p.total_pageviews >= @min_pageviews
+    ORDER BY {order_clause}
+    {page_clause}
     """
 
+
+def _build_query(
+    dimensions: List[str],
+    suffix_start: Optional[str],
+    suffix_end: Optional[str],
+    order_by: str = DEFAULT_ORDER_BY,
+    descending: bool = True,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    min_pageviews: int = DEFAULT_MIN_PAGEVIEWS,
+    source_table: Optional[str] = None,
+) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    from google.cloud import bigquery
+
+    logger.info(
+        "Building query: dimensions=%s suffix_start=%s suffix_end=%s order_by=%s descending=%s limit=%s offset=%s "
+        "min_pageviews=%s source_table=%s",
+        dimensions,
+        suffix_start,
+        suffix_end,
+        order_by,
+        descending,
+        limit,
+        offset,
+        min_pageviews,
+        source_table,
+    )
+    dims = _validate_dimensions(dimensions)
+    _validate_result_options(order_by, limit, offset, min_pageviews)
+
+    has_range = bool(suffix_start and suffix_end)
+    params: List[bigquery.ScalarQueryParameter] = []
+    if has_range:
+        params.append(bigquery.ScalarQueryParameter("suffix_start", "STRING", suffix_start))
+        params.append(bigquery.ScalarQueryParameter("suffix_end", "STRING", suffix_end))
+
+    params.append(bigquery.ScalarQueryParameter("min_pageviews", "INT64", min_pageviews))
+    if limit is not None:
+        params.append(bigquery.ScalarQueryParameter("limit", "INT64", limit))
+        params.append(bigquery.ScalarQueryParameter("offset", "INT64", offset))
+
+    query = _kpi_sql(tuple(dims), has_range, order_by, descending, limit is not None, source_table)
     logger.debug("Query built. Params=%s", [(p.name, p.type_, p.value) for p in params])
-    # If you want the SQL text at DEBUG level:
-    logger.debug("Query SQL:\n%s", query)
     return query, params
 
 
-def _run_bq(query: str, params: List[bigquery.ScalarQueryParameter], project_id: str) -> List[Dict[str, Any]]:
-    logger.info("Running BigQuery job: project_id=%s params=%s", project_id, [p.name for p in params])
-    logger.debug("Query SQL:\n%s", query)
-    start = time.time()
+@functools.lru_cache(maxsize=SQL_TEMPLATE_CACHE_SIZE)
+def _trend_sql(
+    dims: Tuple[str, ...],
+    grain: str,
+    has_range: bool,
+    capped: bool,
+    source_table: Optional[str],
+) -> str:
+    """SQL text of one trend query shape (values are query parameters, see `_kpi_sql`)."""
+    group_names = ", ".join(dims + ("period",))
+    dim_names = ", ".join(dims)
+    rank_filter = "AND segment_rank <= @top_segments" if capped else ""
+
+    return f"""
+    {_segment_ctes(list(dims), grain, has_range, source_table).rstrip()},
+
+    -- 6) combine per (segment, period) + segment totals over the whole range
+    combined AS (
+      SELECT
+        s.{group_names},
+        s.total_visitors,
+        p.total_pageviews,
+        s.avg_time_on_site_seconds,
+        s.total_conversions,
+        SUM(p.total_pageviews) OVER (PARTITION BY {dim_names}) AS segment_pageviews
+      FROM sessions_agg s
+      JOIN pageviews_agg p
+      USING ({group_names})
+    ),
+
+    -- 7) rank segments by volume so callers can cap the number of series
+    ranked AS (
+      SELECT
+        *,
+        DENSE_RANK() OVER (ORDER BY segment_pageviews DESC, {dim_names}) AS segment_rank
+      FROM combined
+      WHERE segment_pageviews >= @min_pageviews
+    )
+
+    SELECT * EXCEPT (segment_pageviews, segment_rank)
+    FROM ranked
+    WHERE TRUE {rank_filter}
+    ORDER BY segment_rank, period
+    """
+
+
+def _build_trend_query(
+    dimensions: List[str],
+    grain: str,
+    suffix_start: Optional[str],
+    suffix_end: Optional[str],
+    min_pageviews: int = DEFAULT_MIN_PAGEVIEWS,
+    top_segments: Optional[int] = None,
+    source_table: Optional[str] = None,
+) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    """
+    KPIs per (segment, period) in one scan: the period is just one more grouping column.
+    min_pageviews / top_segments apply to the segment total over the whole range, so kept
+    segments have complete series (no periods dropped for being small).
+    """
+    from google.cloud import bigquery
+
+    logger.info(
+        "Building trend query: dimensions=%s grain=%s suffix_start=%s suffix_end=%s min_pageviews=%s top_segments=%s "
+        "source_table=%s",
+        dimensions,
+        grain,
+        suffix_start,
+        suffix_end,
+        min_pageviews,
+        top_segments,
+        source_table,
+    )
+    dims = _validate_dimensions(dimensions)
+    if grain not in PERIOD_FORMATS:
+        logger.error("Validation failed: unknown grain=%s allowed=%s", grain, sorted(PERIOD_FORMATS))
+        raise ValueError(f"Unknown grain: {grain}. Allowed: {sorted(PERIOD_FORMATS)}")
+    _validate_result_options(DEFAULT_ORDER_BY, None, 0, min_pageviews)
+    if top_segments is not None and top_segments < 1:
+        logger.error("Validation failed: top_segments=%s must be positive", top_segments)
+        raise ValueError("top_segments must be >= 1")
+
+    has_range = bool(suffix_start and suffix_end)
+    params: List[bigquery.ScalarQueryParameter] = []
+    if has_range:
+        params.append(bigquery.ScalarQueryParameter("suffix_start", "STRING", suffix_start))
+        params.append(bigquery.ScalarQueryParameter("suffix_end", "STRING", suffix_end))
+
+    params.append(bigquery.ScalarQueryParameter("min_pageviews", "INT64", min_pageviews))
+    if top_segments is not None:
+        params.append(bigquery.ScalarQueryParameter("top_segments", "INT64", top_segments))
+
+    query = _trend_sql(tuple(dims), grain, has_range, top_segments is not None, source_table)
+    logger.debug("Trend query built. Params=%s", [(p.name, p.type_, p.value) for p in params])
+    return query, params
+
+
+def _visitor_id_map_sql() -> str:
+    """
+    Dense visitor ids: rank of fullVisitorId among ALL visitors of the export (not just a range or the
+    extract), so ids - and the bitmaps built from them - agree across months, dimension sets and sources.
+    """
+    return f"""
+    SELECT
+      fullVisitorId,
+      ROW_NUMBER() OVER (ORDER BY fullVisitorId) - 1 AS visitor_id
+    FROM (SELECT DISTINCT fullVisitorId FROM `{TABLE_WILDCARD}`)
+    """
+
+
+def _build_visitor_id_table_query(destination: str) -> str:
+    """DDL for the materialized id map, clustered by fullVisitorId for the visitor-set join."""
+    return f"""
+    CREATE OR REPLACE TABLE `{destination}`
+    CLUSTER BY fullVisitorId
+    AS
+    {_visitor_id_map_sql().strip()}
+    """
+
+
+@functools.lru_cache(maxsize=SQL_TEMPLATE_CACHE_SIZE)
+def _visitor_set_sql(dims: Tuple[str, ...], has_range: bool, source_table: Optional[str], id_table: str) -> str:
+    """SQL text of one visitor-set query shape (values are query parameters, see `_kpi_sql`)."""
+    dim_names = ", ".join(dims)
+
+    return f"""
+    {_segment_ctes(list(dims), None, has_range, source_table).rstrip()}
+
+    -- 6) dense visitor ids from the materialized id map (see `_visitor_id_map_sql`)
+    SELECT
+      {dim_names},
+      ARRAY_AGG(DISTINCT v.visitor_id ORDER BY v.visitor_id) AS visitor_ids
+    FROM session_dims d
+    JOIN `{id_table}` v
+    USING (fullVisitorId)
+    GROUP BY {dim_names}
+    ORDER BY {dim_names}
+    """
+
+
+def _build_visitor_set_query(
+    dimensions: List[str],
+    suffix_start: Optional[str],
+    suffix_end: Optional[str],
+    id_table: str,
+    source_table: Optional[str] = None,
+) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    """
+    Sorted dense visitor ids per segment, over the same (session, segment) rows as total_visitors.
+    No pageview threshold: every segment is returned, so unions / rollups of the sets stay exact.
+    """
+    from google.cloud import bigquery
+
+    logger.info(
+        "Building visitor set query: dimensions=%s suffix_start=%s suffix_end=%s source_table=%s id_table=%s",
+        dimensions,
+        suffix_start,
+        suffix_end,
+        source_table,
+        id_table,
+    )
+    dims = _validate_dimensions(dimensions)
+    has_range = bool(suffix_start and suffix_end)
+    params: List[bigquery.ScalarQueryParameter] = []
+    if has_range:
+        params.append(bigquery.ScalarQueryParameter("suffix_start", "STRING", suffix_start))
+        params.append(bigquery.ScalarQueryParameter("suffix_end", "STRING", suffix_end))
+
+    query = _visitor_set_sql(tuple(dims), has_range, source_table, id_table)
+    logger.debug("Visitor set query built. Params=%s", [(p.name, p.type_, p.value) for p in params])
+    return query, params
+
+
+def _shard_ranges(shard_by: str, months: List[str]) -> List[Tuple[str, str]]:
+    """Table-suffix ranges of the month / day shards covering `months`, up to the export's last day."""
+    if shard_by not in PERIOD_FORMATS:
+        logger.error("Validation failed: unknown shard_by=%s allowed=%s", shard_by, sorted(PERIOD_FORMATS))
+        raise ValueError(f"Unknown shard_by: {shard_by}. Allowed: {sorted(PERIOD_FORMATS)}")
+
+    ranges = [_month_to_suffix_range(m) for m in months]
+    if shard_by == "day":
+        ranges = [(f"{start[:6]}{d:02d}",) * 2 for start, end in ranges for d in range(1, int(end[6:]) + 1)]
+    last = DATASET_LAST_DAY.replace("-", "")
+    return [(start, min(end, last)) for start, end in ranges if start <= last]
+
+
+def _build_shard_query(
+    dimensions: List[str],
+    suffix_start: str,
+    suffix_end: str,
+    source_table: Optional[str] = None,
+) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    """
+    Partial KPIs per segment for one shard: no HAVING / ORDER / LIMIT (those only hold for the merged totals).
+    A session lives in exactly one daily table, so pageviews and conversions add up across shards;
+    visitors recur across shards and are carried as HLL++ sketches.
+    """
+    from google.cloud import bigquery
+
+    query = _shard_sql(tuple(_validate_dimensions(dimensions)), source_table)
+    params = [
+        bigquery.ScalarQueryParameter("suffix_start", "STRING", suffix_start),
+        bigquery.ScalarQueryParameter("suffix_end", "STRING", suffix_end),
+    ]
+    return query, params
+
+
+@functools.lru_cache(maxsize=SQL_TEMPLATE_CACHE_SIZE)
+def _shard_sql(dims: Tuple[str, ...], source_table: Optional[str]) -> str:
+    """SQL text shared by every shard of a sharded call (only the suffix parameters differ)."""
+    dim_names = ", ".join(dims)
+    return f"""
+    {_segment_ctes(list(dims), None, True, source_table, SHARD_SESSION_AGGS)}
+    -- 6) combine (partials)
+    SELECT
+      s.{dim_names},
+      p.total_pageviews,
+      s.visitors_sketch,
+      s.time_on_site_sum,
+      s.time_on_site_sessions,
+      s.total_conversions
+    FROM sessions_agg s
+    JOIN pageviews_agg p
+    USING ({dim_names})
+    """
+
+
+def _build_merge_query(
+    dimensions: List[str],
+    shard_tables: List[str],
+    order_by: str = DEFAULT_ORDER_BY,
+    descending: bool = True,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    min_pageviews: int = DEFAULT_MIN_PAGEVIEWS,
+) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    """
+    Merge the shard results (job result tables) into the `_build_query` output: sums for pageviews and
+    conversions, sum / count for the time-on-site average, HLL_COUNT.MERGE for visitors.
+    """
+    from google.cloud import bigquery
+
+    dims = _validate_dimensions(dimensions)
+    _validate_result_options(order_by, limit, offset, min_pageviews)
+    if not shard_tables:
+        raise ValueError("shard_tables must be a non-empty list")
+
+    dim_names = ", ".join(dims)
+    union = "\n      UNION ALL\n      ".join(f"SELECT * FROM `{t}`" for t in shard_tables)
+    params = [bigquery.ScalarQueryParameter("min_pageviews", "INT64", min_pageviews)]
+
+    order_clause = f"{order_by} {'DESC' if descending else 'ASC'}, {dim_names}"
+    page_clause = ""
+    if limit is not None:
+        page_clause = "LIMIT @limit OFFSET @offset"
+        params.append(bigquery.ScalarQueryParameter("limit", "INT64", limit))
+        params.append(bigquery.ScalarQueryParameter("offset", "INT64", offset))
+
+    query = f"""
+    WITH shards AS (
+      {union}
+    ),
+
+    merged AS (
+      SELECT
+        {dim_names},
+        HLL_COUNT.MERGE(visitors_sketch) AS total_visitors,
+        SUM(total_pageviews) AS total_pageviews,
+        SAFE_DIVIDE(SUM(time_on_site_sum), SUM(time_on_site_sessions)) AS avg_time_on_site_seconds,
+        SUM(total_conversions) AS total_conversions
+      FROM shards
+      GROUP BY {dim_names}
+    )
+
+    SELECT
+      *,
+      COUNT(1) OVER () AS total_row_count
+    FROM merged
+    WHERE total_pageviews >= @min_pageviews
+    ORDER BY {order_clause}
+    {page_clause}
+    """
+    return query, params
+
+
+def _build_catalog_query(
+    suffix_start: str,
+    suffix_end: str,
+    top_k: int = CATALOG_TOP_K,
+) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    """
+    One row with APPROX distinct counts + top values (by page hits) of every dimension, for one suffix range.
+    Same hit filters as the KPI queries, so the catalog describes what those queries can return.
+    """
+    from google.cloud import bigquery
+
+    logger.info("Building catalog query: suffix_start=%s suffix_end=%s top_k=%s", suffix_start, suffix_end, top_k)
+    columns = []
+    for d, expr in DIMENSIONS.items():
+        columns.append(f"APPROX_COUNT_DISTINCT({expr}) AS {d}__distinct")
+        columns.append(f"APPROX_TOP_COUNT({expr}, @top_k) AS {d}__top")
+    select_cols = ",\n      ".join(columns)
+
+    query = f"""
+    SELECT
+      COUNT(1) AS total_pageviews,
+      COUNT(DISTINCT CONCAT(fullVisitorId, "-", CAST(visitId AS STRING))) AS sessions,
+      {select_cols}
+    FROM `{TABLE_WILDCARD}`,
+    UNNEST(hits) AS hits
+    WHERE
+      trafficSource.source IS NOT NULL
+      AND trafficSource.source != '(not set)'
+      AND trafficSource.medium IS NOT NULL
+      AND trafficSource.medium NOT IN ('(not set)', '(none)')
+      AND totals.visits >= 1
+      AND hits.type = 'PAGE'
+      AND _TABLE_SUFFIX BETWEEN @suffix_start AND @suffix_end
+    """
+    params = [
+        bigquery.ScalarQueryParameter("suffix_start", "STRING", suffix_start),
+        bigquery.ScalarQueryParameter("suffix_end", "STRING", suffix_end),
+        bigquery.ScalarQueryParameter("top_k", "INT64", top_k),
+    ]
+    return query, params
+
+
+def _extract_table(destination: Optional[str] = None) -> Optional[str]:
+    """
+    Fully qualified extract table (argument or SESSION_EXTRACT_TABLE), None when not configured.
+    """
+    import os
+
+    table = destination or os.getenv(SESSION_EXTRACT_ENV) or None
+    if table and not _TABLE_ID_RE.fullmatch(table):
+        logger.error("Invalid session extract table: %s", table)
+        raise ValueError("session extract table must be 'project.dataset.table'")
+    return table
+
+
+def _session_source(project_id: str) -> Optional[str]:
+    """
+    Extract table KPI queries should read, or None (nested export) when it is not configured, not built yet
+    or not readable. Both outcomes are cached for EXTRACT_RECHECK_SECONDS.
+    """
+    from google.api_core.exceptions import GoogleAPICallError, NotFound
+
+    table = _extract_table()
+    if not table:
+        return None
+
+    exists, checked_at = _EXTRACT_STATE.get(table, (False, 0.0))
+    if time.time() - checked_at > EXTRACT_RECHECK_SECONDS:
+        try:
+            _bq_client(project_id).get_table(table)
+            exists = True
+        except NotFound:
+            exists = False
+            logger.warning("Session extract %s not found; querying the export (run materialize_session_extract)", table)
+        except GoogleAPICallError as exc:  # e.g. Forbidden or a transient API error
+            exists = False
+            logger.warning("Session extract %s not readable; querying the export: %s", table, exc)
+        _EXTRACT_STATE[table] = (exists, time.time())
+    return table if exists else None
+
+
+def _forget_missing_tables(query: str, exc: BaseException) -> None:
+    """
+    A query on an extract / visitor id map dropped since the last check fails with NotFound: drop the cached
+    state so the next tool call rechecks (and falls back) instead of failing until the recheck interval.
+    """
+    from google.api_core.exceptions import NotFound
+
+    if not isinstance(exc, NotFound):
+        return
+    for table in [t for t in _EXTRACT_STATE if f"`{t}`" in query]:
+        _EXTRACT_STATE.pop(table, None)
+        logger.warning("Session extract %s not found by a query; rechecking on the next call", table)
+    for key, (table, _) in list(_VISITOR_ID_MAP.items()):
+        if f"`{table}`" in query:
+            _VISITOR_ID_MAP.pop(key, None)
+            logger.warning("Visitor id map %s not found by a query; resolving it again on the next call", table)
+
+
+def _visitor_id_table_name(extract_table: Optional[str] = None) -> Optional[str]:
+    """
+    Materialized id map table (VISITOR_ID_TABLE, else derived from the extract table), None when neither is set.
+    """
+    import os
+
+    table = os.getenv(VISITOR_ID_TABLE_ENV) or None
+    if table is None:
+        extract = extract_table or _extract_table()
+        table = f"{extract}_visitor_ids" if extract else None
+    if table and not _TABLE_ID_RE.fullmatch(table):
+        logger.error("Invalid visitor id table: %s", table)
+        raise ValueError("visitor id table must be 'project.dataset.table'")
+    return table
+
+
+def _visitor_id_source(project_id: str, priority: str = DEFAULT_PRIORITY) -> str:
+    """
+    Table visitor-set queries join for dense visitor ids: the materialized id map when it is readable,
+    else the result table of one id-map job, reused by this process for VISITOR_ID_MAP_TTL_SECONDS.
+    """
+    from google.api_core.exceptions import GoogleAPICallError
+
+    configured = _visitor_id_table_name()
+    cached = _VISITOR_ID_MAP.get(configured or "")
+    if cached and time.time() - cached[1] < VISITOR_ID_MAP_TTL_SECONDS:
+        return cached[0]
+
+    resolved = None
+    if configured:
+        try:
+            _bq_client(project_id).get_table(configured)
+            resolved = configured
+        except GoogleAPICallError as exc:
+            logger.warning(
+                "Visitor id table %s not readable; running the id map query (run materialize_session_extract): %s",
+                configured,
+                exc,
+            )
+    if resolved is None:
+        with tracing.span("server.visitor_id_map"):
+            job = _run_bq_job(_visitor_id_map_sql(), [], project_id, fetch=False, priority=priority)[0]
+        dest = job.destination
+        resolved = f"{dest.project}.{dest.dataset_id}.{dest.table_id}"
+    _VISITOR_ID_MAP[configured or ""] = (resolved, time.time())
+    return resolved
+
+
+def _source_note(source_table: Optional[str]) -> str:
+    if source_table:
+        return f"`{source_table}` (session extract of `{DATASET}.ga_sessions_*`)"
+    return f"`{DATASET}.ga_sessions_*` (public sample dataset)"
+
+
+def _build_extract_query(destination: str) -> str:
+    """
+    DDL for the flat session extract: one row per session passing the KPI hit filters, the session-level
+    dimensions as plain columns, pageviews pre-counted and page titles folded into an array of
+    (page_title, pageviews). Partitioned by session date and clustered by the common segment columns,
+    so KPI queries read only the referenced columns / date partitions instead of the nested hits.
+    """
+    session_dims = ",\n      ".join(f"{expr} AS {d}" for d, expr in DIMENSIONS.items() if d != "page_title")
+    page_hits = "FROM UNNEST(hits) AS hits WHERE hits.type = 'PAGE'"
+    query = f"""
+    CREATE OR REPLACE TABLE `{destination}`
+    PARTITION BY session_date
+    CLUSTER BY traffic_source, medium, device_type
+    AS
+    SELECT
+      fullVisitorId,
+      visitId,
+      PARSE_DATE('%Y%m%d', date) AS session_date,
+      {session_dims},
+      totals.timeOnSite AS timeOnSite,
+      totals.transactions AS transactions,
+      (SELECT COUNT(1) {page_hits}) AS pageviews,
+      ARRAY(
+        SELECT AS STRUCT {DIMENSIONS["page_title"]} AS page_title, COUNT(1) AS pageviews
+        {page_hits}
+        GROUP BY page_title
+      ) AS page_titles
+    FROM `{TABLE_WILDCARD}`
+    WHERE
+      trafficSource.source IS NOT NULL
+      AND trafficSource.source != '(not set)'
+      AND trafficSource.medium IS NOT NULL
+      AND trafficSource.medium NOT IN ('(not set)', '(none)')
+      AND totals.visits >= 1
+      AND EXISTS(SELECT 1 {page_hits})
+    """
+    return query
+
+
+def _size_guard(
+    tool_name: str,
+    dimensions: List[str],
+    months: List[str],
+    min_pageviews: int,
+    bounded: bool,
+    allow_large: bool,
+    periods: int = 1,
+) -> Dict[str, Any]:
+    """
+    Estimate the result size from the dimension catalog and decide what to do with the request:
+      action=none        small enough, not cataloged, or already bounded by limit/top_segments
+      action=auto_limit  unbounded and above AUTO_LIMIT_ROWS -> caller caps it (unless allow_large)
+    Raises ValueError for unbounded requests above MAX_ESTIMATED_ROWS, unless allow_large: the estimate is a
+    loose upper bound, and callers that need the complete result take the risk of a large one.
+    """
+    estimate = DimensionCatalog.from_env().estimate_rows(dimensions, months, min_pageviews, periods=periods)
+    guard: Dict[str, Any] = {"estimated_rows": estimate, "action": "none"}
+    if estimate is None or bounded:
+        return guard
+
+    if allow_large:
+        if estimate > AUTO_LIMIT_ROWS:
+            logger.info("Large %s allowed: dimensions=%s estimated_rows=%d", tool_name, dimensions, estimate)
+        return guard
+    if estimate > MAX_ESTIMATED_ROWS:
+        logger.error(
+            "Rejected %s: dimensions=%s estimated_rows=%d > %d", tool_name, dimensions, estimate, MAX_ESTIMATED_ROWS
+        )
+        raise ValueError(
+            f"Request too large: ~{estimate:,} rows estimated for dimensions {dimensions} (max {MAX_ESTIMATED_ROWS:,}). "
+            "Use fewer/coarser dimensions, a higher min_pageviews, or a limit."
+        )
+    if estimate > AUTO_LIMIT_ROWS:
+        logger.warning("Auto-limiting %s: dimensions=%s estimated_rows=%d", tool_name, dimensions, estimate)
+        guard["action"] = "auto_limit"
+    return guard
+
+
+def _sql_fingerprint(query: str) -> str:
+    """
+    Short hash of the SQL text. The full text is logged (DEBUG) the first time a hash is seen by this
+    process; afterwards logs (and the job's `sql_hash` label) carry the hash only.
+    """
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+    if digest not in _LOGGED_SQL:
+        _LOGGED_SQL.add(digest)
+        logger.debug("Query SQL [%s]:\n%s", digest, query)
+    return digest
+
+
+def _run_bq(
+    query: str,
+    params: List[bigquery.ScalarQueryParameter],
+    project_id: str,
+    priority: str = DEFAULT_PRIORITY,
+) -> ResultRows:
+    return _run_bq_job(query, params, project_id, priority=priority)[1]
+
+
+@functools.lru_cache(maxsize=None)
+def _job_scheduler() -> JobScheduler:
+    """One scheduler per server process (limits and billing projects from the environment)."""
+    scheduler = JobScheduler.from_env()
+    logger.info(
+        "Job scheduler: billing_projects=%s max_concurrent=%d max_bytes_per_hour=%d",
+        scheduler.projects or "<per request>",
+        scheduler.max_concurrent,
+        scheduler.max_bytes_per_hour,
+    )
+    return scheduler
+
+
+def _run_bq_job(
+    query: str,
+    params: List[bigquery.ScalarQueryParameter],
+    project_id: str,
+    fetch: bool = True,
+    priority: str = DEFAULT_PRIORITY,
+) -> Tuple[bigquery.QueryJob, ResultRows, JobTicket]:
+    """
+    Submit + wait (+ fetch rows unless fetch=false, e.g. when only the job's result table is used),
+    once the job scheduler grants a slot in a billing project; rate-limited attempts are re-queued there.
+    Rows are fetched column by column (the result's Arrow table), typed and normalized by row_codec.
+    """
+    import os
+
+    from google.cloud import bigquery
+
+    storage_api = os.getenv(STORAGE_API_ENV, "0") == "1"
+
+    sql_hash = _sql_fingerprint(query)
+    logger.info(
+        "Running BigQuery job: project_id=%s priority=%s sql=%s params=%s",
+        project_id,
+        priority,
+        sql_hash,
+        [p.name for p in params],
+    )
+
+    def attempt(ticket: JobTicket) -> Tuple[bigquery.QueryJob, ResultRows]:
+        billing_project = ticket.project or project_id
+        start = time.time()
+        try:
+            with tracing.span(
+                "bq.submit",
+                project_id=billing_project,
+                sql_hash=sql_hash,
+                priority=priority,
+                attempt=ticket.attempts,
+                queue_wait_s=round(ticket.queue_wait_s, 3),
+            ) as sp:
+                client = _bq_client(billing_project)
+                job_config = bigquery.QueryJobConfig(
+                    query_parameters=params, labels={"sql_hash": sql_hash, "priority": priority}
+                )
+                job = client.query(query, job_config=job_config)
+                sp.set_attributes(job_id=job.job_id, location=job.location)
+
+            logger.info("BigQuery job submitted: job_id=%s location=%s", job.job_id, job.location)
+            with tracing.span("bq.wait", job_id=job.job_id) as sp:
+                rows = job.result()  # waits
+                sp.set_attributes(
+                    total_bytes_processed=job.total_bytes_processed,
+                    cache_hit=job.cache_hit,
+                    total_rows=rows.total_rows,
+                )
+            ticket.bytes_processed = job.total_bytes_processed
+
+            data = ResultRows([], [])
+            if fetch:
+                with tracing.span("bq.fetch", job_id=job.job_id, storage_api=storage_api) as sp:
+                    data = ResultRows.from_bq(rows, storage_api=storage_api)
+                    sp.set_attribute("rows", len(data))
+            elapsed = time.time() - start
+            logger.info("BigQuery job done: job_id=%s rows=%d elapsed=%.2fs", job.job_id, len(data), elapsed)
+            metrics.record_bq_job(
+                billing_project, elapsed, ok=True, bytes_processed=job.total_bytes_processed, cache_hit=job.cache_hit
+            )
+            return job, data
+
+        except Exception as exc:
+            elapsed = time.time() - start
+            if is_rate_limited(exc):
+                logger.warning("BigQuery query rate limited after %.2fs: project_id=%s", elapsed, billing_project)
+            else:
+                logger.exception("BigQuery query failed after %.2fs", elapsed)
+                _forget_missing_tables(query, exc)
+            metrics.record_bq_job(billing_project, elapsed, ok=False)
+            raise
+
+    (job, data), ticket = _job_scheduler().run(attempt, project_id, priority, cost_key=sql_hash)
+    jobs = _TOOL_JOBS.get()
+    if jobs is not None:
+        jobs.append(ticket.to_dict())
+    return job, data, ticket
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """Server-side / connection errors worth another attempt; rate limits are left to the job scheduler."""
+    from google.api_core import retry
+
+    return retry.if_transient_error(exc) and not is_rate_limited(exc)
+
+
+def _run_shards(
+    dimensions: List[str],
+    ranges: List[Tuple[str, str]],
+    project_id: str,
+    source_table: Optional[str],
+    max_concurrency: int,
+    priority: str = DEFAULT_PRIORITY,
+) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Run one shard job per suffix range on a bounded thread pool, each retried once on a transient error
+    (server / connection errors; rate limits are retried by the job scheduler, anything else fails the call).
+    Shards are collected as they finish, so one slow shard only delays the merge, not the other shards.
+    Returns the shard result tables (in range order) and per-shard stats (in completion order).
+    """
+    parent = tracing.current_traceparent()  # worker threads start without the tool span context
+
+    def run(start: str, end: str) -> Tuple[bigquery.QueryJob, JobTicket, float]:
+        query, params = _build_shard_query(dimensions, start, end, source_table)
+        with tracing.attach(parent), tracing.span("server.shard", suffix_start=start, suffix_end=end):
+            t0 = time.time()
+            try:
+                job, _, ticket = _run_bq_job(query, params, project_id, fetch=False, priority=priority)
+            except Exception as exc:
+                if not _is_transient(exc):
+                    raise
+                logger.warning("Shard %s..%s failed with a transient error; retrying once: %s", start, end, exc)
+                job, _, ticket = _run_bq_job(query, params, project_id, fetch=False, priority=priority)
+            return job, ticket, time.time() - t0
+
+    tables: List[Optional[str]] = [None] * len(ranges)
+    stats: List[Dict[str, Any]] = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        futures = {pool.submit(run, start, end): i for i, (start, end) in enumerate(ranges)}
+        for fut in concurrent.futures.as_completed(futures):
+            i = futures[fut]
+            job, ticket, elapsed = fut.result()
+            dest = job.destination
+            tables[i] = f"{dest.project}.{dest.dataset_id}.{dest.table_id}"
+            stats.append(
+                {
+                    "suffix_start": ranges[i][0],
+                    "suffix_end": ranges[i][1],
+                    "elapsed_s": round(elapsed, 3),
+                    "queue_wait_s": round(ticket.queue_wait_s, 3),
+                    "billing_project": ticket.project,
+                    "attempts": ticket.attempts,
+                    "bytes_processed": job.total_bytes_processed,
+                    "cache_hit": job.cache_hit,
+                }
+            )
+            logger.info("Shard %d/%d done: %s..%s in %.2fs", len(stats), len(ranges), *ranges[i], elapsed)
+    return [t for t in tables if t is not None], stats
+
 
+def _page_info(
+    data: ResultRows,
+    order_by: str,
+    descending: bool,
+    limit: Optional[int],
+    offset: int,
+) -> Dict[str, Any]:
+    """
+    Strip the window-count helper column from rows and describe the returned page.
+    """
+    counts = data.pop_column("total_row_count")
+    total = counts[0] if counts else None  # COUNT(*) OVER (): the same on every row
+
+    if total is None and offset == 0:
+        total = 0  # Empty first page -> no qualifying segments at all
+
+    return {
+        "order_by": order_by,
+        "descending": descending,
+        "limit": limit,
+        "offset": offset,
+        "total_row_count": total,
+        "has_more": total is not None and offset + len(data) < total,
+    }
+
+
+def _applied_limits(
+    order_by: str,
+    descending: bool,
+    limit: Optional[int],
+    offset: int,
+    min_pageviews: int,
+) -> Dict[str, Any]:
+    """
+    Echo of the filters/limits applied in SQL, for the `notes` block.
+    """
+    return {
+        "having": f"total_pageviews >= {min_pageviews}",
+        "order_by": f"{order_by} {'DESC' if descending else 'ASC'}",
+        "limit": limit,
+        "offset": offset,
+    }
+
+
+@contextlib.contextmanager
+def _tool_span(tool_name: str, ctx: Context | None, **attributes: Any) -> Iterator[tracing.Span]:
+    """
+    Server-side root span for a tool call, parented to the client's trace via the request `_meta`.
+    Also records the per-tool / per-dimension-set request metrics and collects the call's job stats.
+    """
+    meta = None
+    if ctx is not None:
+        try:
+            meta = ctx.request_context.meta
+        except ValueError:  # Called outside of an MCP request (e.g. directly from Python)
+            meta = None
+
+    start = time.time()
+    ok = False
+    jobs_token = _TOOL_JOBS.set([])
     try:
-        client = bigquery.Client(project=project_id)
-        job_config = bigquery.QueryJobConfig(query_parameters=params)
-        job = client.query(query, job_config=job_config)
+        with tracing.attach(tracing.traceparent_from_meta(meta)):
+            with tracing.span(f"server.tool.{tool_name}", **attributes) as sp:
+                try:
+                    yield sp
+                    ok = True
+                finally:
+                    metrics.record_tool_call(
+                        tool_name,
+                        attributes.get("dimensions") or [],
+                        time.time() - start,
+                        ok=ok,
+                        row_count=sp.attributes.get("row_count"),
+                    )
+    finally:
+        _TOOL_JOBS.reset(jobs_token)
+
+
+def _tool_jobs() -> List[Dict[str, Any]]:
+    """Scheduler stats (billing project, queue wait, attempts, bytes) of the current tool call's jobs."""
+    return list(_TOOL_JOBS.get() or [])
+
+
+def _encode_response(resp: Dict[str, Any], row_format: str = DEFAULT_ROW_FORMAT) -> str:
+    with tracing.span("server.json_encode", rows=resp.get("row_count"), row_format=row_format) as sp:
+        text = encode_response(resp, row_format)
+        sp.set_attribute("bytes", len(text))
+    return text
+
+
+def _tool() -> Callable[[Callable[..., str]], Callable[..., str]]:
+    """
+    Register a (blocking) tool with FastMCP as an async wrapper that runs it in a worker thread, so one
+    BigQuery job doesn't stall the event loop of a shared HTTP worker. The module keeps the plain function.
+    """
+
+    def register(fn: Callable[..., str]) -> Callable[..., str]:
+        @functools.wraps(fn)
+        async def run_in_thread(*args: Any, **kwargs: Any) -> str:
+            return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs))
 
-        logger.info("BigQuery job submitted: job_id=%s location=%s", job.job_id, job.location)
-        rows = job.result()  # waits
+        mcp.tool()(run_in_thread)
+        return fn
 
-        data = [dict(r) for r in rows]
-        elapsed = time.time() - start
-        logger.info("BigQuery job done: job_id=%s rows=%d elapsed=%.2fs", job.job_id, len(data), elapsed)
-        return data
+    return register
 
-    except Exception:
-        elapsed = time.time() - start
-        logger.exception("BigQuery query failed after %.2fs", elapsed)
-        raise
 
+_BQ_CLIENTS: Dict[str, bigquery.Client] = {}
+_BQ_CLIENTS_LOCK = threading.Lock()
 
-@mcp.tool()
+
+def _bq_client(project_id: str) -> bigquery.Client:
+    """One BigQuery client per project and process (reused across calls by long-lived HTTP workers)."""
+    from google.cloud import bigquery
+
+    with _BQ_CLIENTS_LOCK:
+        client = _BQ_CLIENTS.get(project_id)
+        if client is None:
+            client = _BQ_CLIENTS[project_id] = bigquery.Client(project=project_id)
+        return client
+
+
+@_tool()
 def get_monthly_data(
     month: str,
     dimensions: List[DimensionLiteral],
     project_id: str = DEFAULT_PROJECT,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    order_by: KpiLiteral = DEFAULT_ORDER_BY,
+    descending: bool = True,
+    min_pageviews: int = DEFAULT_MIN_PAGEVIEWS,
+    allow_large: bool = False,
+    priority: PriorityLiteral = DEFAULT_PRIORITY,
+    row_format: RowFormatLiteral = DEFAULT_ROW_FORMAT,
+    ctx: Context = None,  # injected by FastMCP
 ) -> str:
-    suffix_start, suffix_end = _month_to_suffix_range(month)
-    query, params = _build_query(dimensions=list(dimensions), suffix_start=suffix_start, suffix_end=suffix_end)
-    data = _run_bq(query, params, project_id=project_id)
-
-    resp = {
-        "scope": "month",
-        "month": month,
-        "dimensions": list(dimensions),
-        "kpis": KPI_FIELDS,
-        "row_count": len(data),
-        "rows": data,
-        "notes": {
-            "source": f"`{DATASET}.ga_sessions_*` (public sample dataset)",
-            "table_suffix_filter": {"start": suffix_start, "end": suffix_end},
-            "having": "total_pageviews >= 20",
-        },
-    }
+    """
+    KPIs per segment for one month (YYYY-MM).
+    Use limit/offset/order_by to fetch one page (top-K) instead of every segment,
+    and min_pageviews to drop small segments in SQL.
+    Unbounded requests estimated (dimension catalog) above the auto-limit are capped to one page
+    unless allow_large=true; see notes.size_guard.
+    priority=batch queues the BigQuery job behind interactive ones (notes.jobs has the queue wait).
+    row_format=columns returns rows as {column: [values]} (smaller, faster to parse); `columns` has the types.
+    """
+    with _tool_span("get_monthly_data", ctx, month=month, dimensions=list(dimensions), limit=limit) as sp:
+        suffix_start, suffix_end = _month_to_suffix_range(month)
+        guard = _size_guard(
+            "get_monthly_data", list(dimensions), [month], min_pageviews, limit is not None, allow_large
+        )
+        if guard["action"] == "auto_limit":
+            limit, offset = MAX_PAGE_SIZE, 0
+        source_table = _session_source(project_id)
+        with tracing.span("server.build_query"):
+            query, params = _build_query(
+                dimensions=list(dimensions),
+                suffix_start=suffix_start,
+                suffix_end=suffix_end,
+                order_by=order_by,
+                descending=descending,
+                limit=limit,
+                offset=offset,
+                min_pageviews=min_pageviews,
+                source_table=source_table,
+            )
+        data = _run_bq(query, params, project_id=project_id, priority=priority)
+        page = _page_info(data, order_by, descending, limit, offset)
+
+        resp = {
+            "scope": "month",
+            "month": month,
+            "dimensions": list(dimensions),
+            "kpis": KPI_FIELDS,
+            "row_count": len(data),
+            "page": page,
+            "rows": data,
+            "notes": {
+                "source": _source_note(source_table),
+                "table_suffix_filter": {"start": suffix_start, "end": suffix_end},
+                **_applied_limits(order_by, descending, limit, offset, min_pageviews),
+                "size_guard": guard,
+                "jobs": _tool_jobs(),
+            },
+        }
+        sp.set_attribute("row_count", resp["row_count"])
 
-    logger.info("Tool get_monthly_data returning: row_count=%d", resp["row_count"])
-    return json.dumps(resp)  # <-- IMPORTANT: return text JSON
+        logger.info("Tool get_monthly_data returning: row_count=%d", resp["row_count"])
+        return _encode_response(resp, row_format)  # <-- IMPORTANT: return text JSON
 
 
-@mcp.tool()
+@_tool()
 def get_all_data(
     dimensions: List[DimensionLiteral],
     project_id: str = DEFAULT_PROJECT,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    order_by: KpiLiteral = DEFAULT_ORDER_BY,
+    descending: bool = True,
+    min_pageviews: int = DEFAULT_MIN_PAGEVIEWS,
+    allow_large: bool = False,
+    shard_by: Optional[GrainLiteral] = None,
+    max_concurrency: int = DEFAULT_SHARD_CONCURRENCY,
+    priority: PriorityLiteral = DEFAULT_PRIORITY,
+    row_format: RowFormatLiteral = DEFAULT_ROW_FORMAT,
+    ctx: Context = None,  # injected by FastMCP
 ) -> str:
-    query, params = _build_query(dimensions=list(dimensions), suffix_start=None, suffix_end=None)
-    data = _run_bq(query, params, project_id=project_id)
-
-    resp = {
-        "scope": "all",
-        "dimensions": list(dimensions),
-        "kpis": KPI_FIELDS,
-        "row_count": len(data),
-        "rows": data,
-        "notes": {
-            "source": f"`{DATASET}.ga_sessions_*` (public sample dataset)",
-            "having": "total_pageviews >= 20",
-        },
-    }
+    """
+    KPIs per segment across the whole dataset.
+    Use limit/offset/order_by to fetch one page (top-K) instead of every segment,
+    and min_pageviews to drop small segments in SQL.
+    Unbounded requests estimated (dimension catalog) above the auto-limit are capped to one page
+    unless allow_large=true; see notes.size_guard.
+    shard_by=month|day runs one job per shard (max_concurrency at a time) and merges the partial
+    aggregates in a final job; total_visitors is then an HLL++ estimate (~0.5% error).
+    priority=batch queues the BigQuery jobs behind interactive ones (notes.jobs has the queue waits).
+    row_format=columns returns rows as {column: [values]} (smaller, faster to parse); `columns` has the types.
+    """
+    with _tool_span("get_all_data", ctx, dimensions=list(dimensions), limit=limit, shard_by=shard_by) as sp:
+        if not (1 <= max_concurrency <= MAX_SHARD_CONCURRENCY):
+            logger.error("Validation failed: max_concurrency=%s out of range", max_concurrency)
+            raise ValueError(f"max_concurrency must be between 1 and {MAX_SHARD_CONCURRENCY}")
+        # before any job runs: the sharded path only applies these in the final merge query
+        _validate_result_options(order_by, limit, offset, min_pageviews)
+        guard = _size_guard(
+            "get_all_data", list(dimensions), months_between(), min_pageviews, limit is not None, allow_large
+        )
+        if guard["action"] == "auto_limit":
+            limit, offset = MAX_PAGE_SIZE, 0
+        source_table = _session_source(project_id)
+
+        shard_stats = None
+        if shard_by:
+            ranges = _shard_ranges(shard_by, months_between())
+            shard_tables, shard_stats = _run_shards(
+                _validate_dimensions(list(dimensions)), ranges, project_id, source_table, max_concurrency, priority
+            )
+            with tracing.span("server.build_query"):
+                query, params = _build_merge_query(
+                    dimensions=list(dimensions),
+                    shard_tables=shard_tables,
+                    order_by=order_by,
+                    descending=descending,
+                    limit=limit,
+                    offset=offset,
+                    min_pageviews=min_pageviews,
+                )
+        else:
+            with tracing.span("server.build_query"):
+                query, params = _build_query(
+                    dimensions=list(dimensions),
+                    suffix_start=None,
+                    suffix_end=None,
+                    order_by=order_by,
+                    descending=descending,
+                    limit=limit,
+                    offset=offset,
+                    min_pageviews=min_pageviews,
+                    source_table=source_table,
+                )
+        data = _run_bq(query, params, project_id=project_id, priority=priority)
+        page = _page_info(data, order_by, descending, limit, offset)
+
+        resp = {
+            "scope": "all",
+            "dimensions": list(dimensions),
+            "kpis": KPI_FIELDS,
+            "row_count": len(data),
+            "page": page,
+            "rows": data,
+            "notes": {
+                "source": _source_note(source_table),
+                **_applied_limits(order_by, descending, limit, offset, min_pageviews),
+                "size_guard": guard,
+                "jobs": _tool_jobs(),
+            },
+        }
+        if shard_stats is not None:
+            resp["notes"]["shards"] = {
+                "shard_by": shard_by,
+                "count": len(shard_stats),
+                "max_concurrency": max_concurrency,
+                "total_visitors": "HLL++ estimate (sketches merged across shards)",
+                "completed": shard_stats,
+            }
+        sp.set_attribute("row_count", resp["row_count"])
+
+        logger.info("Tool get_all_data returning: row_count=%d", resp["row_count"])
+        return _encode_response(resp, row_format)  # <-- IMPORTANT
+
+
+@_tool()
+def get_trend_data(
+    dimensions: List[DimensionLiteral],
+    grain: GrainLiteral = "month",
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    project_id: str = DEFAULT_PROJECT,
+    min_pageviews: int = DEFAULT_MIN_PAGEVIEWS,
+    top_segments: Optional[int] = None,
+    allow_large: bool = False,
+    priority: PriorityLiteral = DEFAULT_PRIORITY,
+    row_format: RowFormatLiteral = DEFAULT_ROW_FORMAT,
+    ctx: Context = None,  # injected by FastMCP
+) -> str:
+    """
+    KPIs per segment per period (grain=month|day) from a single query, rows ordered by segment then period.
+    start_month/end_month (YYYY-MM) bound the range (default: whole dataset); top_segments keeps only the
+    N segments with most pageviews over the range, and min_pageviews drops segments below that total.
+    Without top_segments, requests estimated above the auto-limit get one (unless allow_large=true).
+    priority=batch queues the BigQuery job behind interactive ones (notes.jobs has the queue wait).
+    row_format=columns returns rows as {column: [values]} (smaller, faster to parse); `columns` has the types.
+    """
+    with _tool_span("get_trend_data", ctx, dimensions=list(dimensions), grain=grain) as sp:
+        suffix_start = _month_to_suffix_range(start_month)[0] if start_month else None
+        suffix_end = _month_to_suffix_range(end_month)[1] if end_month else None
+        if bool(suffix_start) != bool(suffix_end):
+            # Open-ended ranges are clamped to the dataset bounds (valid dates for the extract's date filter)
+            suffix_start = suffix_start or _month_to_suffix_range(DATASET_FIRST_MONTH)[0]
+            suffix_end = suffix_end or _month_to_suffix_range(DATASET_LAST_MONTH)[1]
+        if suffix_start and suffix_start > suffix_end:
+            raise ValueError("start_month must not be after end_month")
+
+        months = [m for m in months_between() if (start_month or m) <= m <= (end_month or m)]
+        periods = len(months)
+        if grain == "day":
+            periods = sum(calendar.monthrange(int(m[:4]), int(m[5:]))[1] for m in months)
+        guard = _size_guard(
+            "get_trend_data", list(dimensions), months, min_pageviews, top_segments is not None, allow_large, periods
+        )
+        if guard["action"] == "auto_limit":
+            top_segments = max(1, AUTO_LIMIT_ROWS // max(periods, 1))
+
+        source_table = _session_source(project_id)
+        with tracing.span("server.build_query"):
+            query, params = _build_trend_query(
+                dimensions=list(dimensions),
+                grain=grain,
+                suffix_start=suffix_start,
+                suffix_end=suffix_end,
+                min_pageviews=min_pageviews,
+                top_segments=top_segments,
+                source_table=source_table,
+            )
+        data = _run_bq(query, params, project_id=project_id, priority=priority)
+
+        resp = {
+            "scope": "trend",
+            "grain": grain,
+            "dimensions": list(dimensions),
+            "kpis": KPI_FIELDS,
+            "periods": sorted(set(data.column("period"))) if len(data) else [],
+            "row_count": len(data),
+            "rows": data,
+            "notes": {
+                "source": _source_note(source_table),
+                "table_suffix_filter": {"start": suffix_start, "end": suffix_end},
+                "having": f"segment total_pageviews >= {min_pageviews}",
+                "top_segments": top_segments,
+                "size_guard": guard,
+                "jobs": _tool_jobs(),
+            },
+        }
+        sp.set_attribute("row_count", resp["row_count"])
 
-    logger.info("Tool get_all_data returning: row_count=%d", resp["row_count"])
-    return json.dumps(resp)  # <-- IMPORTANT
+        logger.info("Tool get_trend_data returning: row_count=%d periods=%d", len(data), len(resp["periods"]))
+        return _encode_response(resp, row_format)
+
+
+@_tool()
+def get_visitor_sets(
+    dimensions: List[DimensionLiteral],
+    month: Optional[str] = None,
+    project_id: str = DEFAULT_PROJECT,
+    allow_large: bool = False,
+    priority: PriorityLiteral = DEFAULT_PRIORITY,
+    row_format: RowFormatLiteral = DEFAULT_ROW_FORMAT,
+    ctx: Context = None,  # injected by FastMCP
+) -> str:
+    """
+    Exact visitor set per segment for one month (YYYY-MM) or, without month, the whole dataset.
+    Each row has the segment's total_visitors and `visitors`: a base64 roaring bitmap of dense visitor ids
+    that agree across months and dimension sets, so clients can OR sets of several months / finer segments
+    into exact distinct visitor counts (see visitor_bitmaps). Every segment is returned (no min_pageviews);
+    requests estimated above the auto-limit are rejected unless allow_large=true.
+    priority=batch queues the BigQuery job behind interactive ones (notes.jobs has the queue wait).
+    row_format=columns returns rows as {column: [values]} (smaller, faster to parse); `columns` has the types.
+    """
+    # deferred: numpy is only needed by this tool, and the server is spawned once per tool call
+    from src.ga_ad_agent.visitor_bitmaps import ENCODING, RoaringBitmap
+
+    with _tool_span("get_visitor_sets", ctx, month=month, dimensions=list(dimensions)) as sp:
+        suffix_start, suffix_end = _month_to_suffix_range(month) if month else (None, None)
+        guard = _size_guard(
+            "get_visitor_sets", list(dimensions), [month] if month else months_between(), 0, False, allow_large
+        )
+        if guard["action"] == "auto_limit":
+            # A page of segments can't be rolled up exactly, so there is no auto-limit fallback
+            raise ValueError(
+                f"Request too large: ~{guard['estimated_rows']:,} visitor sets estimated for dimensions "
+                f"{list(dimensions)}. Use fewer/coarser dimensions, or allow_large=true."
+            )
+        source_table = _session_source(project_id)
+        id_table = _visitor_id_source(project_id, priority)
+        with tracing.span("server.build_query"):
+            query, params = _build_visitor_set_query(
+                list(dimensions), suffix_start, suffix_end, id_table, source_table
+            )
+        data = _run_bq(query, params, project_id=project_id, priority=priority)
+
+        with tracing.span("server.encode_bitmaps", rows=len(data)):
+            bitmaps = [RoaringBitmap.from_ids(ids) for ids in data.pop_column("visitor_ids") or []]
+            data.set_column("total_visitors", "INT64", [len(b) for b in bitmaps])
+            data.set_column("visitors", "STRING", [b.to_base64() for b in bitmaps])
+            total_visitors = len(RoaringBitmap.union_all(bitmaps)) if bitmaps else 0
+
+        resp = {
+            "scope": "month" if month else "all",
+            "month": month,
+            "dimensions": list(dimensions),
+            "encoding": ENCODING,
+            "row_count": len(data),
+            "total_visitors": total_visitors,
+            "rows": data,
+            "notes": {
+                "source": _source_note(source_table),
+                "table_suffix_filter": {"start": suffix_start, "end": suffix_end},
+                "visitor_ids": f"rank of fullVisitorId among all visitors of `{DATASET}.ga_sessions_*`",
+                "visitor_id_table": id_table,
+                "size_guard": guard,
+                "jobs": _tool_jobs(),
+            },
+        }
+        sp.set_attribute("row_count", resp["row_count"])
+
+        logger.info("Tool get_visitor_sets returning: row_count=%d total_visitors=%d", len(data), total_visitors)
+        return _encode_response(resp, row_format)
+
+
+@_tool()
+def refresh_dimension_catalog(
+    months: Optional[List[str]] = None,
+    force: bool = False,
+    max_age_hours: Optional[float] = None,
+    project_id: str = DEFAULT_PROJECT,
+    ctx: Context = None,  # injected by FastMCP
+) -> str:
+    """
+    Build/refresh the local dimension catalog (distinct counts + top values per dimension and month).
+    Only months that are missing (or older than max_age_hours, or all with force=true) are queried;
+    the catalog is saved after each month, so an interrupted refresh resumes where it stopped.
+    """
+    wanted = months or months_between()
+    with _tool_span("refresh_dimension_catalog", ctx, months=len(wanted), force=force) as sp:
+        catalog = DimensionCatalog.from_env()
+        max_age = max_age_hours * 3600 if max_age_hours is not None else None
+        todo = list(wanted) if force else catalog.missing_months(wanted, max_age)
+        logger.info("Catalog refresh: path=%s months=%s todo=%s", catalog.path, wanted, todo)
+
+        for month in todo:
+            suffix_start, suffix_end = _month_to_suffix_range(month)
+            with tracing.span("server.build_query"):
+                query, params = _build_catalog_query(suffix_start, suffix_end)
+            data = _run_bq(query, params, project_id=project_id, priority="batch")
+            catalog.set_month(month, entry_from_row(data.row(0) if len(data) else {}))
+            catalog.save()
+
+        sp.set_attribute("row_count", len(todo))
+        return json.dumps({"refreshed": todo, "skipped": [m for m in wanted if m not in todo], **catalog.summary()})
+
+
+@_tool()
+def materialize_session_extract(
+    project_id: str = DEFAULT_PROJECT,
+    destination: Optional[str] = None,
+    force: bool = False,
+    ctx: Context = None,  # injected by FastMCP
+) -> str:
+    """
+    Build the flat session extract (destination or SESSION_EXTRACT_TABLE) that KPI queries read instead of
+    the nested export. Skipped when the table already exists unless force=true.
+    Also builds the dense visitor id map get_visitor_sets joins (VISITOR_ID_TABLE or "<extract>_visitor_ids")
+    when it is missing; the ids never change, so force=true does not rebuild it.
+    """
+    from google.api_core.exceptions import NotFound
+    from google.cloud import bigquery
+
+    table = _extract_table(destination)
+    if not table:
+        raise ValueError(f"Pass destination or set {SESSION_EXTRACT_ENV} to 'project.dataset.table'")
+
+    with _tool_span("materialize_session_extract", ctx, destination=table, force=force) as sp:
+        client = _bq_client(project_id)
+        exists = False
+        if not force:
+            try:
+                client.get_table(table)
+                exists = True
+                logger.info("Session extract %s already exists; skipping (force=true rebuilds)", table)
+            except NotFound:
+                pass
+
+        if not exists:
+            with tracing.span("server.build_query"):
+                query = _build_extract_query(table)
+            _run_bq(query, [], project_id=project_id, priority="batch")
+
+        id_table = _visitor_id_table_name(table)
+        try:
+            client.get_table(id_table)
+            id_built = False
+        except NotFound:
+            with tracing.span("server.build_query"):
+                id_query = _build_visitor_id_table_query(id_table)
+            _run_bq(id_query, [], project_id=project_id, priority="batch")
+            id_built = True
+        _VISITOR_ID_MAP[id_table] = (id_table, time.time())
+
+        info = client.get_table(table)
+        _EXTRACT_STATE[table] = (True, time.time())
+        sp.set_attribute("row_count", info.num_rows)
+        return json.dumps(
+            {
+                "destination": table,
+                "built": not exists,
+                "num_rows": info.num_rows,
+                "num_bytes": info.num_bytes,
+                "partitioning": "session_date (DAY)",
+                "clustering": info.clustering_fields,
+                "active": table == _extract_table(),
+                "visitor_id_table": id_table,
+                "visitor_id_table_built": id_built,
+            }
+        )
+
+
+@_tool()
+def get_server_stats(format: Literal["json", "prometheus"] = "json") -> str:  # noqa: A002
+    """
+    Aggregate server metrics: tool request counts/errors, latency and row histograms per tool and
+    dimension set, BigQuery job durations, bytes processed, scheduler queue waits / retries, and (json)
+    the job scheduler's current queue, running jobs and bytes window per billing project.
+    """
+    if format == "prometheus":
+        return metrics.render_prometheus()
+    return json.dumps({**metrics.snapshot(), "scheduler": _job_scheduler().stats()})
+
+
+def _prewarm_bigquery() -> None:
+    start = time.time()
+    try:
+        import google.cloud.bigquery  # noqa: F401
+        import google.api_core.exceptions  # noqa: F401
+    except Exception:  # noqa: BLE001
+        logger.exception("BigQuery pre-import failed")
+        return
+    logger.debug("BigQuery pre-imported in %.2fs", time.time() - start)
+
+
+def http_app() -> Any:
+    """
+    ASGI app of the streamable HTTP transport; uvicorn calls this factory once per worker process.
+    """
+    threading.Thread(target=_prewarm_bigquery, name="bq-prewarm", daemon=True).start()
+    return mcp.streamable_http_app()
 
 
 def main():
-    logger.info("Running MCP server...")
-    mcp.run()
+    import os
+
+    transport = os.getenv("MCP_TRANSPORT", "stdio")
+    if transport not in ("stdio", "http"):
+        raise ValueError(f"MCP_TRANSPORT must be 'stdio' or 'http', got {transport!r}")
+    workers = int(os.getenv("MCP_HTTP_WORKERS", "1"))
+
+    # Import BigQuery while the client runs the MCP handshake instead of before it; the first tool call
+    # waits on the import lock only if the import is still running
+    threading.Thread(target=_prewarm_bigquery, name="bq-prewarm", daemon=True).start()
+
+    # Optional Prometheus scrape endpoint (GET /metrics) next to the MCP transport
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port and transport == "http" and workers > 1:
+        # Tool calls are served by the worker processes; this process would only export empty metrics
+        logger.warning("METRICS_PORT is ignored with MCP_HTTP_WORKERS > 1 (use get_server_stats per worker)")
+    elif metrics_port:
+        try:
+            metrics.start_http_exporter(int(metrics_port))
+        except OSError:
+            logger.exception("Could not start metrics endpoint on port %s", metrics_port)
+
+    if transport == "stdio":
+        logger.info("Running MCP server...")
+        mcp.run()
+        return
+
+    import uvicorn
+
+    host = os.getenv("MCP_HTTP_HOST", "127.0.0.1")
+    port = int(os.getenv("MCP_HTTP_PORT", str(DEFAULT_HTTP_PORT)))
+    logger.info("Running MCP server (streamable HTTP): http://%s:%d/mcp workers=%d", host, port, workers)
+    # Multiple workers need an import string (each worker process imports the app itself)
+    app = HTTP_APP_IMPORT if workers > 1 else http_app
+    uvicorn.run(app, factory=True, host=host, port=port, workers=workers, log_level="warning")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,274 @@
+"""
+Quota-aware admission of BigQuery jobs in the MCP server process.
+
+Every job waits for a slot before it is submitted (`JobScheduler.run`):
+  priority     interactive jobs are admitted before batch jobs (FIFO within a priority), and batch jobs
+               leave BQ_INTERACTIVE_RESERVED_JOBS slots of every project to interactive ones
+  concurrency  at most BQ_MAX_CONCURRENT_JOBS running jobs per billing project
+  bytes        at most BQ_MAX_BYTES_PER_HOUR bytes processed per billing project in a sliding hour; a job
+               reserves the bytes of the last run of the same SQL (0 if unseen) until its actual
+               bytes_processed is known. A job is always admitted to a project with an empty window.
+  projects     jobs are spread over BQ_BILLING_PROJECTS (least busy first, the requested project on ties);
+               unset = the tool's project_id only
+  retries      rate-limit errors (HTTP 429, rateLimitExceeded / jobRateLimitExceeded) release the slot
+               and cool the project down for an exponential backoff with jitter before the job is
+               re-admitted (possibly to another project), up to BQ_RATE_LIMIT_RETRIES times
+Limits apply per server process (every HTTP worker has its own scheduler). Jobs are plain callables
+given their JobTicket, so the scheduler runs unchanged against a fake BigQuery client.
+"""
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Literal, Optional, Sequence, Tuple, TypeVar
+
+from src.ga_ad_agent import metrics
+
+logger = logging.getLogger("ga-kpi-server")
+
+Priority = Literal["interactive", "batch"]
+PRIORITY_RANK: Dict[str, int] = {"interactive": 0, "batch": 1}
+
+BILLING_PROJECTS_ENV = "BQ_BILLING_PROJECTS"
+DEFAULT_MAX_CONCURRENT_JOBS = 8
+DEFAULT_INTERACTIVE_RESERVED_JOBS = 1
+DEFAULT_RATE_LIMIT_RETRIES = 4
+DEFAULT_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 32.0
+BYTES_WINDOW_SECONDS = 3600.0
+
+RATE_LIMIT_REASONS = frozenset({"rateLimitExceeded", "jobRateLimitExceeded"})
+
+T = TypeVar("T")
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """HTTP 429 or a BigQuery rate-limit reason (daily quotaExceeded is not retried)."""
+    if getattr(exc, "code", None) == 429:
+        return True
+    errors = getattr(exc, "errors", None) or []
+    return any(isinstance(e, dict) and e.get("reason") in RATE_LIMIT_REASONS for e in errors)
+
+
+@dataclass
+class JobTicket:
+    """One scheduled job: where it ran, how long it queued and how often it was retried."""
+
+    priority: str
+    requested_project: str
+    cost_key: Optional[str] = None
+    project: Optional[str] = None  # billing project of the current / last attempt
+    queue_wait_s: float = 0.0  # over all attempts
+    attempts: int = 0
+    bytes_processed: Optional[int] = None  # set by the job once known
+    _reservation: Optional[List[float]] = field(default=None, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "priority": self.priority,
+            "billing_project": self.project,
+            "queue_wait_s": round(self.queue_wait_s, 3),
+            "attempts": self.attempts,
+            "bytes_processed": self.bytes_processed,
+        }
+
+
+class JobScheduler:
+    """
+    Blocking admission control shared by the server's worker threads (tool calls and shard pools).
+    """
+
+    def __init__(
+        self,
+        projects: Sequence[str] = (),
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT_JOBS,
+        interactive_reserved: int = DEFAULT_INTERACTIVE_RESERVED_JOBS,
+        max_bytes_per_hour: int = 0,
+        retries: int = DEFAULT_RATE_LIMIT_RETRIES,
+        backoff_s: float = DEFAULT_BACKOFF_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be >= 1")
+        self.projects = list(projects)
+        self.max_concurrent = max_concurrent
+        self.interactive_reserved = min(max(interactive_reserved, 0), max_concurrent - 1)
+        self.max_bytes_per_hour = max_bytes_per_hour
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self._clock = clock
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting: List[Tuple[int, int, JobTicket]] = []  # heap of (priority rank, arrival, ticket)
+        self._running: Dict[str, int] = {}
+        self._window: Dict[str, Deque[List[float]]] = {}  # project -> [admitted_at, bytes] entries
+        self._cooldown: Dict[str, float] = {}  # project -> no admissions before this clock value
+        self._last_bytes: Dict[str, int] = {}  # cost_key -> bytes of its last run
+
+    @classmethod
+    def from_env(cls) -> "JobScheduler":
+        projects = [p.strip() for p in os.getenv(BILLING_PROJECTS_ENV, "").split(",") if p.strip()]
+        return cls(
+            projects=projects,
+            max_concurrent=int(os.getenv("BQ_MAX_CONCURRENT_JOBS", str(DEFAULT_MAX_CONCURRENT_JOBS))),
+            interactive_reserved=int(
+                os.getenv("BQ_INTERACTIVE_RESERVED_JOBS", str(DEFAULT_INTERACTIVE_RESERVED_JOBS))
+            ),
+            max_bytes_per_hour=int(os.getenv("BQ_MAX_BYTES_PER_HOUR", "0")),
+            retries=int(os.getenv("BQ_RATE_LIMIT_RETRIES", str(DEFAULT_RATE_LIMIT_RETRIES))),
+            backoff_s=float(os.getenv("BQ_RETRY_BACKOFF_SECONDS", str(DEFAULT_BACKOFF_SECONDS))),
+        )
+
+    def run(
+        self,
+        job: Callable[[JobTicket], T],
+        project_id: str,
+        priority: str = "interactive",
+        cost_key: Optional[str] = None,
+    ) -> Tuple[T, JobTicket]:
+        """
+        Run `job(ticket)` once a slot in `ticket.project` is granted; the job submits to that billing
+        project and sets `ticket.bytes_processed`. Rate-limited attempts are re-queued with backoff.
+        """
+        if priority not in PRIORITY_RANK:
+            raise ValueError(f"Unknown priority: {priority}. Allowed: {sorted(PRIORITY_RANK)}")
+        ticket = JobTicket(priority=priority, requested_project=project_id, cost_key=cost_key)
+        while True:
+            self._acquire(ticket)
+            try:
+                result = job(ticket)
+            except Exception as exc:
+                retry = is_rate_limited(exc) and ticket.attempts <= self.retries
+                delay = self._release(ticket, rate_limited=retry)
+                if not retry:
+                    raise
+                logger.warning(
+                    "BigQuery rate limit in project %s (attempt %d/%d); retrying in >= %.1fs: %s",
+                    ticket.project,
+                    ticket.attempts,
+                    self.retries + 1,
+                    delay,
+                    exc,
+                )
+                continue
+            self._release(ticket)
+            return result, ticket
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue / slot / bytes-window state per project, for get_server_stats."""
+        with self._cond:
+            now = self._clock()
+            waiting = [t for _, _, t in self._waiting]
+            projects = sorted(set(self.projects) | set(self._running) | set(self._window))
+            return {
+                "billing_projects": self.projects,
+                "max_concurrent_jobs": self.max_concurrent,
+                "interactive_reserved_jobs": self.interactive_reserved,
+                "max_bytes_per_hour": self.max_bytes_per_hour,
+                "waiting": {p: sum(t.priority == p for t in waiting) for p in PRIORITY_RANK},
+                "projects": {
+                    p: {
+                        "running": self._running.get(p, 0),
+                        "window_bytes": self._window_bytes(p, now),
+                        "cooldown_s": round(max(self._cooldown.get(p, now) - now, 0.0), 3),
+                    }
+                    for p in projects
+                },
+            }
+
+    # ---- internals (all below run under self._cond) ----
+
+    def _acquire(self, ticket: JobTicket) -> None:
+        start = self._clock()
+        with self._cond:
+            ticket.project = None
+            heapq.heappush(self._waiting, (PRIORITY_RANK[ticket.priority], next(self._seq), ticket))
+            self._dispatch()
+            while ticket.project is None:
+                self._cond.wait(timeout=self._next_wakeup())
+                self._dispatch()
+        wait = self._clock() - start
+        ticket.queue_wait_s += wait
+        ticket.attempts += 1
+        metrics.record_bq_queue_wait(ticket.priority, ticket.project or "", wait)
+        if wait > 1.0:
+            logger.info(
+                "BigQuery job admitted after %.2fs: priority=%s project=%s", wait, ticket.priority, ticket.project
+            )
+
+    def _release(self, ticket: JobTicket, rate_limited: bool = False) -> float:
+        """Free the ticket's slot and settle its bytes; returns the cooldown applied for a rate limit."""
+        project = ticket.project or ""
+        delay = 0.0
+        with self._cond:
+            self._running[project] -= 1
+            if ticket._reservation is not None:
+                ticket._reservation[1] = float(ticket.bytes_processed or 0)
+                ticket._reservation = None
+            if ticket.bytes_processed is not None and ticket.cost_key:
+                self._last_bytes[ticket.cost_key] = ticket.bytes_processed
+            if rate_limited:
+                delay = min(self.backoff_s * 2 ** (ticket.attempts - 1), MAX_BACKOFF_SECONDS) * random.uniform(1, 1.5)
+                self._cooldown[project] = max(self._cooldown.get(project, 0.0), self._clock() + delay)
+                metrics.record_bq_retry(project)
+            self._dispatch()
+            self._cond.notify_all()
+        return delay
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiting tickets in priority order."""
+        now = self._clock()
+        granted = False
+        for _, _, ticket in sorted(self._waiting):
+            project = self._pick(ticket, now)
+            if project is None:
+                continue
+            ticket.project = project
+            self._running[project] = self._running.get(project, 0) + 1
+            estimate = float(self._last_bytes.get(ticket.cost_key or "", 0))
+            ticket._reservation = [now, estimate]
+            self._window.setdefault(project, deque()).append(ticket._reservation)
+            granted = True
+        if granted:
+            self._waiting = [entry for entry in self._waiting if entry[2].project is None]
+            heapq.heapify(self._waiting)
+            self._cond.notify_all()
+
+    def _pick(self, ticket: JobTicket, now: float) -> Optional[str]:
+        limit = self.max_concurrent - (self.interactive_reserved if ticket.priority == "batch" else 0)
+        estimate = self._last_bytes.get(ticket.cost_key or "", 0)
+        best: Optional[Tuple[int, bool, str]] = None
+        for project in self.projects or [ticket.requested_project]:
+            running = self._running.get(project, 0)
+            if running >= limit or self._cooldown.get(project, 0.0) > now:
+                continue
+            if self.max_bytes_per_hour:
+                used = self._window_bytes(project, now)
+                if used and used + estimate > self.max_bytes_per_hour:
+                    continue
+            key = (running, project != ticket.requested_project, project)
+            if best is None or key < best:
+                best = key
+        return best[2] if best else None
+
+    def _window_bytes(self, project: str, now: float) -> int:
+        window = self._window.get(project)
+        if not window:
+            return 0
+        while window and window[0][0] <= now - BYTES_WINDOW_SECONDS:
+            window.popleft()
+        return int(sum(entry[1] for entry in window))
+
+    def _next_wakeup(self) -> Optional[float]:
+        """Seconds until a cooldown or a bytes-window entry expires (None: only a release can help)."""
+        now = self._clock()
+        deadlines = [t for t in self._cooldown.values() if t > now]
+        if self.max_bytes_per_hour:
+            deadlines += [w[0][0] + BYTES_WINDOW_SECONDS for w in self._window.values() if w]
+        return max(min(deadlines) - now, 0.01) if deadlines else None
@@ -0,0 +1,222 @@
+"""
+In-process, Prometheus-style metrics (counters + histograms with labels) for the MCP server.
+
+Recording is a dict update under a lock, so it is cheap enough for the tool hot path.
+Read via `snapshot()` (JSON) or `render_prometheus()` (text exposition format).
+"""
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("ga-kpi-server")
+
+LabelValues = Tuple[str, ...]
+
+LATENCY_BUCKETS_SECONDS: Tuple[float, ...] = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+ROW_BUCKETS: Tuple[float, ...] = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+_PROCESS_START = time.time()
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: LabelValues, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: LabelValues, value: float) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(labels)
+            if counts is None:
+                counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+                self._sums[labels] = 0.0
+            counts[idx] += 1
+            self._sums[labels] += value
+
+    def collect(self) -> Dict[LabelValues, Dict[str, Any]]:
+        with self._lock:
+            out = {}
+            for labels, counts in self._counts.items():
+                cumulative = []
+                running = 0
+                for c in counts:
+                    running += c
+                    cumulative.append(running)
+                out[labels] = {"buckets": cumulative, "count": running, "sum": self._sums[labels]}
+            return out
+
+
+TOOL_REQUESTS = Counter("ga_tool_requests_total", "MCP tool calls", ["tool", "dimensions", "status"])
+TOOL_LATENCY = Histogram(
+    "ga_tool_latency_seconds", "MCP tool call latency", ["tool", "dimensions"], LATENCY_BUCKETS_SECONDS
+)
+TOOL_ROWS = Histogram("ga_tool_rows_returned", "Rows returned per tool call", ["tool", "dimensions"], ROW_BUCKETS)
+BQ_JOBS = Counter("ga_bq_jobs_total", "BigQuery jobs", ["project_id", "status", "cache_hit"])
+BQ_JOB_DURATION = Histogram(
+    "ga_bq_job_duration_seconds", "BigQuery job duration (submit to last row)", ["project_id"], LATENCY_BUCKETS_SECONDS
+)
+BQ_BYTES_PROCESSED = Counter("ga_bq_bytes_processed_total", "BigQuery bytes processed", ["project_id"])
+BQ_QUEUE_WAIT = Histogram(
+    "ga_bq_queue_wait_seconds",
+    "Wait for a job scheduler slot before submission (per attempt)",
+    ["priority", "project_id"],
+    LATENCY_BUCKETS_SECONDS,
+)
+BQ_RETRIES = Counter("ga_bq_rate_limit_retries_total", "BigQuery jobs retried after a rate limit", ["project_id"])
+
+_ALL = (
+    TOOL_REQUESTS,
+    TOOL_LATENCY,
+    TOOL_ROWS,
+    BQ_JOBS,
+    BQ_JOB_DURATION,
+    BQ_BYTES_PROCESSED,
+    BQ_QUEUE_WAIT,
+    BQ_RETRIES,
+)
+
+
+def dimensions_label(dimensions: Sequence[str]) -> str:
+    """Canonical label for a dimension set (order-insensitive) so slow combinations group together."""
+    return ",".join(sorted(set(dimensions)))
+
+
+def record_tool_call(
+        tool: str,
+        dimensions: Sequence[str],
+        elapsed: float,
+        ok: bool,
+        row_count: Optional[int],
+) -> None:
+    dims = dimensions_label(dimensions)
+    TOOL_REQUESTS.inc((tool, dims, "ok" if ok else "error"))
+    TOOL_LATENCY.observe((tool, dims), elapsed)
+    if row_count is not None:
+        TOOL_ROWS.observe((tool, dims), row_count)
+
+
+def record_bq_job(
+        project_id: str,
+        elapsed: float,
+        ok: bool,
+        bytes_processed: Optional[int] = None,
+        cache_hit: Optional[bool] = None,
+) -> None:
+    BQ_JOBS.inc((project_id, "ok" if ok else "error", str(bool(cache_hit)).lower()))
+    BQ_JOB_DURATION.observe((project_id,), elapsed)
+    if bytes_processed:
+        BQ_BYTES_PROCESSED.inc((project_id,), bytes_processed)
+
+
+def record_bq_queue_wait(priority: str, project_id: str, wait: float) -> None:
+    BQ_QUEUE_WAIT.observe((priority, project_id), wait)
+
+
+def record_bq_retry(project_id: str) -> None:
+    BQ_RETRIES.inc((project_id,))
+
+
+def snapshot() -> Dict[str, Any]:
+    """JSON-friendly view of every metric."""
+    out: Dict[str, Any] = {"uptime_seconds": time.time() - _PROCESS_START, "metrics": {}}
+    for metric in _ALL:
+        series = []
+        for labels, value in metric.collect().items():
+            entry: Dict[str, Any] = {"labels": dict(zip(metric.label_names, labels))}
+            if isinstance(metric, Histogram):
+                entry.update(
+                    count=value["count"],
+                    sum=value["sum"],
+                    buckets=dict(zip([*map(str, metric.buckets), "+Inf"], value["buckets"])),
+                )
+            else:
+                entry["value"] = value
+            series.append(entry)
+        out["metrics"][metric.name] = {"help": metric.help_text, "series": series}
+    return out
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = []
+    for n, v in zip(names, values):
+        escaped = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{n}="{escaped}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render_prometheus() -> str:
+    """Prometheus text exposition format (v0.0.4)."""
+    lines = [
+        "# HELP ga_process_uptime_seconds Seconds since the server process started",
+        "# TYPE ga_process_uptime_seconds gauge",
+        f"ga_process_uptime_seconds {time.time() - _PROCESS_START:.3f}",
+    ]
+    for metric in _ALL:
+        kind = "histogram" if isinstance(metric, Histogram) else "counter"
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {kind}")
+        for labels, value in sorted(metric.collect().items()):
+            if isinstance(metric, Histogram):
+                for le, count in zip([*map(str, metric.buckets), "+Inf"], value["buckets"]):
+                    lbl = _format_labels(metric.label_names, labels, f'le="{le}"')
+                    lines.append(f"{metric.name}_bucket{lbl} {count}")
+                lbl = _format_labels(metric.label_names, labels)
+                lines.append(f"{metric.name}_sum{lbl} {value['sum']}")
+                lines.append(f"{metric.name}_count{lbl} {value['count']}")
+            else:
+                lbl = _format_labels(metric.label_names, labels)
+                lines.append(f"{metric.name}{lbl} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):  # noqa: N802 (http.server API)
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: A002 - keep scrapes out of the server log
+        logger.debug("metrics scrape: " + format, *args)
+
+
+def start_http_exporter(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve GET /metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="ga-metrics", daemon=True)
+    thread.start()
+    logger.info("Metrics endpoint listening on http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.ga_ad_agent import tracing
+
+logger = logging.getLogger("ga-kpi-client")
+
+JobStatus = str  # "running" | "done" | "error"
+ProgressCallback = Callable[[str, float, Optional[Dict[str, Any]]], None]
+
+DEFAULT_TTL_SECONDS = 60 * 60
+DEFAULT_MAX_ENTRIES = 128
+DEFAULT_MAX_WORKERS = 4
+# Finished jobs are kept this long so reruns/other tabs can still render them
+FINISHED_JOB_RETENTION_SECONDS = 15 * 60
+
+
+def cache_key(action: str, arguments: Dict[str, Any]) -> str:
+    """
+    Stable key for (action, arguments): argument order and dict ordering don't matter.
+    """
+    payload = json.dumps({"action": action, "arguments": arguments}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe TTL + LRU cache for analysis results.
+    Shared by every Streamlit session in the process (see agent_app._get_job_runner).
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                logger.debug("Result cache expired: key=%s", key[:12])
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            # Move to the end -> most recently used
+            self._entries[key] = self._entries.pop(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time(), value)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                del self._entries[oldest]
+                logger.debug("Result cache evicted: key=%s", oldest[:12])
+
+    def invalidate(self, key: str | None = None) -> int:
+        """
+        Drop one entry (or everything when key is None). Returns the number of dropped entries.
+        """
+        with self._lock:
+            if key is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                dropped = 1 if self._entries.pop(key, None) is not None else 0
+
+        logger.info("Result cache invalidated: key=%s dropped=%d", key[:12] if key else "*", dropped)
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+@dataclass
+class Job:
+    job_id: str
+    action: str
+    arguments: Dict[str, Any]
+    key: str
+    status: JobStatus = "running"
+    stage: str = "queued"
+    progress: float = 0.0
+    # stage name -> partial payload (e.g. month A KPIs while month B is still being fetched)
+    partials: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    from_cache: bool = False
+    # Trace context of the submitter, re-attached on the worker thread and when rendering
+    traceparent: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "error")
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class JobRunner:
+    """
+    Runs analyses on a bounded background thread pool so the Streamlit script never blocks.
+    - Cache hits complete synchronously.
+    - Identical in-flight requests (same cache key) share one job.
+    - Progress/partial results are written onto the Job and polled by the UI.
+    """
+
+    def __init__(self, cache: ResultCache, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ga-analysis")
+        self._jobs: Dict[str, Job] = {}
+        self._inflight: Dict[str, str] = {}  # cache key -> job_id
+        self._lock = threading.Lock()
+
+    def submit(
+            self,
+            action: str,
+            arguments: Dict[str, Any],
+            fn: Callable[[ProgressCallback], Dict[str, Any]],
+            *,
+            refresh: bool = False,
+    ) -> Job:
+        key = cache_key(action, arguments)
+        if refresh:
+            self.cache.invalidate(key)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info("Result cache hit: action=%s key=%s", action, key[:12])
+            job = Job(
+                job_id=str(uuid.uuid4()),
+                action=action,
+                arguments=arguments,
+                key=key,
+                status="done",
+                stage="done",
+                progress=1.0,
+                result=cached,
+                from_cache=True,
+                traceparent=tracing.current_traceparent(),
+            )
+            job.finished_at = job.started_at
+            with self._lock:
+                self._prune_locked()
+                self._jobs[job.job_id] = job
+            return job
+
+        with self._lock:
+            self._prune_locked()
+            inflight_id = self._inflight.get(key)
+            if inflight_id is not None:
+                logger.info("Joining in-flight job: action=%s job_id=%s", action, inflight_id)
+                return self._jobs[inflight_id]
+
+            job = Job(
+                job_id=str(uuid.uuid4()),
+                action=action,
+                arguments=arguments,
+                key=key,
+                traceparent=tracing.current_traceparent(),
+            )
+            self._jobs[job.job_id] = job
+            self._inflight[key] = job.job_id
+
+        logger.info("Submitting background job: action=%s job_id=%s", action, job.job_id)
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str | None) -> Optional[Job]:
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def running_jobs(self) -> List[Job]:
+        with self._lock:
+            return [j for j in self._jobs.values() if not j.done]
+
+    def _prune_locked(self) -> None:
+        cutoff = time.time() - FINISHED_JOB_RETENTION_SECONDS
+        stale = [jid for jid, j in self._jobs.items() if j.finished_at is not None and j.finished_at < cutoff]
+        for jid in stale:
+            del self._jobs[jid]
+
+    def _run(self, job: Job, fn: Callable[[ProgressCallback], Dict[str, Any]]) -> None:
+        def _progress(stage: str, fraction: float, partial: Optional[Dict[str, Any]] = None) -> None:
+            job.stage = stage
+            job.progress = max(job.progress, min(fraction, 1.0))
+            if partial is not None:
+                job.partials[stage] = partial
+
+        try:
+            with tracing.attach(job.traceparent), tracing.span("ui.action", action=job.action):
+                result = fn(_progress)
+            self.cache.set(job.key, result)
+            job.result = result
+            job.status = "done"
+            job.stage = "done"
+            job.progress = 1.0
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Background job failed: action=%s job_id=%s", job.action, job.job_id)
+            job.error = str(exc)
+            job.status = "error"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._inflight.pop(job.key, None)
+            logger.info(
+                "Background job finished: action=%s job_id=%s status=%s elapsed=%.2fs",
+                job.action,
+                job.job_id,
+                job.status,
+                job.elapsed,
+            )
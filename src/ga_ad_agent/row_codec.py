@@ -0,0 +1,273 @@
+"""
+Typed, column-major query results and the JSON encoding of tool responses (server and client side).
+
+The server keeps a result as one list per column (`ResultRows`), read from the job's Arrow table with a
+schema computed once per result, instead of a dict per row. Values are normalized per column type, so every
+response encodes the same way:
+  INT64                  JSON integer
+  FLOAT64                JSON number; NaN / +-inf -> null
+  NUMERIC, BIGNUMERIC    JSON number (float)
+  DATE, DATETIME, TIME   ISO 8601 string
+  TIMESTAMP              ISO 8601 string in UTC
+  BYTES                  base64 string
+  ARRAY<T>               JSON array of T
+Responses are encoded with orjson when it is installed (stdlib json otherwise) in one of two row formats:
+  objects   "rows": [{column: value}, ...] - the default; what LLM tool calls and other MCP clients read
+  columns   "rows": {column: [values]} - no per-row objects, ~3x smaller; used by the Python client
+"columns" lists the schema in both. `decode_response` is the matching decoder: it expands "columns" rows
+back into row dicts for the client's analyses.
+"""
+import base64
+import datetime
+import decimal
+import json
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Literal, Mapping, Optional
+
+try:
+    import orjson
+except ImportError:  # optional: ~7x faster encoding, ~3x faster decoding
+    orjson = None
+
+RowFormat = Literal["objects", "columns"]
+ROW_FORMATS = ("objects", "columns")
+
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    type: str  # BigQuery standard SQL type name, e.g. INT64 or ARRAY<INT64>
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"name": self.name, "type": self.type}
+
+
+class ResultRows:
+    """
+    Column-major query result: `schema[i]` describes `columns[i]`, values already normalized for JSON.
+    """
+
+    def __init__(self, schema: List[Column], columns: List[List[Any]], length: Optional[int] = None):
+        if len(schema) != len(columns):
+            raise ValueError("schema and columns differ in length")
+        self.schema = list(schema)
+        self.columns = list(columns)
+        self._length = length if length is not None else (len(columns[0]) if columns else 0)
+
+    @classmethod
+    def from_bq(cls, rows: Iterable[Any], storage_api: bool = False) -> "ResultRows":
+        """
+        From a job's RowIterator via its Arrow table (BigQuery Storage Read API with storage_api=true,
+        else the REST pages, parsed column by column), or from any iterable of row mappings.
+        """
+        to_arrow = getattr(rows, "to_arrow", None)
+        if to_arrow is not None:
+            return cls.from_arrow(to_arrow(create_bqstorage_client=storage_api))
+        return cls.from_records(rows)
+
+    @classmethod
+    def from_arrow(cls, table: Any) -> "ResultRows":
+        schema = [Column(f.name, _arrow_type(f.type)) for f in table.schema]
+        columns = [_arrow_values(table.column(i), c.type) for i, c in enumerate(schema)]
+        return cls(schema, columns, table.num_rows)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Mapping[str, Any]]) -> "ResultRows":
+        """From row mappings (e.g. BigQuery Rows or dicts); types are inferred from the values."""
+        records = list(records)
+        names = list(records[0].keys()) if records else []
+        raw = [[r.get(n) for r in records] for n in names]
+        schema = [Column(n, _python_type(values)) for n, values in zip(names, raw)]
+        return cls(schema, [_normalize(c.type, values) for c, values in zip(schema, raw)], len(records))
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def names(self) -> List[str]:
+        return [c.name for c in self.schema]
+
+    def column(self, name: str) -> List[Any]:
+        return self.columns[self.names.index(name)]
+
+    def pop_column(self, name: str) -> Optional[List[Any]]:
+        """Remove and return a column (None if the result has no such column)."""
+        if name not in self.names:
+            return None
+        i = self.names.index(name)
+        del self.schema[i]
+        return self.columns.pop(i)
+
+    def set_column(self, name: str, type_: str, values: List[Any]) -> None:
+        """Replace or append a column of already normalized values."""
+        if len(values) != self._length:
+            raise ValueError(f"column {name} has {len(values)} values for {self._length} rows")
+        self.pop_column(name)
+        self.schema.append(Column(name, type_))
+        self.columns.append(list(values))
+
+    def row(self, i: int) -> Dict[str, Any]:
+        return {c.name: values[i] for c, values in zip(self.schema, self.columns)}
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        names = self.names
+        return [dict(zip(names, values)) for values in zip(*self.columns)]
+
+    def to_wire(self, row_format: RowFormat) -> Any:
+        if row_format == "columns":
+            return {c.name: values for c, values in zip(self.schema, self.columns)}
+        if row_format == "objects":
+            return self.to_dicts()  # the compatibility format still needs one object per row
+        raise ValueError(f"Unknown row_format: {row_format}. Allowed: {list(ROW_FORMATS)}")
+
+
+def encode_response(resp: Dict[str, Any], row_format: RowFormat = "objects") -> str:
+    """
+    JSON text of a tool response; ResultRows under "rows" are written in `row_format`, with the schema
+    under "columns".
+    """
+    rows = resp.get("rows")
+    if isinstance(rows, ResultRows):
+        resp = {
+            **resp,
+            "row_format": row_format,
+            "columns": [c.to_dict() for c in rows.schema],
+            "rows": rows.to_wire(row_format),
+        }
+    return dumps(resp)
+
+
+def decode_response(text: str | bytes) -> Any:
+    """Parse a tool response; "columns" rows are expanded into row dicts (row_format becomes "objects")."""
+    resp = loads(text)
+    if isinstance(resp, dict) and resp.get("row_format") == "columns" and isinstance(resp.get("rows"), dict):
+        columns: Dict[str, List[Any]] = resp["rows"]
+        resp["rows"] = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        resp["row_format"] = "objects"
+    return resp
+
+
+def dumps(obj: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default).decode("utf-8")
+    return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(text: str | bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _default(obj: Any) -> Any:
+    """Values outside normalized columns (e.g. inside STRUCTs or the response's notes)."""
+    if isinstance(obj, ResultRows):
+        return obj.to_dicts()
+    if isinstance(obj, decimal.Decimal):
+        return _finite(float(obj))
+    if isinstance(obj, datetime.datetime):
+        return _timestamp(obj)
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode("ascii")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _finite(value: float) -> Optional[float]:
+    return value if math.isfinite(value) else None
+
+
+def _timestamp(value: datetime.datetime) -> str:
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc)
+    return value.isoformat()
+
+
+_CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "FLOAT64": _finite,
+    "NUMERIC": lambda v: _finite(float(v)),
+    "BIGNUMERIC": lambda v: _finite(float(v)),
+    "DATE": lambda v: v.isoformat(),
+    "DATETIME": lambda v: v.isoformat(),
+    "TIME": lambda v: v.isoformat(),
+    "TIMESTAMP": _timestamp,
+    "BYTES": lambda v: base64.b64encode(v).decode("ascii"),
+}
+
+
+def _normalize(type_: str, values: List[Any]) -> List[Any]:
+    if type_.startswith("ARRAY<"):
+        inner = type_[len("ARRAY<"):-1]
+        if inner not in _CONVERTERS and not inner.startswith("ARRAY<"):
+            return values
+        return [None if v is None else _normalize(inner, v) for v in values]
+    convert = _CONVERTERS.get(type_)
+    if convert is None:  # INT64, BOOL, STRING, STRUCT (nested values go through _default)
+        return values
+    return [None if v is None else convert(v) for v in values]
+
+
+def _arrow_values(column: Any, type_: str) -> List[Any]:
+    """Normalized values of an Arrow column; DATE and NUMERIC go through Arrow casts, not Python objects."""
+    import pyarrow as pa
+
+    if type_ == "DATE":
+        return column.cast(pa.string()).to_pylist()  # ISO 8601
+    if type_ in ("NUMERIC", "BIGNUMERIC"):
+        # via the decimal text: float() rounds it correctly, Arrow's decimal -> float64 cast does not
+        return [None if v is None else _finite(float(v)) for v in column.cast(pa.string()).to_pylist()]
+    return _normalize(type_, column.to_pylist())
+
+
+def _arrow_type(arrow_type: Any) -> str:
+    import pyarrow as pa
+
+    t = pa.types
+    if t.is_list(arrow_type) or t.is_large_list(arrow_type):
+        return f"ARRAY<{_arrow_type(arrow_type.value_type)}>"
+    if t.is_boolean(arrow_type):
+        return "BOOL"
+    if t.is_integer(arrow_type):
+        return "INT64"
+    if t.is_floating(arrow_type):
+        return "FLOAT64"
+    if t.is_decimal(arrow_type):
+        return "BIGNUMERIC" if arrow_type.precision > 38 else "NUMERIC"
+    if t.is_string(arrow_type) or t.is_large_string(arrow_type):
+        return "STRING"
+    if t.is_binary(arrow_type) or t.is_large_binary(arrow_type):
+        return "BYTES"
+    if t.is_date(arrow_type):
+        return "DATE"
+    if t.is_timestamp(arrow_type):
+        return "TIMESTAMP" if arrow_type.tz else "DATETIME"
+    if t.is_time(arrow_type):
+        return "TIME"
+    if t.is_struct(arrow_type):
+        return "STRUCT"
+    return "STRING" if t.is_null(arrow_type) else str(arrow_type).upper()
+
+
+def _python_type(values: List[Any]) -> str:
+    value = next((v for v in values if v is not None), None)
+    if isinstance(value, (list, tuple)):
+        first = next((v for v in values if v), None)
+        return f"ARRAY<{_python_type(list(first[:1])) if first else 'INT64'}>"
+    if isinstance(value, datetime.datetime):  # before date: a subclass
+        return "TIMESTAMP" if value.tzinfo is not None else "DATETIME"
+    # bool before int: a subclass
+    for py_type, name in (
+        (bool, "BOOL"),
+        (int, "INT64"),
+        (float, "FLOAT64"),
+        (decimal.Decimal, "NUMERIC"),
+        (datetime.date, "DATE"),
+        (datetime.time, "TIME"),
+        (bytes, "BYTES"),
+        (dict, "STRUCT"),
+    ):
+        if isinstance(value, py_type):
+            return name
+    return "STRING"
@@ -0,0 +1,249 @@
+"""
+Columnar month-over-month join used by compare_two_months.
+
+Dimension values of both months are interned into one sorted dictionary per dimension
+(code 0 = NULL), each segment is packed into a single int64 key (mixed radix over the
+dictionary sizes), the two months are outer-joined on the sorted key union, and every
+`<kpi>_pct_change` column is computed in bulk. Dicts are only built in `to_rows()`.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.ga_ad_agent.segment_store import KPI_DTYPES, SegmentTable
+
+logger = logging.getLogger("ga-kpi-client")
+
+_INT64_MAX = np.iinfo(np.int64).max
+
+
+@dataclass
+class SegmentColumns:
+    """
+    One month of KPI segments in columnar form: per-dimension local codes (-1 = NULL) + local
+    dictionary, and float64 KPI columns (NaN = NULL).
+    """
+
+    codes: Dict[str, np.ndarray]
+    dictionaries: Dict[str, List[Optional[str]]]
+    kpis: Dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(next(iter(self.kpis.values()))) if self.kpis else 0
+
+    @classmethod
+    def from_rows(
+            cls,
+            rows: List[Dict[str, Any]],
+            dimensions: Sequence[str],
+            kpis: Sequence[str],
+    ) -> "SegmentColumns":
+        codes, dictionaries = {}, {}
+        for d in dimensions:
+            local_codes, uniques = pd.factorize(pd.Series([r.get(d) for r in rows], dtype=object))
+            codes[d] = local_codes.astype(np.int64)
+            dictionaries[d] = list(uniques)
+
+        kpi_cols = {
+            k: np.array([np.nan if r.get(k) is None else r[k] for r in rows], dtype=np.float64) for k in kpis
+        }
+        return cls(codes=codes, dictionaries=dictionaries, kpis=kpi_cols)
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, dimensions: Sequence[str], kpis: Sequence[str]) -> "SegmentColumns":
+        """Columnar input straight from a DataFrame (e.g. a Parquet checkpoint); NaN / None -> NULL."""
+        codes, dictionaries = {}, {}
+        for d in dimensions:
+            local_codes, uniques = pd.factorize(frame[d].astype(object))
+            codes[d] = local_codes.astype(np.int64)
+            dictionaries[d] = list(uniques)
+        kpi_cols = {k: pd.to_numeric(frame[k], errors="coerce").to_numpy(dtype=np.float64) for k in kpis}
+        return cls(codes=codes, dictionaries=dictionaries, kpis=kpi_cols)
+
+    @classmethod
+    def from_table(cls, table: SegmentTable, dimensions: Sequence[str], kpis: Sequence[str]) -> "SegmentColumns":
+        """Zero-parse view over a stored table (codes/KPIs stay memory mapped until used)."""
+        return cls(
+            codes={d: table.codes(d) for d in dimensions},
+            dictionaries={d: table.dictionary(d).values() for d in dimensions},
+            kpis={k: np.asarray(table.kpi(k), dtype=np.float64) for k in kpis},
+        )
+
+
+def _intern(a: SegmentColumns, b: SegmentColumns, dim: str) -> Tuple[List[Optional[str]], np.ndarray, np.ndarray]:
+    """
+    Shared sorted dictionary for one dimension -> (values, codes_a, codes_b), with code 0 reserved for NULL
+    so packed keys sort like the original `sorted()` over value tuples (NULL first).
+    """
+    distinct = set(a.dictionaries[dim]) | set(b.dictionaries[dim])
+    distinct.discard(None)
+    values = sorted(distinct)
+    lookup = {v: i + 1 for i, v in enumerate(values)}
+
+    def remap(side: SegmentColumns) -> np.ndarray:
+        # local code -> shared code; index 0 of the table is local NULL (-1)
+        table = np.array([0] + [lookup.get(v, 0) for v in side.dictionaries[dim]], dtype=np.int64)
+        return table[np.asarray(side.codes[dim], dtype=np.int64) + 1]
+
+    return [None, *values], remap(a), remap(b)
+
+
+def _pack(code_cols: List[np.ndarray], cardinalities: List[int]) -> np.ndarray:
+    keys = np.zeros(len(code_cols[0]) if code_cols else 0, dtype=np.int64)
+    for codes, card in zip(code_cols, cardinalities):
+        keys = keys * card + codes
+    return keys
+
+
+def _unpack(keys: np.ndarray, cardinalities: List[int]) -> List[np.ndarray]:
+    out = []
+    rest = keys.copy()
+    for card in reversed(cardinalities):
+        out.append(rest % card)
+        rest //= card
+    return out[::-1]
+
+
+@dataclass
+class MonthComparison:
+    dimensions: List[str]
+    kpis: List[str]
+    dictionaries: Dict[str, List[Optional[str]]]
+    codes: Dict[str, np.ndarray]  # shared codes per output row
+    a: Dict[str, np.ndarray]  # NaN = missing segment or NULL value
+    b: Dict[str, np.ndarray]
+    a_present: np.ndarray
+    b_present: np.ndarray
+    pct_change: Dict[str, np.ndarray]  # NaN -> None
+
+    def __len__(self) -> int:
+        return len(self.a_present)
+
+    def to_rows(self, month_a: str, month_b: str) -> List[Dict[str, Any]]:
+        """Output boundary: same row shape as the original dict-based compare_two_months."""
+        n = len(self)
+        dim_values = {
+            d: np.array(self.dictionaries[d], dtype=object)[self.codes[d]].tolist() for d in self.dimensions
+        }
+
+        def _column(values: np.ndarray, kpi: str) -> List[Any]:
+            col = values.astype(object)
+            col[np.isnan(values)] = None
+            if KPI_DTYPES.get(kpi) is np.int64:
+                mask = ~np.isnan(values)
+                col[mask] = values[mask].astype(np.int64).astype(object)
+            return col.tolist()
+
+        kpis = self.kpis
+        pct_keys = [f"{k}_pct_change" for k in kpis]
+        a_rows = zip(*[_column(self.a[k], k) for k in kpis])
+        b_rows = zip(*[_column(self.b[k], k) for k in kpis])
+        pct_rows = zip(*[_column(self.pct_change[k], "") for k in kpis])
+        seg_rows = zip(*[dim_values[d] for d in self.dimensions]) if self.dimensions else iter([()] * n)
+
+        rows = []
+        for seg, av, bv, pv in zip(seg_rows, a_rows, b_rows, pct_rows):
+            row: Dict[str, Any] = dict(zip(self.dimensions, seg))
+            row["month_a"] = month_a
+            row["month_b"] = month_b
+            row["a"] = dict(zip(kpis, av))
+            row["b"] = dict(zip(kpis, bv))
+            row["pct_change"] = dict(zip(pct_keys, pv))
+            rows.append(row)
+        return rows
+
+    def to_frame(self, month_a: str, month_b: str) -> pd.DataFrame:
+        """
+        Flat columnar output (dims, month_a, month_b, a_<kpi>, b_<kpi>, <kpi>_pct_change) for file exports;
+        NULL values stay NaN / None.
+        """
+        columns: Dict[str, Any] = {
+            d: np.array(self.dictionaries[d], dtype=object)[self.codes[d]] for d in self.dimensions
+        }
+        columns["month_a"] = month_a
+        columns["month_b"] = month_b
+        for side, values in (("a", self.a), ("b", self.b)):
+            for k in self.kpis:
+                columns[f"{side}_{k}"] = values[k]
+        for k in self.kpis:
+            columns[f"{k}_pct_change"] = self.pct_change[k]
+        return pd.DataFrame(columns, index=pd.RangeIndex(len(self)))
+
+
+def compare_segments(
+        a: SegmentColumns,
+        b: SegmentColumns,
+        dimensions: Sequence[str],
+        kpis: Sequence[str],
+) -> MonthComparison:
+    """
+    Full outer join of two months on the packed segment key + bulk percent change:
+      pct = (b - a) / a * 100 ; None when a == 0 (incl. a missing) or either value is NULL.
+    Duplicate segments within a month keep the last row (dict semantics of the original).
+    """
+    dims = list(dimensions)
+    dictionaries: Dict[str, List[Optional[str]]] = {}
+    codes_a, codes_b, cards = [], [], []
+    for d in dims:
+        values, ca, cb = _intern(a, b, d)
+        dictionaries[d] = values
+        codes_a.append(ca)
+        codes_b.append(cb)
+        cards.append(len(values))
+
+    capacity = 1
+    for c in cards:
+        capacity *= c
+
+    if capacity <= _INT64_MAX:
+        keys_a, keys_b = _pack(codes_a, cards), _pack(codes_b, cards)
+        union = np.unique(np.concatenate([keys_a, keys_b]))
+        out_codes = dict(zip(dims, _unpack(union, cards)))
+        pos_a, pos_b = np.searchsorted(union, keys_a), np.searchsorted(union, keys_b)
+    else:
+        # Too many distinct combinations for one int64 - join on the code matrix rows instead
+        logger.info("compare_segments: key space %d exceeds int64, using row-wise unique", capacity)
+        matrix = np.column_stack([np.concatenate([ca, cb]) for ca, cb in zip(codes_a, codes_b)])
+        union_rows, inverse = np.unique(matrix, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        out_codes = {d: union_rows[:, i] for i, d in enumerate(dims)}
+        pos_a, pos_b = inverse[: len(a)], inverse[len(a):]
+
+    n = len(next(iter(out_codes.values()))) if out_codes else 0
+    a_present = np.zeros(n, dtype=bool)
+    b_present = np.zeros(n, dtype=bool)
+    a_present[pos_a] = True
+    b_present[pos_b] = True
+
+    a_vals, b_vals, pct = {}, {}, {}
+    for k in kpis:
+        av = np.full(n, np.nan)
+        bv = np.full(n, np.nan)
+        av[pos_a] = a.kpis[k]
+        bv[pos_b] = b.kpis[k]
+
+        # Missing segment counts as 0 for the change; NULL stays NaN
+        base = np.where(a_present, av, 0.0)
+        new = np.where(b_present, bv, 0.0)
+        ok = (base != 0) & ~np.isnan(base) & ~np.isnan(new)
+        change = np.full(n, np.nan)
+        np.divide(new - base, base, out=change, where=ok)
+        change *= 100.0
+
+        a_vals[k], b_vals[k], pct[k] = av, bv, change
+
+    logger.debug("compare_segments: a=%d b=%d union=%d", len(a), len(b), n)
+    return MonthComparison(
+        dimensions=dims,
+        kpis=list(kpis),
+        dictionaries=dictionaries,
+        codes=out_codes,
+        a=a_vals,
+        b=b_vals,
+        a_present=a_present,
+        b_present=b_present,
+        pct_change=pct,
+    )
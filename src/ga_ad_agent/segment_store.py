@@ -0,0 +1,283 @@
+"""
+Local, columnar store for KPI results (e.g. all-data KPIs by four dimensions, monthly snapshots).
+
+Layout of one table directory:
+  meta.json                     dimensions, kpis, row_count, source notes
+  dim_<name>.codes.npy          int32 dictionary codes per row (-1 = NULL)
+  dim_<name>.dict.npy           uint8 blob of the UTF-8 encoded distinct values
+  dim_<name>.offsets.npy        int64 offsets into the blob (len = distinct + 1)
+  kpi_<name>.npy                int64 counts / float64 averages (NaN = NULL)
+
+Every array is opened with `np.load(mmap_mode="r")`, so opening a table is O(columns) and scans
+(e.g. flagged_segments rules) run on the mapped pages without parsing or copying.
+"""
+import errno
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, TypeVar
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("ga-segment-store")
+
+SEGMENT_STORE_DIR_ENV = "SEGMENT_STORE_DIR"
+FORMAT_VERSION = 1
+
+KPI_DTYPES: Dict[str, Any] = {
+    "total_visitors": np.int64,
+    "total_pageviews": np.int64,
+    "avg_time_on_site_seconds": np.float64,
+    "total_conversions": np.int64,
+}
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.+\-]+$")
+
+T = TypeVar("T")
+
+
+def replace_directory(tmp: Path, final: Path) -> None:
+    """
+    Publish the fully written directory `tmp` as `final` (both in the same parent). os.replace can't overwrite
+    a non-empty directory, so a previous version is renamed aside, the new one renamed in, then the old one
+    deleted. If another writer publishes `final` in between, its version is kept and `tmp` dropped: both
+    are complete results of the same request.
+    """
+    old: Optional[Path] = tmp.with_name(f"{tmp.name}.old")
+    try:
+        os.replace(final, old)
+    except FileNotFoundError:
+        old = None  # nothing published yet, or another writer moved it aside first
+    try:
+        os.replace(tmp, final)
+    except OSError as exc:
+        # a non-empty `final` was there (it may have been moved aside again since)
+        if exc.errno not in (errno.ENOTEMPTY, errno.EEXIST) and not final.is_dir():
+            raise
+        logger.info("Directory already published by another writer: %s", final)
+        shutil.rmtree(tmp, ignore_errors=True)
+    finally:
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def read_directory(path: Path, read: Callable[[Path], T], attempts: int = 5) -> T:
+    """
+    read(path) for a directory published with replace_directory, retried while a writer swaps it
+    (the path is missing between the two renames, and the old version's files go away after).
+    """
+    for attempt in range(attempts - 1):
+        try:
+            return read(path)
+        except FileNotFoundError:
+            time.sleep(0.01 * (attempt + 1))
+    return read(path)
+
+
+def _load(path: Path, mmap: bool = True) -> np.ndarray:
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+class DictionaryColumn:
+    """
+    Distinct values of one dimension, decoded lazily from the mapped UTF-8 blob.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+        self._reverse: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, code: int) -> Optional[str]:
+        if code < 0:
+            return None
+        start, end = int(self._offsets[code]), int(self._offsets[code + 1])
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+    def values(self) -> List[Optional[str]]:
+        return [self[i] for i in range(len(self))]
+
+    def code_of(self, value: Optional[str]) -> int:
+        """Code for a value (-1 for NULL / unknown). Builds the reverse index on first use."""
+        if value is None:
+            return -1
+        if self._reverse is None:
+            self._reverse = {v: i for i, v in enumerate(self.values())}
+        return self._reverse.get(value, -1)
+
+
+class SegmentTable:
+    """
+    Read-only, memory-mapped view over one stored KPI result.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path / "meta.json", encoding="utf-8") as fh:
+            self.meta: Dict[str, Any] = json.load(fh)
+
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported segment table format at {path}: {self.meta.get('format_version')}")
+
+        self.dimensions: List[str] = self.meta["dimensions"]
+        self.kpis: List[str] = self.meta["kpis"]
+        self.row_count: int = self.meta["row_count"]
+
+        mmap = self.row_count > 0  # Zero-length arrays can't be memory mapped
+        self._codes = {d: _load(path / f"dim_{d}.codes.npy", mmap) for d in self.dimensions}
+        self._dicts = {
+            d: DictionaryColumn(
+                _load(path / f"dim_{d}.dict.npy", mmap=self.meta["dictionary_bytes"][d] > 0),
+                _load(path / f"dim_{d}.offsets.npy", mmap=False),
+            )
+            for d in self.dimensions
+        }
+        self._kpis = {k: _load(path / f"kpi_{k}.npy", mmap) for k in self.kpis}
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def codes(self, dimension: str) -> np.ndarray:
+        return self._codes[dimension]
+
+    def dictionary(self, dimension: str) -> DictionaryColumn:
+        return self._dicts[dimension]
+
+    def kpi(self, name: str) -> np.ndarray:
+        return self._kpis[name]
+
+    def to_rows(
+            self,
+            indices: Optional[Iterable[int]] = None,
+            kpis: Optional[Sequence[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Materialize rows as dicts (same shape as the MCP tool rows) - only at the output boundary.
+        """
+        if indices is None:
+            idx = np.arange(self.row_count)
+        else:
+            idx = indices if isinstance(indices, np.ndarray) else np.fromiter(indices, dtype=np.int64)
+        kpi_names = list(kpis) if kpis is not None else self.kpis
+
+        dim_cols = {d: np.asarray(self._codes[d][idx]) for d in self.dimensions}
+        kpi_cols = {k: np.asarray(self._kpis[k][idx]).tolist() for k in kpi_names}
+
+        rows = []
+        for pos in range(len(idx)):
+            row: Dict[str, Any] = {d: self._dicts[d][int(dim_cols[d][pos])] for d in self.dimensions}
+            for k in kpi_names:
+                v = kpi_cols[k][pos]
+                row[k] = None if isinstance(v, float) and v != v else v  # NaN -> None
+            rows.append(row)
+        return rows
+
+
+class SegmentStore:
+    """
+    Directory of SegmentTables keyed by a name derived from (scope, month, dimensions, threshold).
+    """
+
+    def __init__(self, root: str | os.PathLike):
+        self.root = Path(root)
+
+    @classmethod
+    def from_env(cls) -> Optional["SegmentStore"]:
+        """Store configured via SEGMENT_STORE_DIR, or None when the store is disabled."""
+        root = os.getenv(SEGMENT_STORE_DIR_ENV)
+        return cls(root) if root else None
+
+    @staticmethod
+    def table_name(
+            scope: str,
+            dimensions: Sequence[str],
+            month: Optional[str] = None,
+            min_pageviews: Optional[int] = None,
+    ) -> str:
+        parts = [scope, month or "all", "+".join(sorted(dimensions))]
+        if min_pageviews is not None:
+            parts.append(f"pv{min_pageviews}")
+        return "__".join(parts)
+
+    def _path(self, name: str) -> Path:
+        if not _NAME_RE.fullmatch(name):
+            raise ValueError(f"Invalid segment table name: {name!r}")
+        return self.root / name
+
+    def exists(self, name: str) -> bool:
+        return (self._path(name) / "meta.json").exists()
+
+    def open(self, name: str) -> SegmentTable:
+        start = time.time()
+        table = read_directory(self._path(name), SegmentTable)
+        logger.info("Segment table opened: name=%s rows=%d elapsed=%.4fs", name, table.row_count, time.time() - start)
+        return table
+
+    def write(self, name: str, result: Dict[str, Any]) -> SegmentTable:
+        """
+        Encode an MCP KPI response ({"dimensions": [...], "rows": [...]}) into a table and open it.
+        The write goes to a temp dir and is renamed into place, so readers never see partial tables.
+        """
+        start = time.time()
+        dimensions: List[str] = list(result["dimensions"])
+        rows: List[Dict[str, Any]] = result.get("rows", [])
+        kpis = [k for k in KPI_DTYPES if k in (result.get("kpis") or KPI_DTYPES)]
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=f".{name}.", dir=self.root))
+        try:
+            dictionary_bytes: Dict[str, int] = {}
+            for d in dimensions:
+                codes, uniques = pd.factorize(pd.Series([r.get(d) for r in rows], dtype=object), use_na_sentinel=True)
+                encoded = [str(u).encode("utf-8") for u in uniques]
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                if encoded:
+                    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+                blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+                np.save(tmp / f"dim_{d}.codes.npy", codes.astype(np.int32))
+                np.save(tmp / f"dim_{d}.dict.npy", blob)
+                np.save(tmp / f"dim_{d}.offsets.npy", offsets)
+                dictionary_bytes[d] = int(blob.size)
+
+            for k in kpis:
+                dtype = KPI_DTYPES[k]
+                if dtype is np.float64:
+                    col = np.array([np.nan if r.get(k) is None else r[k] for r in rows], dtype=dtype)
+                else:
+                    col = np.array([r.get(k) or 0 for r in rows], dtype=dtype)
+                np.save(tmp / f"kpi_{k}.npy", col)
+
+            meta = {
+                "format_version": FORMAT_VERSION,
+                "name": name,
+                "dimensions": dimensions,
+                "kpis": kpis,
+                "row_count": len(rows),
+                "dictionary_bytes": dictionary_bytes,
+                "source": {k: result.get(k) for k in ("scope", "month", "notes") if k in result},
+                "created_at": time.time(),
+            }
+            with open(tmp / "meta.json", "w", encoding="utf-8") as fh:
+                json.dump(meta, fh)
+
+            final = self._path(name)
+            replace_directory(tmp, final)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        logger.info("Segment table written: name=%s rows=%d elapsed=%.3fs", name, len(rows), time.time() - start)
+        return read_directory(final, SegmentTable)
+
+    def delete(self, name: str) -> None:
+        shutil.rmtree(self._path(name), ignore_errors=True)
@@ -0,0 +1,221 @@
+"""
+Minimal OpenTelemetry-style tracing (spans + W3C traceparent propagation) with a JSON-lines file exporter.
+
+Enable by pointing TRACE_EXPORT_PATH at a file, e.g.:
+  TRACE_EXPORT_PATH=traces.jsonl streamlit run src/ga_ad_agent/agent_app.py
+
+Every finished span is appended as one JSON object (OTLP-like field names), so the file can be
+inspected directly or tailed into a collector. The agent, the spawned MCP server processes and the
+Streamlit UI all write to the same file; spans are linked across the stdio boundary via the
+`traceparent` value carried in the MCP request `_meta` (and in the child process environment).
+When TRACE_EXPORT_PATH is unset, spans still track timing/context but nothing is written.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar, cast
+
+logger = logging.getLogger("ga-tracing")
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+TRACE_EXPORT_PATH_ENV = "TRACE_EXPORT_PATH"
+TRACEPARENT_ENV = "TRACEPARENT"
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_service_name = "ga-ad-agent"
+_export_lock = threading.Lock()
+
+
+@dataclass
+class SpanContext:
+    trace_id: str
+    span_id: str
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_span_id: Optional[str]
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "OK"
+    error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": {"code": self.status, "message": self.error},
+            "attributes": self.attributes,
+            "resource": {"service.name": _service_name, "process.pid": os.getpid()},
+        }
+
+
+_current: contextvars.ContextVar[Optional[SpanContext]] = contextvars.ContextVar("ga_current_span", default=None)
+
+
+def setup_tracing(service_name: str) -> None:
+    """
+    Name this process in exported spans and pick up a parent trace handed over via the environment.
+    """
+    global _service_name
+    _service_name = service_name
+
+    parent = parse_traceparent(os.getenv(TRACEPARENT_ENV))
+    if parent is not None and _current.get() is None:
+        _current.set(parent)
+
+
+def export_path() -> Optional[str]:
+    return os.getenv(TRACE_EXPORT_PATH_ENV) or None
+
+
+def _export(span: Span) -> None:
+    path = export_path()
+    if not path:
+        return
+
+    line = json.dumps(span.to_record(), default=str)
+    try:
+        with _export_lock, open(path, "a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+    except OSError:
+        logger.exception("Failed to export span %s to %s", span.name, path)
+
+
+def format_traceparent(ctx: SpanContext) -> str:
+    return f"00-{ctx.trace_id}-{ctx.span_id}-01"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    if not value:
+        return None
+    m = _TRACEPARENT_RE.fullmatch(value.strip())
+    if not m:
+        logger.debug("Ignoring malformed traceparent=%r", value)
+        return None
+    return SpanContext(trace_id=m.group(1), span_id=m.group(2))
+
+
+def current_traceparent() -> Optional[str]:
+    ctx = _current.get()
+    return format_traceparent(ctx) if ctx else None
+
+
+@contextlib.contextmanager
+def attach(traceparent: Optional[str]) -> Iterator[None]:
+    """
+    Make a remote/foreign parent (e.g. from MCP `_meta` or another thread) current for the block.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is None:
+        yield
+        return
+
+    token = _current.set(parent)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Open a child span of the current span (or a new trace root). Exceptions mark the span as ERROR.
+    """
+    parent = _current.get()
+    ctx = SpanContext(
+        trace_id=parent.trace_id if parent else secrets.token_hex(16),
+        span_id=secrets.token_hex(8),
+    )
+    sp = Span(name=name, context=ctx, parent_span_id=parent.span_id if parent else None, attributes=attributes)
+
+    token = _current.set(ctx)
+    try:
+        yield sp
+    except BaseException as exc:
+        sp.status = "ERROR"
+        sp.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        _current.reset(token)
+        sp.end_ns = time.time_ns()
+        _export(sp)
+
+
+def child_env(base: Optional[Dict[str, str]] = None) -> Optional[Dict[str, str]]:
+    """
+    Environment for a spawned MCP server: forwards tracing config + the current trace.
+    Returns `base` unchanged when tracing export is disabled.
+    """
+    path = export_path()
+    if not path:
+        return base
+
+    from mcp.client.stdio import get_default_environment
+
+    env = dict(base) if base is not None else get_default_environment()
+    env[TRACE_EXPORT_PATH_ENV] = os.path.abspath(path)
+    tp = current_traceparent()
+    if tp:
+        env[TRACEPARENT_ENV] = tp
+    return env
+
+
+def request_meta() -> Optional[Dict[str, Any]]:
+    """`_meta` payload for an MCP request carrying the current trace context."""
+    tp = current_traceparent()
+    return {"traceparent": tp} if tp else None
+
+
+def traceparent_from_meta(meta: Any) -> Optional[str]:
+    """Read `traceparent` from an MCP request `_meta` (pydantic model with extra fields, or dict)."""
+    if meta is None:
+        return None
+    if isinstance(meta, dict):
+        return meta.get("traceparent")
+    return getattr(meta, "traceparent", None) or (getattr(meta, "model_extra", None) or {}).get("traceparent")
+
+
+def traced(name: Optional[str] = None) -> Callable[[F], F]:
+    """Decorator form of `span` for synchronous functions."""
+
+    def decorator(fn: F) -> F:
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(span_name):
+                return fn(*args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return decorator
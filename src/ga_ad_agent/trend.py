@@ -0,0 +1,254 @@
+"""
+Vectorized KPI trends over (segment x period) matrices, built from one `get_trend_data` fetch.
+
+Rows ({dims..., "period", kpis...}) are scattered into a dense float64 matrix per KPI with one
+row per segment and one column per calendar period (gaps included), then month-over-month change,
+trailing rolling means and least-squares growth are computed with array ops - no per-segment loops.
+Ranking only needs the ranked KPI; the other KPI matrices are built for the top segments only,
+which keeps daily grain (~400 periods) affordable for large segment counts.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.ga_ad_agent.segment_store import KPI_DTYPES
+
+logger = logging.getLogger("ga-kpi-client")
+
+PERIOD_FREQ: Dict[str, str] = {"month": "M", "day": "D"}
+PERIOD_LABELS: Dict[str, str] = {"month": "%Y-%m", "day": "%Y-%m-%d"}
+
+
+def period_range(grain: str, start: str, end: str, last_day: Optional[str] = None) -> List[str]:
+    """
+    Every calendar period label from month start through month end (inclusive), in the server's label
+    format. Daily axes run to the last day of the end month, like the server's suffix range, but not past
+    `last_day` (e.g. the export's last date: missing count days would read as 0).
+    """
+    if grain not in PERIOD_FREQ:
+        raise ValueError(f"Unknown grain: {grain}. Allowed: {sorted(PERIOD_FREQ)}")
+    if grain == "day":
+        last = pd.Period(end, "M").end_time.normalize()
+        if last_day is not None:
+            last = min(last, pd.Timestamp(last_day))
+        days = pd.period_range(pd.Period(start, "M").start_time, last, freq="D")
+        return list(days.strftime(PERIOD_LABELS[grain]))
+    return list(pd.period_range(start, end, freq=PERIOD_FREQ[grain]).strftime(PERIOD_LABELS[grain]))
+
+
+def mom_pct_change(values: np.ndarray) -> np.ndarray:
+    """
+    Period-over-period % change along axis 1; NaN for the first period, a zero/NULL base or a NULL value.
+    """
+    out = np.full(values.shape, np.nan)
+    prev, cur = values[:, :-1], values[:, 1:]
+    ok = (prev != 0) & ~np.isnan(prev) & ~np.isnan(cur)
+    np.divide(cur - prev, prev, out=out[:, 1:], where=ok)
+    out[:, 1:] *= 100.0
+    return out
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Trailing NaN-aware mean over `window` periods (partial windows at the start), via cumulative sums.
+    """
+    if window < 1:
+        raise ValueError("window must be >= 1")
+    valid = ~np.isnan(values)
+    sums = np.zeros((values.shape[0], values.shape[1] + 1))
+    counts = np.zeros_like(sums)
+    np.cumsum(np.where(valid, values, 0.0), axis=1, out=sums[:, 1:])
+    np.cumsum(valid, axis=1, out=counts[:, 1:])
+
+    hi = np.arange(1, values.shape[1] + 1)
+    lo = np.maximum(hi - window, 0)
+    window_sums = sums[:, hi] - sums[:, lo]
+    window_counts = counts[:, hi] - counts[:, lo]
+    out = np.full(values.shape, np.nan)
+    np.divide(window_sums, window_counts, out=out, where=window_counts > 0)
+    return out
+
+
+def linear_slope(values: np.ndarray) -> np.ndarray:
+    """NaN-aware least-squares slope per row against the period index (units per period)."""
+    valid = ~np.isnan(values)
+    x = np.broadcast_to(np.arange(values.shape[1], dtype=np.float64), values.shape)
+    n = valid.sum(axis=1)
+    y = np.where(valid, values, 0.0)
+    xv = np.where(valid, x, 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = xv.sum(axis=1) / n
+        y_mean = y.sum(axis=1) / n
+        dx = np.where(valid, x - x_mean[:, None], 0.0)
+        dy = np.where(valid, values - y_mean[:, None], 0.0)
+        var = (dx * dx).sum(axis=1)
+        slope = (dx * dy).sum(axis=1) / var
+    slope[n < 2] = np.nan
+    return slope
+
+
+def _as_list(values: np.ndarray, kpi: Optional[str] = None) -> List[Any]:
+    """NaN/inf -> None, integral KPIs back to int."""
+    col = values.astype(object)
+    missing = ~np.isfinite(values)
+    if kpi is not None and KPI_DTYPES.get(kpi) is np.int64:
+        col[~missing] = values[~missing].astype(np.int64).astype(object)
+    col[missing] = None
+    return col.tolist()
+
+
+@dataclass
+class SegmentTrends:
+    """
+    Trend input in matrix form: `segments` holds the dimension values per matrix row,
+    `rows`/`cols` locate every fetched (segment, period) row.
+    """
+
+    dimensions: List[str]
+    periods: List[str]
+    segments: pd.DataFrame
+    frame: pd.DataFrame  # the fetched rows, KPI columns as float64 (NaN = NULL)
+    rows: np.ndarray
+    cols: np.ndarray
+    _by_segment: Optional[np.ndarray] = field(default=None, repr=False)  # row order grouped by segment
+    _bounds: Optional[np.ndarray] = field(default=None, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    @classmethod
+    def from_rows(
+            cls,
+            rows: List[Dict[str, Any]],
+            dimensions: Sequence[str],
+            kpis: Sequence[str],
+            periods: Sequence[str],
+    ) -> "SegmentTrends":
+        dims = list(dimensions)
+        # Column-wise extraction (np.float64 turns None into NaN) - much cheaper than DataFrame(list_of_dicts)
+        columns: Dict[str, Any] = {c: [r.get(c) for r in rows] for c in [*dims, "period"]}
+        for k in kpis:
+            columns[k] = np.array([r.get(k) for r in rows], dtype=np.float64)
+        frame = pd.DataFrame(columns)
+
+        if dims:
+            seg_codes = frame.groupby(dims, dropna=False, sort=False).ngroup().to_numpy()
+        else:
+            seg_codes = np.zeros(len(frame), dtype=np.int64)
+        first = pd.Series(np.arange(len(frame))).groupby(seg_codes).first().to_numpy()
+        segments = frame.loc[first, dims].reset_index(drop=True)
+
+        period_pos = pd.Index(list(periods)).get_indexer(frame["period"])
+        keep = period_pos >= 0  # rows outside the requested range are ignored
+        if not keep.all():
+            logger.warning("SegmentTrends: %d rows outside the period range dropped", int((~keep).sum()))
+
+        return cls(
+            dimensions=dims,
+            periods=list(periods),
+            segments=segments,
+            frame=frame.loc[keep].reset_index(drop=True),
+            rows=seg_codes[keep],
+            cols=period_pos[keep],
+        )
+
+    def matrix(self, kpi: str, segment_ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        (segments x periods) matrix of one KPI. A period without a row means no traffic:
+        0 for counts, NaN for averages.
+        """
+        fill = np.nan if KPI_DTYPES.get(kpi) is np.float64 else 0.0
+        values = self.frame[kpi].to_numpy()
+        if segment_ids is None:
+            out = np.full((len(self), len(self.periods)), fill)
+            out[self.rows, self.cols] = values
+            return out
+
+        # Only the requested segments: remap their ids to 0..k-1 and drop every other row
+        remap = np.full(len(self), -1, dtype=np.int64)
+        remap[segment_ids] = np.arange(len(segment_ids))
+        local = remap[self.rows]
+        mask = local >= 0
+        out = np.full((len(segment_ids), len(self.periods)), fill)
+        out[local[mask], self.cols[mask]] = values[mask]
+        return out
+
+    def matrix_slice(self, kpi: str, start: int, stop: int) -> np.ndarray:
+        """
+        Matrix of segments [start, stop) only - for batch processing without materializing all segments.
+        Rows are grouped by segment once (stable argsort), so every slice is a contiguous gather.
+        """
+        if self._by_segment is None:
+            self._by_segment = np.argsort(self.rows, kind="stable")
+            self._bounds = np.searchsorted(self.rows[self._by_segment], np.arange(len(self) + 1))
+
+        stop = min(stop, len(self))
+        fill = np.nan if KPI_DTYPES.get(kpi) is np.float64 else 0.0
+        picked = self._by_segment[self._bounds[start]: self._bounds[stop]]
+        out = np.full((max(stop - start, 0), len(self.periods)), fill)
+        out[self.rows[picked] - start, self.cols[picked]] = self.frame[kpi].to_numpy()[picked]
+        return out
+
+
+def rank_trends(
+        trends: SegmentTrends,
+        kpis: Sequence[str],
+        rank_kpi: str,
+        window: int,
+        top_n: Optional[int],
+        ascending: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Rank segments by growth of `rank_kpi` (slope of its rolling mean, as % of the segment mean per
+    period) and build output rows for the top_n segments with series, MoM % change and rolling means.
+    """
+    values = trends.matrix(rank_kpi)
+    smoothed = rolling_mean(values, window)
+    slope = linear_slope(smoothed)
+    valid = ~np.isnan(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, values, 0.0).sum(axis=1) / valid.sum(axis=1)
+        growth_pct = np.where(mean > 0, slope / mean * 100.0, np.nan)
+
+    # NaN growth (flat-zero or single-period segments) always sorts last
+    score = -growth_pct if not ascending else growth_pct
+    order = np.lexsort((np.arange(len(score)), np.nan_to_num(score, nan=np.inf)))
+    top = order[:top_n] if top_n is not None else order
+
+    first_last = smoothed[top][:, [0, -1]] if len(trends.periods) else np.empty((len(top), 2))
+    span_pct = mom_pct_change(first_last)[:, 1]
+
+    per_kpi: Dict[str, Dict[str, List[List[Any]]]] = {}
+    for k in kpis:
+        m = values[top] if k == rank_kpi else trends.matrix(k, top)
+        per_kpi[k] = {
+            "series": [_as_list(r, k) for r in m],
+            "mom_pct_change": [_as_list(r) for r in mom_pct_change(m)],
+            "rolling_avg": [_as_list(r) for r in rolling_mean(m, window)],
+        }
+
+    segments = trends.segments.iloc[top].astype(object).where(trends.segments.iloc[top].notna(), None)
+    seg_records = segments.to_dict("records")
+    out = []
+    for i, seg in enumerate(seg_records):
+        seg_id = int(top[i])
+        out.append(
+            {
+                **seg,
+                "rank": i + 1,
+                "growth": {
+                    "kpi": rank_kpi,
+                    "slope_per_period": None if np.isnan(slope[seg_id]) else float(slope[seg_id]),
+                    "pct_per_period": None if np.isnan(growth_pct[seg_id]) else float(growth_pct[seg_id]),
+                    "first_to_last_pct_change": None if np.isnan(span_pct[i]) else float(span_pct[i]),
+                },
+                "series": {k: per_kpi[k]["series"][i] for k in kpis},
+                "mom_pct_change": {k: per_kpi[k]["mom_pct_change"][i] for k in kpis},
+                "rolling_avg": {k: per_kpi[k]["rolling_avg"][i] for k in kpis},
+            }
+        )
+    return out
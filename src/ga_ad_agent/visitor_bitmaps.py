@@ -0,0 +1,383 @@
+"""
+Exact, mergeable distinct-visitor sets: one roaring-style compressed bitmap of dense visitor ids per segment.
+
+`total_visitors` is a COUNT(DISTINCT fullVisitorId), so it can't be summed across months or segments.
+`get_visitor_sets` returns the visitors themselves instead: every fullVisitorId is mapped to a dense id
+(its rank among all visitors of the static export, so ids agree across months and dimension sets) and
+each segment's ids are stored as a RoaringBitmap. Exact distinct counts of any union of months or any
+coarser dimension set are then bitmap ORs + popcounts, computed locally.
+
+Bitmap layout: ids are split into a 16-bit key (high bits) and a container for the low 16 bits,
+  array container   sorted uint16 values, up to ARRAY_MAX_CARDINALITY ids (2 bytes per id)
+  bitmap container  1024 uint64 words (8 KiB) for denser chunks (<= 1 bit per id in the chunk)
+Containers are never modified in place, so unions share unchanged containers instead of copying them.
+
+Serialized form ("RBM1", little endian): magic, uint32 container count, uint16 keys, uint32 cardinalities,
+then every container (uint16 values, or 1024 uint64 words when the cardinality is above
+ARRAY_MAX_CARDINALITY). Tool responses carry it base64 encoded.
+
+Store layout of one visitor set (VisitorSetStore, under SEGMENT_STORE_DIR/visitor_sets):
+  meta.json        dimensions, row_count, source notes
+  segments.json    dimension values per row
+  bitmaps.npy      uint8 blob of the serialized bitmaps (memory mapped, bitmaps decode zero-copy)
+  offsets.npy      int64 offsets into the blob (len = row_count + 1)
+"""
+import base64
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.ga_ad_agent.segment_store import SEGMENT_STORE_DIR_ENV, SegmentStore, read_directory, replace_directory
+
+logger = logging.getLogger("ga-kpi-client")
+
+ENCODING = "roaring-v1+base64"
+MAGIC = b"RBM1"
+FORMAT_VERSION = 1
+
+# Above this many ids a chunk's 8 KiB bitmap is smaller than its uint16 array
+ARRAY_MAX_CARDINALITY = 4096
+BITMAP_WORDS = 1024
+MAX_ID = 2 ** 32 - 1
+
+STORE_SUBDIR = "visitor_sets"
+_NAME_RE = re.compile(r"^visitors__(?P<month>\d{4}-\d{2}|all)__(?P<dims>[a-z_+]+)$")
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(words: np.ndarray) -> int:
+        return int(np.bitwise_count(words).sum())
+else:  # numpy < 2.0
+    def _popcount(words: np.ndarray) -> int:
+        return int(np.unpackbits(words.view(np.uint8)).sum())
+
+
+def _is_bitmap(container: np.ndarray) -> bool:
+    return container.dtype == np.uint64
+
+
+def _cardinality(container: np.ndarray) -> int:
+    return _popcount(container) if _is_bitmap(container) else int(container.size)
+
+
+def _words(values: np.ndarray) -> np.ndarray:
+    """uint16 low bits -> 1024-word bitmap container."""
+    bits = np.zeros(1 << 16, dtype=bool)
+    bits[values] = True
+    return np.packbits(bits, bitorder="little").view("<u8")
+
+
+def _values(words: np.ndarray) -> np.ndarray:
+    """Bitmap container -> sorted uint16 low bits."""
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder="little")).astype(np.uint16)
+
+
+def _container(values: np.ndarray) -> np.ndarray:
+    """Sorted, unique uint16 low bits -> the smaller container kind."""
+    return values if values.size <= ARRAY_MAX_CARDINALITY else _words(values)
+
+
+def _union_containers(parts: List[np.ndarray]) -> np.ndarray:
+    if len(parts) == 1:
+        return parts[0]
+    arrays = [p for p in parts if not _is_bitmap(p)]
+    bitmaps = [p for p in parts if _is_bitmap(p)]
+    if not bitmaps and sum(a.size for a in arrays) <= ARRAY_MAX_CARDINALITY:
+        return np.unique(np.concatenate(arrays))
+
+    words = np.bitwise_or.reduce(np.stack(bitmaps)) if bitmaps else np.zeros(BITMAP_WORDS, dtype=np.uint64)
+    if arrays:
+        words |= _words(np.concatenate(arrays))
+    return words if _popcount(words) > ARRAY_MAX_CARDINALITY else _values(words)
+
+
+class RoaringBitmap:
+    """
+    Immutable set of uint32 ids: sorted 16-bit keys + one array / bitmap container per key.
+    """
+
+    __slots__ = ("keys", "containers")
+
+    def __init__(self, keys: np.ndarray, containers: List[np.ndarray]):
+        self.keys = keys
+        self.containers = containers
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int] | np.ndarray) -> "RoaringBitmap":
+        values = np.unique(np.asarray(ids if isinstance(ids, np.ndarray) else list(ids), dtype=np.int64))
+        if values.size and (values[0] < 0 or values[-1] > MAX_ID):
+            raise ValueError(f"visitor ids must be between 0 and {MAX_ID}")
+        values = values.astype(np.uint32)
+        keys, starts = np.unique(values >> 16, return_index=True)
+        ends = np.append(starts[1:], values.size)
+        low = (values & 0xFFFF).astype(np.uint16)
+        return cls(keys.astype(np.uint16), [_container(low[s:e]) for s, e in zip(starts, ends)])
+
+    @classmethod
+    def union_all(cls, bitmaps: Sequence["RoaringBitmap"]) -> "RoaringBitmap":
+        """OR of any number of bitmaps, container by container (one pass per key, not pairwise)."""
+        if len(bitmaps) == 1:
+            return bitmaps[0]
+        by_key: Dict[int, List[np.ndarray]] = {}
+        for bm in bitmaps:
+            for key, container in zip(bm.keys.tolist(), bm.containers):
+                by_key.setdefault(key, []).append(container)
+        keys = sorted(by_key)
+        return cls(np.array(keys, dtype=np.uint16), [_union_containers(by_key[k]) for k in keys])
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        return RoaringBitmap.union_all([self, other])
+
+    def __len__(self) -> int:
+        return sum(_cardinality(c) for c in self.containers)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, RoaringBitmap) and np.array_equal(self.to_ids(), other.to_ids())
+
+    def __repr__(self) -> str:
+        return f"RoaringBitmap(cardinality={len(self)}, containers={len(self.containers)}, nbytes={self.nbytes})"
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.keys.nbytes + sum(c.nbytes for c in self.containers))
+
+    def to_ids(self) -> np.ndarray:
+        """Sorted ids as int64."""
+        parts = [
+            (np.int64(key) << 16) | (_values(c) if _is_bitmap(c) else c).astype(np.int64)
+            for key, c in zip(self.keys.tolist(), self.containers)
+        ]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def to_bytes(self) -> bytes:
+        cards = np.array([_cardinality(c) for c in self.containers], dtype="<u4")
+        parts = [MAGIC, np.uint32(len(self.containers)).astype("<u4").tobytes(), self.keys.astype("<u2").tobytes()]
+        parts.append(cards.tobytes())
+        parts.extend(c.astype("<u8" if _is_bitmap(c) else "<u2", copy=False).tobytes() for c in self.containers)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes | memoryview | np.ndarray) -> "RoaringBitmap":
+        """Decode `to_bytes` output; containers are read-only views into `data` (no copy)."""
+        buf = memoryview(data).cast("B")
+        if bytes(buf[:4]) != MAGIC:
+            raise ValueError("not a serialized RoaringBitmap")
+        n = int(np.frombuffer(buf, dtype="<u4", count=1, offset=4)[0])
+        pos = 8
+        keys = np.frombuffer(buf, dtype="<u2", count=n, offset=pos)
+        pos += 2 * n
+        cards = np.frombuffer(buf, dtype="<u4", count=n, offset=pos)
+        pos += 4 * n
+
+        containers = []
+        for card in cards.tolist():
+            if card > ARRAY_MAX_CARDINALITY:
+                containers.append(np.frombuffer(buf, dtype="<u8", count=BITMAP_WORDS, offset=pos))
+                pos += 8 * BITMAP_WORDS
+            else:
+                containers.append(np.frombuffer(buf, dtype="<u2", count=card, offset=pos))
+                pos += 2 * card
+        return cls(keys, containers)
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def from_base64(cls, text: str) -> "RoaringBitmap":
+        return cls.from_bytes(base64.b64decode(text))
+
+
+@dataclass
+class VisitorSets:
+    """
+    Visitor bitmap per segment: row i of `segments` (one column per dimension) owns `bitmaps[i]`.
+    """
+
+    dimensions: List[str]
+    segments: pd.DataFrame
+    bitmaps: List[RoaringBitmap]
+
+    def __len__(self) -> int:
+        return len(self.bitmaps)
+
+    @classmethod
+    def from_response(cls, data: Dict[str, Any]) -> "VisitorSets":
+        """Decode a `get_visitor_sets` tool response."""
+        if data.get("encoding") != ENCODING:
+            raise ValueError(f"Unsupported visitor set encoding: {data.get('encoding')!r}")
+        dims = list(data["dimensions"])
+        rows = data.get("rows", [])
+        segments = pd.DataFrame({d: pd.Series([r.get(d) for r in rows], dtype=object) for d in dims})
+        return cls(dims, segments, [RoaringBitmap.from_base64(r["visitors"]) for r in rows])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for b in self.bitmaps)
+
+    def counts(self) -> np.ndarray:
+        return np.fromiter((len(b) for b in self.bitmaps), dtype=np.int64, count=len(self.bitmaps))
+
+    def total(self) -> RoaringBitmap:
+        """Every visitor of every segment."""
+        return RoaringBitmap.union_all(self.bitmaps) if self.bitmaps else RoaringBitmap.from_ids([])
+
+    def rollup(self, dimensions: Sequence[str]) -> "VisitorSets":
+        """Exact sets of a coarser dimension set: OR of the member segments' bitmaps per coarser segment."""
+        unknown = [d for d in dimensions if d not in self.dimensions]
+        if unknown:
+            raise ValueError(f"Cannot roll up {self.dimensions} to {list(dimensions)}: {unknown} not in the sets")
+        requested = set(dimensions)
+        return self._grouped([d for d in self.dimensions if d in requested])
+
+    @classmethod
+    def union(cls, parts: Sequence["VisitorSets"]) -> "VisitorSets":
+        """Exact sets over several ranges (e.g. months) with the same dimensions: OR per segment."""
+        if not parts:
+            raise ValueError("union needs at least one VisitorSets")
+        dims = parts[0].dimensions
+        if any(set(p.dimensions) != set(dims) for p in parts):
+            raise ValueError("union needs VisitorSets with the same dimensions")
+        if len(parts) == 1:
+            return parts[0]
+        segments = pd.concat([p.segments[dims] for p in parts], ignore_index=True)
+        merged = cls(dims, segments, [b for p in parts for b in p.bitmaps])
+        return merged._grouped(dims)
+
+    def _grouped(self, dims: List[str]) -> "VisitorSets":
+        if not len(self):
+            return VisitorSets(dims, self.segments[dims].reset_index(drop=True), [])
+        if dims:
+            codes = np.column_stack(
+                [pd.factorize(self.segments[d], use_na_sentinel=True)[0] for d in dims]
+            )
+            _, first, inverse = np.unique(codes, axis=0, return_index=True, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        else:
+            first, inverse = np.zeros(1, dtype=np.int64), np.zeros(len(self), dtype=np.int64)
+
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.flatnonzero(np.diff(inverse[order])) + 1
+        groups = np.split(order, bounds)
+        bitmaps = [RoaringBitmap.union_all([self.bitmaps[i] for i in g.tolist()]) for g in groups]
+        segments = self.segments.iloc[first][dims].reset_index(drop=True)
+        return VisitorSets(dims, segments, bitmaps)
+
+    def to_frame(self) -> pd.DataFrame:
+        frame = self.segments[self.dimensions].copy()
+        frame["total_visitors"] = self.counts()
+        return frame
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """{dims..., total_visitors} per segment, largest first (ties by dimension values)."""
+        frame = self.to_frame()
+        frame = frame.sort_values(
+            ["total_visitors", *self.dimensions], ascending=[False] + [True] * len(self.dimensions), kind="stable"
+        )
+        return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
+class VisitorSetStore:
+    """
+    Directory of stored VisitorSets keyed by (month | all, dimensions), next to the segment store.
+    """
+
+    def __init__(self, root: str | os.PathLike):
+        self.root = Path(root)
+
+    @classmethod
+    def from_env(cls) -> Optional["VisitorSetStore"]:
+        """Store under SEGMENT_STORE_DIR/visitor_sets, or None when the segment store is disabled."""
+        root = os.getenv(SEGMENT_STORE_DIR_ENV)
+        return cls(Path(root) / STORE_SUBDIR) if root else None
+
+    @staticmethod
+    def name(dimensions: Sequence[str], month: Optional[str] = None) -> str:
+        return SegmentStore.table_name("visitors", dimensions, month=month)
+
+    def _path(self, name: str) -> Path:
+        if not _NAME_RE.fullmatch(name):
+            raise ValueError(f"Invalid visitor set name: {name!r}")
+        return self.root / name
+
+    def exists(self, name: str) -> bool:
+        return (self._path(name) / "meta.json").exists()
+
+    def find(self, dimensions: Sequence[str], month: Optional[str] = None) -> Optional[str]:
+        """
+        Smallest stored set for `month` whose dimensions include `dimensions` (exact via rollup), or None.
+        """
+        if not self.root.is_dir():
+            return None
+        wanted = set(dimensions)
+        best: Optional[tuple] = None
+        for entry in self.root.iterdir():
+            m = _NAME_RE.fullmatch(entry.name)
+            if not m or m.group("month") != (month or "all") or not (entry / "meta.json").exists():
+                continue
+            if wanted <= set(m.group("dims").split("+")):
+                rows = json.loads((entry / "meta.json").read_text(encoding="utf-8"))["row_count"]
+                if best is None or rows < best[0]:
+                    best = (rows, entry.name)
+        return best[1] if best else None
+
+    def open(self, name: str) -> VisitorSets:
+        start = time.time()
+        sets = read_directory(self._path(name), _read_visitor_sets)
+        logger.info("Visitor sets opened: name=%s rows=%d elapsed=%.4fs", name, len(sets), time.time() - start)
+        return sets
+
+    def write(self, name: str, sets: VisitorSets, source: Optional[Dict[str, Any]] = None) -> None:
+        """Temp dir + rename (replace_directory), so readers never see partial sets."""
+        start = time.time()
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=f".{name}.", dir=self.root))
+        try:
+            encoded = [b.to_bytes() for b in sets.bitmaps]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            if encoded:
+                np.cumsum([len(e) for e in encoded], out=offsets[1:])
+            np.save(tmp / "bitmaps.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+            np.save(tmp / "offsets.npy", offsets)
+            segments = sets.segments[sets.dimensions].astype(object)
+            with open(tmp / "segments.json", "w", encoding="utf-8") as fh:
+                json.dump(segments.where(segments.notna(), None).values.tolist(), fh)
+            meta = {
+                "format_version": FORMAT_VERSION,
+                "name": name,
+                "dimensions": sets.dimensions,
+                "row_count": len(sets),
+                "blob_bytes": int(offsets[-1]),
+                "source": source or {},
+                "created_at": time.time(),
+            }
+            with open(tmp / "meta.json", "w", encoding="utf-8") as fh:
+                json.dump(meta, fh)
+
+            replace_directory(tmp, self._path(name))
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        logger.info("Visitor sets written: name=%s rows=%d elapsed=%.3fs", name, len(sets), time.time() - start)
+
+
+def _read_visitor_sets(path: Path) -> VisitorSets:
+    meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported visitor set format at {path}: {meta.get('format_version')}")
+    dims = meta["dimensions"]
+    segments = pd.DataFrame(
+        json.loads((path / "segments.json").read_text(encoding="utf-8")), columns=dims, dtype=object
+    )
+    blob = np.load(path / "bitmaps.npy", mmap_mode="r" if meta["blob_bytes"] else None)
+    offsets = np.load(path / "offsets.npy").tolist()
+    bitmaps = [RoaringBitmap.from_bytes(blob[s:e]) for s, e in zip(offsets[:-1], offsets[1:])]
+    return VisitorSets(dims, segments, bitmaps)
@@ -0,0 +1,5 @@
+import os
+
+# src.config requires these at import time; tests never reach GCP or Gemini
+for _name in ("GOOGLE_CLOUD_PROJECT", "GEMINI_API_KEY", "GOOGLE_API_KEY"):
+    os.environ.setdefault(_name, "test")
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.constants import DATASET_LAST_DAY
+from src.ga_ad_agent.anomaly import rank_anomalies, robust_z, scan_anomalies, weekday_baseline
+from src.ga_ad_agent.trend import SegmentTrends, period_range
+
+NAN = np.nan
+KPIS = ["total_pageviews", "avg_time_on_site_seconds"]
+
+
+def test_weekday_baseline_is_the_median_of_the_same_weekday():
+    values = np.array([[1.0, 10.0, 3.0, 20.0, 5.0, NAN], [NAN, NAN, NAN, NAN, NAN, NAN]])
+    weekdays = np.array([0, 1, 0, 1, 0, 1])
+    np.testing.assert_array_equal(
+        weekday_baseline(values, weekdays), [[3.0, 15.0, 3.0, 15.0, 3.0, 15.0], [NAN] * 6]
+    )
+
+
+def test_robust_z_uses_mad():
+    residuals = np.array([[0.0, 1.0, -1.0, 2.0, -2.0, 10.0]])
+    # median 0.5, |dev| median 1.5 -> scale 1.5 / 0.6745
+    np.testing.assert_allclose(robust_z(residuals), (residuals - 0.5) / (1.5 / 0.6745))
+
+
+def test_robust_z_falls_back_to_mean_absolute_deviation():
+    residuals = np.array([[0.0, 0.0, 0.0, 0.0, 8.0]])  # MAD is 0
+    np.testing.assert_allclose(robust_z(residuals), residuals / (1.6 * 1.2533))
+
+
+def test_robust_z_floor_and_flat_series():
+    residuals = np.array([[0.0, 1.0, -1.0, 2.0, -2.0, 10.0], [3.0, 3.0, 3.0, NAN, 3.0, 3.0], [NAN] * 6])
+    z = robust_z(residuals, scale_floor=np.array([5.0, 0.0, 0.0]))
+    np.testing.assert_allclose(z[0], (residuals[0] - 0.5) / 5.0)
+    assert np.isnan(z[1:]).all()  # no spread / no data
+
+
+def _rows(days, pageviews, segment):
+    return [
+        {"device_type": segment, "period": d, "total_pageviews": pv, "avg_time_on_site_seconds": 60.0 + i % 3}
+        for i, (d, pv) in enumerate(zip(days, pageviews))
+        if pv
+    ]
+
+
+@pytest.fixture
+def trends() -> SegmentTrends:
+    """92 days ending mid-dataset: weekly seasonal traffic with one drop and one late end-month spike."""
+    days = period_range("day", "2017-03", "2017-05", last_day=DATASET_LAST_DAY)
+    weekend = pd.to_datetime(pd.Index(days)).dayofweek.to_numpy() >= 5
+    desktop = np.where(weekend, 60, 100) + (np.arange(len(days)) * 7 % 5) - 2
+    desktop[days.index("2017-03-15")] = 5
+    desktop[days.index("2017-05-30")] = 400
+    sparse = np.zeros(len(days), dtype=int)
+    sparse[:10] = 50  # fewer active days than min_active_days
+    sparse[days.index("2017-05-30")] = 5000
+    rows = _rows(days, desktop.tolist(), "desktop") + _rows(days, sparse.tolist(), "tablet")
+    return SegmentTrends.from_rows(rows, ["device_type"], KPIS, days)
+
+
+def test_scan_finds_the_injected_anomalies(trends):
+    scan = scan_anomalies(trends, KPIS, z_threshold=3.5)
+    found = {(trends.periods[c], KPIS[k]) for c, k in zip(scan.period_idx, scan.kpi_idx)}
+    assert found == {("2017-03-15", "total_pageviews"), ("2017-05-30", "total_pageviews")}
+    assert set(scan.segment_ids.tolist()) == {0}  # the sparse segment is skipped
+    assert (scan.segments_scanned, scan.segments_total, scan.truncated) == (2, 2, False)
+
+
+def test_scan_batches_give_the_same_result(trends):
+    whole = scan_anomalies(trends, KPIS)
+    batched = scan_anomalies(trends, KPIS, batch_segments=1)
+    np.testing.assert_array_equal(whole.segment_ids, batched.segment_ids)
+    np.testing.assert_array_equal(whole.z, batched.z)
+
+
+def test_time_budget_truncates_the_scan(trends):
+    scan = scan_anomalies(trends, KPIS, time_budget_seconds=0.0)
+    assert (scan.segments_scanned, len(scan.z), scan.truncated) == (0, 0, True)
+    assert rank_anomalies(trends, scan, KPIS, top_n=10) == []
+
+
+def test_rank_anomalies(trends):
+    scan = scan_anomalies(trends, KPIS)
+    ranked = rank_anomalies(trends, scan, KPIS, top_n=None)
+    assert [(r["rank"], r["date"], r["direction"]) for r in ranked] == [
+        (1, "2017-05-30", "spike"),
+        (2, "2017-03-15", "drop"),
+    ]
+    spike = ranked[0]
+    assert spike["device_type"] == "desktop"
+    assert spike["kpi"] == "total_pageviews"
+    assert spike["value"] == 400 and isinstance(spike["value"], int)
+    assert spike["baseline"] == pytest.approx(100, abs=2)
+    assert spike["robust_z"] > 3.5
+    assert len(rank_anomalies(trends, scan, KPIS, top_n=1)) == 1
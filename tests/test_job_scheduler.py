@@ -0,0 +1,241 @@
+import threading
+import time
+from typing import Callable, List
+
+import pytest
+from google.api_core.exceptions import BadRequest, Forbidden, TooManyRequests
+
+from src.ga_ad_agent import job_scheduler
+from src.ga_ad_agent.job_scheduler import BYTES_WINDOW_SECONDS, MAX_BACKOFF_SECONDS, JobScheduler, is_rate_limited
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _wait_for(condition: Callable[[], bool], timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.002)
+
+
+def _in_thread(fn: Callable[[], None]) -> threading.Thread:
+    thread = threading.Thread(target=fn, daemon=True)
+    thread.start()
+    return thread
+
+
+def _blocking_job(started: threading.Event, release: threading.Event):
+    def job(ticket):
+        started.set()
+        assert release.wait(5)
+        return ticket.project
+
+    return job
+
+
+def _waiting(scheduler: JobScheduler, priority: str) -> int:
+    return scheduler.stats()["waiting"][priority]
+
+
+def _running(scheduler: JobScheduler, project: str = "p") -> int:
+    return scheduler.stats()["projects"].get(project, {}).get("running", 0)
+
+
+def test_runs_job_and_reports_ticket():
+    scheduler = JobScheduler(clock=FakeClock())
+    result, ticket = scheduler.run(lambda t: t.project, "p", cost_key="q")
+    assert result == "p"
+    assert (ticket.project, ticket.attempts, ticket.priority) == ("p", 1, "interactive")
+    assert _running(scheduler) == 0
+
+
+def test_unknown_priority():
+    with pytest.raises(ValueError):
+        JobScheduler().run(lambda t: None, "p", priority="urgent")
+
+
+def test_interactive_jobs_are_admitted_before_batch_jobs():
+    scheduler = JobScheduler(max_concurrent=1)
+    started, release = threading.Event(), threading.Event()
+    holder = _in_thread(lambda: scheduler.run(_blocking_job(started, release), "p"))
+    assert started.wait(5)
+
+    order: List[str] = []
+    threads = []
+    for name, priority in (("b1", "batch"), ("i1", "interactive"), ("b2", "batch"), ("i2", "interactive")):
+        queued = _waiting(scheduler, priority)
+        threads.append(_in_thread(lambda n=name, p=priority: scheduler.run(lambda t: order.append(n), "p", p)))
+        _wait_for(lambda p=priority, q=queued: _waiting(scheduler, p) == q + 1)  # arrival order is fixed
+
+    release.set()
+    for t in [holder, *threads]:
+        t.join(5)
+    assert order == ["i1", "i2", "b1", "b2"]  # FIFO within a priority
+
+
+def test_batch_jobs_leave_reserved_slots_to_interactive_jobs():
+    scheduler = JobScheduler(max_concurrent=3, interactive_reserved=1)
+    release = threading.Event()
+    batch_started = [threading.Event() for _ in range(3)]
+    threads = [
+        _in_thread(lambda e=e: scheduler.run(_blocking_job(e, release), "p", "batch")) for e in batch_started
+    ]
+    _wait_for(lambda: _running(scheduler) == 2 and _waiting(scheduler, "batch") == 1)
+    assert sum(e.is_set() for e in batch_started) == 2
+
+    interactive_started = threading.Event()
+    threads.append(_in_thread(lambda: scheduler.run(_blocking_job(interactive_started, release), "p")))
+    assert interactive_started.wait(5)  # the reserved slot
+    assert _waiting(scheduler, "batch") == 1
+
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert all(e.is_set() for e in batch_started)
+
+
+def test_interactive_reserved_is_capped_below_max_concurrent():
+    scheduler = JobScheduler(max_concurrent=2, interactive_reserved=5)
+    assert scheduler.interactive_reserved == 1
+    scheduler.run(lambda t: None, "p", "batch")  # batch jobs still get one slot
+
+
+def test_bytes_window_holds_jobs_until_the_hour_passes():
+    clock = FakeClock()
+    scheduler = JobScheduler(max_bytes_per_hour=100, clock=clock)
+
+    def scan(nbytes: int):
+        def job(ticket):
+            ticket.bytes_processed = nbytes
+            return ticket.project
+
+        return job
+
+    scheduler.run(scan(80), "p", cost_key="q")
+    assert scheduler.stats()["projects"]["p"]["window_bytes"] == 80
+
+    # the same SQL reserves its last run's 80 bytes: 80 + 80 > 100, so it waits
+    admitted = threading.Event()
+    waiter = _in_thread(lambda: scheduler.run(lambda t: admitted.set(), "p", cost_key="q"))
+    _wait_for(lambda: _waiting(scheduler, "interactive") == 1)
+    assert not admitted.is_set()
+
+    scheduler.run(scan(0), "p", cost_key="unseen")  # unseen SQL reserves nothing and still fits
+    assert not admitted.is_set()
+
+    clock.now += BYTES_WINDOW_SECONDS
+    scheduler.run(scan(0), "p", cost_key="unseen")  # a release re-dispatches with the advanced clock
+    assert admitted.wait(5)
+    waiter.join(5)
+
+
+def test_a_job_is_always_admitted_to_an_empty_window():
+    scheduler = JobScheduler(max_bytes_per_hour=100, clock=FakeClock())
+
+    def scan(ticket):
+        ticket.bytes_processed = 500
+
+    scheduler.run(scan, "p", cost_key="big")
+    assert scheduler.stats()["projects"]["p"]["window_bytes"] == 500
+
+
+def test_jobs_spread_over_billing_projects():
+    scheduler = JobScheduler(projects=["a", "b"], max_concurrent=1)
+    started, release = threading.Event(), threading.Event()
+    holder = _in_thread(lambda: scheduler.run(_blocking_job(started, release), "a"))
+    assert started.wait(5)
+
+    result, ticket = scheduler.run(lambda t: t.project, "a")
+    assert result == "b"
+    assert ticket.requested_project == "a"
+    release.set()
+    holder.join(5)
+
+
+def _rate_limited_scheduler(monkeypatch, retries: int, backoff_s: float):
+    """Scheduler whose fake clock jumps over every cooldown, recording the backoff delays."""
+    monkeypatch.setattr(job_scheduler.random, "uniform", lambda a, b: a)  # no jitter
+    clock = FakeClock()
+    scheduler = JobScheduler(retries=retries, backoff_s=backoff_s, clock=clock)
+    delays: List[float] = []
+    release = scheduler._release
+
+    def recording_release(ticket, rate_limited=False):
+        delay = release(ticket, rate_limited)
+        if rate_limited:
+            delays.append(delay)
+            assert scheduler.stats()["projects"]["p"]["cooldown_s"] == pytest.approx(delay)
+            clock.now += delay
+        return delay
+
+    monkeypatch.setattr(scheduler, "_release", recording_release)
+    return scheduler, delays
+
+
+def test_rate_limits_are_retried_with_exponential_backoff(monkeypatch):
+    scheduler, delays = _rate_limited_scheduler(monkeypatch, retries=4, backoff_s=1.0)
+    attempts = []
+
+    def job(ticket):
+        attempts.append(ticket.attempts)
+        if len(attempts) < 4:
+            raise TooManyRequests("jobRateLimitExceeded")
+        return "done"
+
+    result, ticket = scheduler.run(job, "p")
+    assert result == "done"
+    assert ticket.attempts == 4
+    assert attempts == [1, 2, 3, 4]
+    assert delays == [1.0, 2.0, 4.0]
+    assert _running(scheduler) == 0
+
+
+def test_rate_limit_retries_are_bounded(monkeypatch):
+    scheduler, delays = _rate_limited_scheduler(monkeypatch, retries=7, backoff_s=4.0)
+    calls = []
+
+    def job(ticket):
+        calls.append(ticket.attempts)
+        raise TooManyRequests("rateLimitExceeded")
+
+    with pytest.raises(TooManyRequests):
+        scheduler.run(job, "p")
+    assert len(calls) == 8  # the first attempt + 7 retries
+    assert delays == [4.0, 8.0, 16.0, 32.0, MAX_BACKOFF_SECONDS, MAX_BACKOFF_SECONDS, MAX_BACKOFF_SECONDS]
+    assert _running(scheduler) == 0
+
+
+@pytest.mark.parametrize("error", [BadRequest("syntax error"), Forbidden("quotaExceeded"), RuntimeError("boom")])
+def test_other_errors_fail_fast_and_release_the_slot(error):
+    scheduler = JobScheduler(max_concurrent=1, clock=FakeClock())
+    calls = []
+
+    def job(ticket):
+        calls.append(ticket.attempts)
+        raise error
+
+    with pytest.raises(type(error)):
+        scheduler.run(job, "p")
+    assert calls == [1]
+    assert _running(scheduler) == 0
+    assert scheduler.stats()["projects"]["p"]["cooldown_s"] == 0
+    assert scheduler.run(lambda t: "next", "p")[0] == "next"  # the only slot is free again
+
+
+def test_is_rate_limited():
+    class ApiError(Exception):
+        def __init__(self, reason):
+            self.errors = [{"reason": reason}]
+
+    assert is_rate_limited(TooManyRequests("x"))
+    assert is_rate_limited(ApiError("jobRateLimitExceeded"))
+    assert is_rate_limited(ApiError("rateLimitExceeded"))
+    assert not is_rate_limited(ApiError("quotaExceeded"))  # the daily quota doesn't recover with a retry
+    assert not is_rate_limited(BadRequest("x"))
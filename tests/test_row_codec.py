@@ -0,0 +1,147 @@
+import datetime
+import decimal
+import json
+import math
+
+import pyarrow as pa
+import pytest
+
+from src.ga_ad_agent import row_codec
+from src.ga_ad_agent.row_codec import Column, ResultRows, decode_response, encode_response
+
+UTC = datetime.timezone.utc
+PLUS_2 = datetime.timezone(datetime.timedelta(hours=2))
+
+EXPECTED = {
+    "segment": ("STRING", ["a", None, "c"]),
+    "flag": ("BOOL", [True, False, None]),
+    "pageviews": ("INT64", [1, None, 2 ** 53 + 1]),
+    "avg_time": ("FLOAT64", [1.5, None, None]),  # NaN / inf -> null
+    "revenue": ("NUMERIC", [0.1, None, 12345678901234567.0]),
+    "big": ("BIGNUMERIC", [1.25, None, 0.0]),
+    "day": ("DATE", ["2017-01-31", None, "2016-08-01"]),
+    "at": ("DATETIME", ["2017-01-31T12:30:00", None, "2017-01-31T00:00:00.000001"]),
+    "ts": ("TIMESTAMP", ["2017-01-31T10:00:00+00:00", None, "2017-01-31T12:00:00+00:00"]),
+    "clock": ("TIME", ["12:30:00", None, "00:00:01"]),
+    "blob": ("BYTES", ["AAE=", None, ""]),
+    "ids": ("ARRAY<INT64>", [[1, 2], [], None]),
+    "days": ("ARRAY<DATE>", [["2017-01-01"], [], None]),
+}
+
+
+def _arrow_table() -> pa.Table:
+    return pa.table(
+        {
+            "segment": pa.array(["a", None, "c"]),
+            "flag": pa.array([True, False, None]),
+            "pageviews": pa.array([1, None, 2 ** 53 + 1], pa.int64()),
+            "avg_time": pa.array([1.5, math.nan, math.inf]),
+            "revenue": pa.array(
+                [decimal.Decimal("0.1"), None, decimal.Decimal("12345678901234567")], pa.decimal128(38, 9)
+            ),
+            "big": pa.array([decimal.Decimal("1.25"), None, decimal.Decimal(0)], pa.decimal256(76, 38)),
+            "day": pa.array([datetime.date(2017, 1, 31), None, datetime.date(2016, 8, 1)]),
+            "at": pa.array([datetime.datetime(2017, 1, 31, 12, 30), None, datetime.datetime(2017, 1, 31, 0, 0, 0, 1)]),
+            "ts": pa.array(
+                [datetime.datetime(2017, 1, 31, 10, tzinfo=UTC), None, datetime.datetime(2017, 1, 31, 12, tzinfo=UTC)],
+                pa.timestamp("us", tz="UTC"),
+            ),
+            "clock": pa.array([datetime.time(12, 30), None, datetime.time(0, 0, 1)]),
+            "blob": pa.array([b"\x00\x01", None, b""]),
+            "ids": pa.array([[1, 2], [], None], pa.list_(pa.int64())),
+            "days": pa.array([[datetime.date(2017, 1, 1)], [], None], pa.list_(pa.date32())),
+        }
+    )
+
+
+def _records():
+    return [
+        {
+            "segment": "a", "flag": True, "pageviews": 1, "avg_time": 1.5, "revenue": decimal.Decimal("0.1"),
+            "big": decimal.Decimal("1.25"), "day": datetime.date(2017, 1, 31),
+            "at": datetime.datetime(2017, 1, 31, 12, 30), "ts": datetime.datetime(2017, 1, 31, 12, tzinfo=PLUS_2),
+            "clock": datetime.time(12, 30), "blob": b"\x00\x01", "ids": [1, 2], "days": [datetime.date(2017, 1, 1)],
+        },
+        {k: None for k in EXPECTED},
+    ]
+
+
+def test_arrow_columns_are_typed_and_normalized():
+    rows = ResultRows.from_arrow(_arrow_table())
+    assert len(rows) == 3
+    assert [c.to_dict() for c in rows.schema] == [{"name": n, "type": t} for n, (t, _) in EXPECTED.items()]
+    for name, (_, values) in EXPECTED.items():
+        assert rows.column(name) == values, name
+
+
+def test_records_infer_the_same_types():
+    rows = ResultRows.from_records(_records())
+    types = {c.name: c.type for c in rows.schema}
+    # BIGNUMERIC can't be told from NUMERIC by value; everything else matches the Arrow path
+    assert types == {n: ("NUMERIC" if n == "big" else t) for n, (t, _) in EXPECTED.items()}
+    first = rows.row(0)
+    assert first["ts"] == "2017-01-31T10:00:00+00:00"  # converted to UTC
+    assert first["blob"] == "AAE=" and first["day"] == "2017-01-31" and first["days"] == ["2017-01-01"]
+    assert rows.row(1) == {k: None for k in EXPECTED}
+
+
+def test_from_bq_prefers_the_arrow_table():
+    class Iterator(list):
+        def to_arrow(self, create_bqstorage_client):
+            assert create_bqstorage_client is False
+            return _arrow_table()
+
+    assert ResultRows.from_bq(Iterator()).column("day") == EXPECTED["day"][1]
+    assert ResultRows.from_bq([{"x": 1}]).to_dicts() == [{"x": 1}]
+    assert len(ResultRows.from_bq([])) == 0
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+@pytest.mark.parametrize("row_format", ["objects", "columns"])
+def test_encode_decode_round_trip(monkeypatch, use_orjson, row_format):
+    if not use_orjson:
+        monkeypatch.setattr(row_codec, "orjson", None)
+    rows = ResultRows.from_arrow(_arrow_table())
+    notes = {"revenue": decimal.Decimal("2.5"), "day": datetime.date(2017, 1, 1)}
+    text = encode_response({"row_count": 3, "rows": rows, "notes": notes}, row_format)
+
+    wire = json.loads(text)  # valid JSON (no NaN) for any client
+    assert wire["row_format"] == row_format
+    assert wire["columns"] == [c.to_dict() for c in rows.schema]
+    assert wire["notes"] == {"revenue": 2.5, "day": "2017-01-01"}
+    if row_format == "columns":
+        assert wire["rows"] == {c.name: values for c, values in zip(rows.schema, rows.columns)}
+
+    decoded = decode_response(text)
+    assert decoded["row_format"] == "objects"
+    assert decoded["rows"] == rows.to_dicts()
+
+
+def test_responses_without_result_rows_pass_through():
+    text = encode_response({"error": "boom", "rows": [{"a": 1}]})
+    assert decode_response(text) == {"error": "boom", "rows": [{"a": 1}]}
+    assert decode_response(encode_response({"rows": ResultRows([], [])}, "columns"))["rows"] == []
+
+
+def test_unknown_row_format():
+    with pytest.raises(ValueError):
+        encode_response({"rows": ResultRows.from_records([{"a": 1}])}, "csv")
+
+
+def test_column_edits():
+    rows = ResultRows.from_records([{"a": 1, "ids": [1]}, {"a": 2, "ids": [2, 3]}])
+    assert rows.pop_column("ids") == [[1], [2, 3]]
+    assert rows.pop_column("ids") is None
+    rows.set_column("n", "INT64", [1, 2])
+    rows.set_column("a", "STRING", ["x", "y"])  # replaced, moved to the end
+    assert rows.names == ["n", "a"]
+    assert rows.to_dicts() == [{"n": 1, "a": "x"}, {"n": 2, "a": "y"}]
+    with pytest.raises(ValueError):
+        rows.set_column("bad", "INT64", [1])
+    with pytest.raises(ValueError):
+        ResultRows([Column("a", "INT64")], [])
+
+
+def test_unserializable_values_raise():
+    with pytest.raises(TypeError):
+        row_codec.dumps({"x": object()})
@@ -0,0 +1,125 @@
+import random
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ga_ad_agent import segment_join
+from src.ga_ad_agent.segment_join import SegmentColumns, compare_segments
+from src.ga_ad_agent.segment_store import SegmentStore
+
+DIMS = ["device_type", "traffic_source"]
+KPIS = ["total_pageviews", "avg_time_on_site_seconds", "total_conversions"]
+
+
+def _rows(seed: int, n: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        rows.append(
+            {
+                "device_type": rng.choice(["desktop", "mobile", "tablet", None]),
+                "traffic_source": rng.choice(["google", "(direct)", "bing", "yahoo", None]),
+                "total_pageviews": rng.choice([0, rng.randint(1, 500)]),
+                "avg_time_on_site_seconds": rng.choice([None, round(rng.uniform(0, 300), 2)]),
+                "total_conversions": rng.randint(0, 3),
+            }
+        )
+    return rows
+
+
+def _reference(a_rows, b_rows, month_a, month_b):
+    """The dict-based compare_two_months the columnar join replaced (last duplicate wins, NULL sorts first)."""
+    a = {tuple(r[d] for d in DIMS): r for r in a_rows}
+    b = {tuple(r[d] for d in DIMS): r for r in b_rows}
+    out = []
+    for key in sorted(set(a) | set(b), key=lambda t: tuple((v is not None, v or "") for v in t)):
+        av, bv = a.get(key, {}), b.get(key, {})
+        pct = {}
+        for k in KPIS:
+            base = av.get(k) if key in a else 0
+            new = bv.get(k) if key in b else 0
+            ok = base not in (0, None) and new is not None
+            pct[f"{k}_pct_change"] = (new - base) / base * 100.0 if ok else None
+        out.append(
+            {
+                **dict(zip(DIMS, key)),
+                "month_a": month_a,
+                "month_b": month_b,
+                "a": {k: av.get(k) for k in KPIS},
+                "b": {k: bv.get(k) for k in KPIS},
+                "pct_change": pct,
+            }
+        )
+    return out
+
+
+def _assert_rows_equal(got, expected):
+    assert len(got) == len(expected)
+    for g, e in zip(got, expected):
+        assert {k: g[k] for k in (*DIMS, "month_a", "month_b", "a", "b")} == {
+            k: e[k] for k in (*DIMS, "month_a", "month_b", "a", "b")
+        }
+        assert g["pct_change"] == pytest.approx(e["pct_change"], nan_ok=True)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_matches_the_dict_based_join(seed):
+    a_rows, b_rows = _rows(seed, 40), _rows(seed + 100, 40)  # duplicates, NULLs, zero bases, one-sided segments
+    comparison = compare_segments(
+        SegmentColumns.from_rows(a_rows, DIMS, KPIS), SegmentColumns.from_rows(b_rows, DIMS, KPIS), DIMS, KPIS
+    )
+    _assert_rows_equal(comparison.to_rows("2017-01", "2017-02"), _reference(a_rows, b_rows, "2017-01", "2017-02"))
+
+
+def test_row_wise_fallback_when_keys_overflow_int64(monkeypatch):
+    a_rows, b_rows = _rows(7, 40), _rows(8, 40)
+    monkeypatch.setattr(segment_join, "_INT64_MAX", 1)
+    comparison = compare_segments(
+        SegmentColumns.from_rows(a_rows, DIMS, KPIS), SegmentColumns.from_rows(b_rows, DIMS, KPIS), DIMS, KPIS
+    )
+    _assert_rows_equal(comparison.to_rows("a", "b"), _reference(a_rows, b_rows, "a", "b"))
+
+
+def test_output_values():
+    a_rows = [{"device_type": "desktop", "traffic_source": "google", "total_pageviews": 100,
+               "avg_time_on_site_seconds": None, "total_conversions": 0}]
+    b_rows = [{"device_type": "desktop", "traffic_source": "google", "total_pageviews": 150,
+               "avg_time_on_site_seconds": 20.0, "total_conversions": 2},
+              {"device_type": "mobile", "traffic_source": None, "total_pageviews": 5,
+               "avg_time_on_site_seconds": 1.0, "total_conversions": 0}]
+    rows = compare_segments(
+        SegmentColumns.from_rows(a_rows, DIMS, KPIS), SegmentColumns.from_rows(b_rows, DIMS, KPIS), DIMS, KPIS
+    ).to_rows("2017-01", "2017-02")
+
+    assert rows[0]["pct_change"] == {
+        "total_pageviews_pct_change": 50.0,
+        "avg_time_on_site_seconds_pct_change": None,  # NULL base
+        "total_conversions_pct_change": None,  # zero base
+    }
+    assert isinstance(rows[0]["b"]["total_pageviews"], int)
+    assert rows[1]["a"] == {k: None for k in KPIS}  # only in month b
+    assert rows[1]["pct_change"]["total_pageviews_pct_change"] is None
+
+
+def test_inputs_from_a_frame_and_a_stored_table(tmp_path: Path):
+    a_rows, b_rows = _rows(11, 30), _rows(12, 30)
+    expected = _reference(a_rows, b_rows, "a", "b")
+
+    frame_side = SegmentColumns.from_frame(pd.DataFrame(a_rows), DIMS, KPIS)
+    store = SegmentStore(tmp_path)
+    table_side = SegmentColumns.from_table(store.write("b", {"dimensions": DIMS, "rows": b_rows}), DIMS, KPIS)
+    comparison = compare_segments(frame_side, table_side, DIMS, KPIS)
+    _assert_rows_equal(comparison.to_rows("a", "b"), expected)
+
+    frame = comparison.to_frame("a", "b")
+    assert list(frame.columns[:4]) == [*DIMS, "month_a", "month_b"]
+    assert len(frame) == len(expected)
+    np.testing.assert_allclose(
+        frame["total_pageviews_pct_change"].to_numpy(dtype=float),
+        [np.nan if r["pct_change"]["total_pageviews_pct_change"] is None
+         else r["pct_change"]["total_pageviews_pct_change"] for r in expected],
+    )
+
@@ -0,0 +1,111 @@
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.ga_ad_agent.segment_store import SegmentStore, read_directory, replace_directory
+
+DIMENSIONS = ["device_type", "traffic_source"]
+
+
+def _result(pageviews: int) -> dict:
+    rows = [
+        {"device_type": "desktop", "traffic_source": "google", "total_pageviews": pageviews,
+         "avg_time_on_site_seconds": 12.5, "total_conversions": 1, "total_visitors": 3},
+        {"device_type": "mobile", "traffic_source": None, "total_pageviews": 7,
+         "avg_time_on_site_seconds": None, "total_conversions": 0, "total_visitors": 1},
+    ]
+    return {"dimensions": DIMENSIONS, "rows": rows}
+
+
+def test_write_and_open_round_trip(tmp_path: Path):
+    store = SegmentStore(tmp_path)
+    store.write("t", _result(40))
+
+    table = store.open("t")
+    assert table.row_count == 2
+    assert table.to_rows() == _result(40)["rows"]
+    assert np.isnan(table.kpi("avg_time_on_site_seconds")[1])
+
+
+def test_write_replaces_previous_version(tmp_path: Path):
+    store = SegmentStore(tmp_path)
+    store.write("t", _result(40))
+    store.write("t", _result(41))
+
+    assert store.open("t").kpi("total_pageviews")[0] == 41
+    assert [p.name for p in tmp_path.iterdir()] == ["t"]  # no temp or old directories left behind
+
+
+def test_concurrent_writers_and_readers(tmp_path: Path):
+    store = SegmentStore(tmp_path)
+    store.write("t", _result(0))
+    errors = []
+    done = threading.Event()
+
+    def write(i: int):
+        try:
+            for j in range(20):
+                store.write("t", _result(100 * i + j))
+        except Exception as exc:  # collected: pytest doesn't see exceptions raised in threads
+            errors.append(exc)
+
+    def read():
+        try:
+            while not done.is_set():
+                assert store.open("t").row_count == 2
+        except Exception as exc:
+            errors.append(exc)
+
+    writers = [threading.Thread(target=write, args=(i,)) for i in range(6)]
+    reader = threading.Thread(target=read)
+    reader.start()
+    for t in writers:
+        t.start()
+    for t in writers:
+        t.join()
+    done.set()
+    reader.join()
+
+    assert errors == []
+    assert store.open("t").row_count == 2
+    assert [p.name for p in tmp_path.iterdir()] == ["t"]
+
+
+def test_replace_directory_keeps_a_version_published_first(tmp_path: Path):
+    final = tmp_path / "t"
+    ours = tmp_path / ".t.ours"
+    ours.mkdir()
+    (ours / "meta.json").write_text("ours")
+
+    def publish_theirs(src, dst):
+        # another writer publishes between our "move aside" and "rename in"
+        if Path(src) == ours:
+            final.mkdir(exist_ok=True)
+            (final / "meta.json").write_text("theirs")
+        return real_replace(src, dst)
+
+    real_replace = os.replace
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr("src.ga_ad_agent.segment_store.os.replace", publish_theirs)
+        replace_directory(ours, final)
+
+    assert (final / "meta.json").read_text() == "theirs"
+    assert not ours.exists()
+
+
+def test_read_directory_retries_while_missing(tmp_path: Path):
+    calls = []
+
+    def read(path: Path) -> str:
+        calls.append(path)
+        if len(calls) < 3:
+            raise FileNotFoundError(path)
+        return "ok"
+
+    assert read_directory(tmp_path, read) == "ok"
+    assert len(calls) == 3
+    with pytest.raises(FileNotFoundError):
+        read_directory(tmp_path / "missing", lambda p: (p / "meta.json").read_text(), attempts=2)
@@ -0,0 +1,37 @@
+import pytest
+
+from src.constants import DATASET_LAST_DAY
+from src.ga_ad_agent import ga_mcp_server as server
+from src.ga_ad_agent.catalog import months_between
+
+
+def test_day_shards_end_on_the_last_day_of_the_export():
+    ranges = server._shard_ranges("day", months_between())
+    assert ranges[0] == ("20160801", "20160801")
+    assert ranges[-1] == (DATASET_LAST_DAY.replace("-", ""),) * 2
+    assert len(ranges) == 366
+    assert all(start == end for start, end in ranges)
+
+
+def test_month_shards_are_clamped_too():
+    ranges = server._shard_ranges("month", ["2017-07", "2017-08"])
+    assert ranges == [("20170701", "20170731"), ("20170801", "20170801")]
+
+
+def test_unknown_shard_by():
+    with pytest.raises(ValueError):
+        server._shard_ranges("week", ["2017-01"])
+
+
+@pytest.mark.parametrize(
+    "options", [{"limit": 0}, {"limit": 10, "offset": -1}, {"min_pageviews": -1}, {"order_by": "sessions"}]
+)
+def test_sharded_get_all_data_validates_before_running_jobs(monkeypatch, options):
+    def no_jobs(*args, **kwargs):
+        raise AssertionError("a BigQuery job was started")
+
+    monkeypatch.setattr(server, "_run_shards", no_jobs)
+    monkeypatch.setattr(server, "_run_bq_job", no_jobs)
+    monkeypatch.setattr(server, "_session_source", lambda project_id: None)
+    with pytest.raises(ValueError):
+        server.get_all_data(["device_type"], shard_by="day", **options)
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from src.constants import DATASET_LAST_DAY
+from src.ga_ad_agent import ga_mcp_server as server
+from src.ga_ad_agent.trend import (
+    SegmentTrends,
+    linear_slope,
+    mom_pct_change,
+    period_range,
+    rank_trends,
+    rolling_mean,
+)
+
+NAN = np.nan
+
+
+@pytest.mark.parametrize(
+    "start, end, last_day, first, last, count",
+    [
+        ("2017-03", "2017-05", None, "2017-03-01", "2017-05-31", 92),
+        ("2017-01", "2017-02", None, "2017-01-01", "2017-02-28", 59),
+        ("2016-02", "2016-02", None, "2016-02-01", "2016-02-29", 29),
+        ("2016-08", "2017-08", DATASET_LAST_DAY, "2016-08-01", "2017-08-01", 366),
+        ("2017-03", "2017-05", DATASET_LAST_DAY, "2017-03-01", "2017-05-31", 92),  # cap beyond the range
+    ],
+)
+def test_daily_axis_runs_to_the_end_of_the_end_month(start, end, last_day, first, last, count):
+    days = period_range("day", start, end, last_day=last_day)
+    assert (days[0], days[-1], len(days)) == (first, last, count)
+    assert len(set(days)) == count
+
+
+@pytest.mark.parametrize("start, end", [("2016-08", "2017-08"), ("2017-03", "2017-05"), ("2016-12", "2017-01")])
+def test_daily_axis_matches_the_server_day_shards(start, end):
+    months = [m for m in server.months_between() if start <= m <= end]
+    shard_days = [f"{s[:4]}-{s[4:6]}-{s[6:]}" for s, _ in server._shard_ranges("day", months)]
+    assert period_range("day", start, end, last_day=DATASET_LAST_DAY) == shard_days
+
+
+def test_monthly_axis():
+    assert period_range("month", "2016-11", "2017-02") == ["2016-11", "2016-12", "2017-01", "2017-02"]
+    with pytest.raises(ValueError):
+        period_range("week", "2017-01", "2017-02")
+
+
+def test_mom_pct_change_skips_zero_and_null_bases():
+    values = np.array([[100.0, 150.0, 0.0, 10.0, NAN, 5.0]])
+    np.testing.assert_allclose(mom_pct_change(values), [[NAN, 50.0, -100.0, NAN, NAN, NAN]])
+
+
+def test_rolling_mean_is_trailing_and_nan_aware():
+    values = np.array([[1.0, 2.0, 3.0, NAN, 5.0], [NAN, NAN, 1.0, 1.0, 1.0]])
+    np.testing.assert_allclose(rolling_mean(values, 2), [[1.0, 1.5, 2.5, 3.0, 5.0], [NAN, NAN, 1.0, 1.0, 1.0]])
+    np.testing.assert_allclose(rolling_mean(values, 1), values)
+    with pytest.raises(ValueError):
+        rolling_mean(values, 0)
+
+
+def test_linear_slope():
+    values = np.array([[1.0, 3.0, 5.0, 7.0], [2.0, NAN, 2.0, NAN], [NAN, 4.0, NAN, NAN], [10.0, NAN, 4.0, NAN]])
+    np.testing.assert_allclose(linear_slope(values), [2.0, 0.0, NAN, -3.0])
+
+
+ROWS = [
+    {"device_type": "desktop", "period": "2017-01", "total_pageviews": 10, "avg_time_on_site_seconds": 30.0},
+    {"device_type": "desktop", "period": "2017-03", "total_pageviews": 30, "avg_time_on_site_seconds": None},
+    {"device_type": "mobile", "period": "2017-02", "total_pageviews": 5, "avg_time_on_site_seconds": 12.0},
+    {"device_type": None, "period": "2017-01", "total_pageviews": 8, "avg_time_on_site_seconds": 1.0},
+    {"device_type": None, "period": "2017-03", "total_pageviews": 2, "avg_time_on_site_seconds": 1.0},
+    {"device_type": "mobile", "period": "2016-12", "total_pageviews": 99, "avg_time_on_site_seconds": 1.0},
+]
+KPIS = ["total_pageviews", "avg_time_on_site_seconds"]
+PERIODS = ["2017-01", "2017-02", "2017-03"]
+
+
+def test_segment_trends_matrix_fills_missing_periods():
+    trends = SegmentTrends.from_rows(ROWS, ["device_type"], KPIS, PERIODS)
+    assert trends.segments["device_type"].tolist()[:2] == ["desktop", "mobile"]
+    assert trends.segments["device_type"].isna().tolist() == [False, False, True]  # NULL is its own segment
+    # counts: a missing period is 0; the 2016-12 row is outside the range and dropped
+    np.testing.assert_array_equal(trends.matrix("total_pageviews"), [[10, 0, 30], [0, 5, 0], [8, 0, 2]])
+    # averages: a missing period (or NULL) stays unknown
+    np.testing.assert_array_equal(
+        trends.matrix("avg_time_on_site_seconds"), [[30.0, NAN, NAN], [NAN, 12.0, NAN], [1.0, NAN, 1.0]]
+    )
+    np.testing.assert_array_equal(trends.matrix("total_pageviews", np.array([2, 0])), [[8, 0, 2], [10, 0, 30]])
+    np.testing.assert_array_equal(trends.matrix_slice("total_pageviews", 1, 5), [[0, 5, 0], [8, 0, 2]])
+
+
+def test_rank_trends_orders_by_growth():
+    trends = SegmentTrends.from_rows(ROWS, ["device_type"], KPIS, PERIODS)
+    ranked = rank_trends(trends, KPIS, "total_pageviews", window=1, top_n=None)
+
+    assert [r["device_type"] for r in ranked] == ["desktop", "mobile", None]  # +10, 0 and -3 per period
+    desktop = ranked[0]
+    assert desktop["rank"] == 1
+    assert desktop["growth"]["slope_per_period"] == pytest.approx(10.0)
+    assert desktop["growth"]["pct_per_period"] == pytest.approx(10.0 / (40 / 3) * 100)
+    assert desktop["growth"]["first_to_last_pct_change"] == pytest.approx(200.0)
+    assert desktop["series"] == {"total_pageviews": [10, 0, 30], "avg_time_on_site_seconds": [30.0, None, None]}
+    assert desktop["mom_pct_change"]["total_pageviews"] == [None, -100.0, None]
+    assert isinstance(desktop["series"]["total_pageviews"][0], int)
+
+    declining = rank_trends(trends, KPIS, "total_pageviews", window=1, top_n=1, ascending=True)
+    assert [r["device_type"] for r in declining] == [None]
@@ -0,0 +1,143 @@
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ga_ad_agent.visitor_bitmaps import (
+    ARRAY_MAX_CARDINALITY,
+    ENCODING,
+    MAX_ID,
+    RoaringBitmap,
+    VisitorSets,
+    VisitorSetStore,
+)
+
+
+def _ids(seed: int = 1) -> np.ndarray:
+    """Sparse chunks (array containers), one dense chunk (bitmap container) and the id range edges."""
+    rng = np.random.default_rng(seed)
+    sparse = rng.choice(2 ** 20, 3000, replace=False)
+    dense = (5 << 16) + rng.choice(2 ** 16, ARRAY_MAX_CARDINALITY + 500, replace=False)
+    return np.unique(np.concatenate([sparse, dense, [0, 0xFFFF, 0x10000, MAX_ID]]))
+
+
+def test_from_ids_uses_both_container_kinds():
+    bm = RoaringBitmap.from_ids(_ids())
+    kinds = {c.dtype for c in bm.containers}
+    assert kinds == {np.dtype(np.uint16), np.dtype(np.uint64)}
+    np.testing.assert_array_equal(bm.to_ids(), _ids())
+    assert len(bm) == len(_ids())
+
+
+@pytest.mark.parametrize("ids", [[], [7], list(range(ARRAY_MAX_CARDINALITY + 1)), _ids()])
+def test_bytes_and_base64_round_trip(ids):
+    bm = RoaringBitmap.from_ids(ids)
+    assert RoaringBitmap.from_bytes(bm.to_bytes()) == bm
+    assert RoaringBitmap.from_base64(bm.to_base64()) == bm
+    assert len(RoaringBitmap.from_bytes(bm.to_bytes())) == len(set(ids))
+
+
+def test_serialized_layout():
+    data = RoaringBitmap.from_ids([1, 2, 65536 + 3]).to_bytes()
+    assert data[:4] == b"RBM1"
+    assert int.from_bytes(data[4:8], "little") == 2  # containers
+    assert np.frombuffer(data[8:12], "<u2").tolist() == [0, 1]  # keys
+    assert np.frombuffer(data[12:20], "<u4").tolist() == [2, 1]  # cardinalities
+    assert np.frombuffer(data[20:], "<u2").tolist() == [1, 2, 3]
+    assert len(data) == 4 + 4 + 2 * 2 + 4 * 2 + 2 * 3
+
+
+def test_from_bytes_is_zero_copy_from_a_buffer():
+    blob = np.frombuffer(RoaringBitmap.from_ids(_ids()).to_bytes(), dtype=np.uint8)
+    bm = RoaringBitmap.from_bytes(blob)
+    assert all(np.shares_memory(c, blob) for c in bm.containers)
+
+
+def test_from_bytes_rejects_other_data():
+    with pytest.raises(ValueError):
+        RoaringBitmap.from_bytes(b"JSON{}")
+
+
+def test_from_ids_rejects_out_of_range_ids():
+    with pytest.raises(ValueError):
+        RoaringBitmap.from_ids([-1])
+    with pytest.raises(ValueError):
+        RoaringBitmap.from_ids([MAX_ID + 1])
+
+
+def test_union_matches_set_union():
+    parts = [_ids(seed) for seed in (1, 2, 3)]
+    union = RoaringBitmap.union_all([RoaringBitmap.from_ids(p) for p in parts])
+    np.testing.assert_array_equal(union.to_ids(), np.unique(np.concatenate(parts)))
+    # arrays merged above the cardinality limit become a bitmap container, and back again below it
+    a = RoaringBitmap.from_ids(range(0, 2 * ARRAY_MAX_CARDINALITY, 2))
+    b = RoaringBitmap.from_ids(range(1, 2 * ARRAY_MAX_CARDINALITY, 2))
+    assert (a | b).containers[0].dtype == np.uint64
+    assert len(a | b) == 2 * ARRAY_MAX_CARDINALITY
+
+
+def _sets() -> VisitorSets:
+    segments = pd.DataFrame(
+        {"device_type": ["desktop", "desktop", "mobile", None], "medium": ["cpc", "organic", "cpc", "cpc"]},
+        dtype=object,
+    )
+    bitmaps = [RoaringBitmap.from_ids(ids) for ids in ([1, 2, 3], [3, 4], [4, 5], [6])]
+    return VisitorSets(["device_type", "medium"], segments, bitmaps)
+
+
+def test_rollup_counts_each_visitor_once():
+    rows = _sets().rollup(["device_type"]).to_rows()
+    assert rows == [
+        {"device_type": "desktop", "total_visitors": 4},
+        {"device_type": "mobile", "total_visitors": 2},
+        {"device_type": None, "total_visitors": 1},
+    ]
+    assert len(_sets().total()) == 6
+
+
+def test_union_of_months_merges_segments():
+    merged = VisitorSets.union([_sets(), _sets()])
+    assert merged.to_rows() == _sets().to_rows()
+
+
+def test_from_response():
+    rows = [{"device_type": "desktop", "visitors": RoaringBitmap.from_ids([1, 9]).to_base64()}]
+    sets = VisitorSets.from_response({"encoding": ENCODING, "dimensions": ["device_type"], "rows": rows})
+    assert sets.to_rows() == [{"device_type": "desktop", "total_visitors": 2}]
+    with pytest.raises(ValueError):
+        VisitorSets.from_response({"encoding": "json", "dimensions": [], "rows": []})
+
+
+def test_store_round_trip_and_find(tmp_path: Path):
+    store = VisitorSetStore(tmp_path)
+    name = VisitorSetStore.name(["device_type", "medium"], "2017-01")
+    store.write(name, _sets())
+
+    assert store.open(name).to_rows() == _sets().to_rows()
+    assert store.find(["medium"], "2017-01") == name
+    assert store.find(["medium"], "2017-02") is None
+
+
+def test_store_concurrent_writers(tmp_path: Path):
+    store = VisitorSetStore(tmp_path)
+    name = VisitorSetStore.name(["device_type", "medium"], "2017-01")
+    errors = []
+
+    def write():
+        try:
+            for _ in range(20):
+                store.write(name, _sets())
+                assert len(store.open(name)) == 4
+        except Exception as exc:  # collected: pytest doesn't see exceptions raised in threads
+            errors.append(exc)
+
+    threads = [threading.Thread(target=write) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert [p.name for p in tmp_path.iterdir()] == [name]